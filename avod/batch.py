@@ -0,0 +1,519 @@
+import argparse
+import csv
+import importlib
+import json
+import queue
+import sys
+import threading
+from collections import namedtuple
+from contextlib import closing, contextmanager
+from os import path
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlparse, urlunparse
+
+from config_check import check_config, describe_problems
+from journal import JobJournal, job_fingerprint
+from splice_detection import SpliceDetector, create_splice_detector
+
+Job = namedtuple("Job", "id source_path video audio subtitles splice_points")
+
+PHASES = ["detect", "configure", "wait_for_slot", "encode", "provision"]
+
+
+def main():
+    args = parse_arguments()
+
+    cfg = importlib.import_module(args.config)
+
+    problems = [] if args.offline else check_config(cfg)
+    if problems:
+        print(describe_problems(problems))
+        sys.exit(1)
+
+    if args.offline:
+        from offline import OfflineBitmovinController, OfflineBroadpeakIOController
+
+        broadpeakio = OfflineBroadpeakIOController(
+            config=cfg, api_latency=args.offline_api_latency
+        )
+        bitmovin = OfflineBitmovinController(
+            config=cfg,
+            api_latency=args.offline_api_latency,
+            encoding_duration=args.offline_encoding_duration,
+        )
+    else:
+        from bitmovin import BitmovinController
+        from broadpeak import BroadpeakIOController
+
+        broadpeakio = BroadpeakIOController(config=cfg)
+        bitmovin = BitmovinController(config=cfg)
+
+    if args.synthetic:
+        jobs = list(generate_synthetic_jobs(cfg, count=args.synthetic))
+    elif args.jobs:
+        jobs = list(read_jobs(cfg, args.jobs))
+    else:
+        raise Exception("Provide a job list with --jobs, or use --synthetic")
+
+    # Jobs without splice points get them from an analysis of their source
+    splice_detector = None
+    if getattr(cfg, "DETECT_SPLICE_POINTS", False) and not args.offline:
+        splice_detector = create_splice_detector(cfg)
+
+    scheduler = BatchScheduler(
+        bitmovin=bitmovin,
+        broadpeakio=broadpeakio,
+        config=cfg,
+        max_concurrent_encodings=args.max_concurrent_encodings
+        or getattr(cfg, "MAX_CONCURRENT_ENCODINGS", 10),
+        max_configured_ahead=args.max_configured_ahead,
+        journal_path=None if args.offline else getattr(cfg, "JOURNAL_PATH", None),
+        splice_detector=splice_detector,
+    )
+
+    print(f"Processing {len(jobs)} assets")
+    try:
+        scheduler.run(
+            jobs=jobs, results_path=args.output, report_interval=args.report_interval
+        )
+    finally:
+        if splice_detector:
+            splice_detector.close()
+
+    print(scheduler.metrics.report(queue_depth=0))
+    if args.offline:
+        print(f"Peak concurrent encodings: {bitmovin.peak_running_encodings}")
+
+
+class BatchMetrics:
+    def __init__(self) -> None:
+        self.started_at = perf_counter()
+        self.completed = 0
+        self.failed = 0
+        self.in_progress = {phase: 0 for phase in PHASES}
+        self.durations: Dict[str, List[float]] = {phase: [] for phase in PHASES}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start = perf_counter()
+        with self._lock:
+            self.in_progress[name] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_progress[name] -= 1
+                self.durations[name].append(perf_counter() - start)
+
+    def record_result(self, success: bool) -> None:
+        with self._lock:
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def throughput(self) -> float:
+        """Completed assets per hour"""
+        elapsed = perf_counter() - self.started_at
+        return self.completed / elapsed * 3600 if elapsed > 0 else 0.0
+
+    def report(self, queue_depth: int) -> str:
+        with self._lock:
+            lines = [
+                "{0} done, {1} failed, {2} queued, {3} - {4:.1f} assets/hour".format(
+                    self.completed,
+                    self.failed,
+                    queue_depth,
+                    ", ".join(f"{p} {n}" for p, n in self.in_progress.items()),
+                    self.throughput(),
+                )
+            ]
+            for phase, durations in self.durations.items():
+                if durations:
+                    lines.append(
+                        "  {0}: p50 {1:.2f}s, p95 {2:.2f}s, max {3:.2f}s".format(
+                            phase,
+                            _percentile(durations, 50),
+                            _percentile(durations, 95),
+                            max(durations),
+                        )
+                    )
+
+        return "\n".join(lines)
+
+
+class BatchScheduler:
+    """Encodes and packages many assets at once.
+
+    Encodings are configured ahead of time, but only started when one of the
+    `max_concurrent_encodings` slots is free, so that the account's limit of
+    concurrent encodings is never exceeded. At most `max_configured_ahead`
+    encodings are configured and waiting for a slot at any time.
+    Finished assets are then added to a single broadpeak.io AVOD service.
+    With a journal, jobs that completed in a previous run are skipped, and
+    encodings that were still running are waited for instead of re-encoded.
+    """
+
+    def __init__(
+        self,
+        bitmovin,
+        broadpeakio,
+        config,
+        max_concurrent_encodings: int,
+        max_configured_ahead: int = 2,
+        journal_path: Optional[str] = None,
+        splice_detector: Optional[SpliceDetector] = None,
+    ) -> None:
+        self.bitmovin = bitmovin
+        self.broadpeakio = broadpeakio
+        self.config = config
+        self.max_concurrent_encodings = max_concurrent_encodings
+        self.max_configured_ahead = max_configured_ahead
+        self.journal_path = journal_path
+        self.splice_detector = splice_detector
+
+        self.metrics = BatchMetrics()
+        self.encoding_slots = threading.BoundedSemaphore(max_concurrent_encodings)
+
+        self._service = None
+        self._service_lock = threading.Lock()
+        self._results_lock = threading.Lock()
+
+    def run(
+        self,
+        jobs: List[Job],
+        results_path: Optional[str] = None,
+        report_interval: float = 60,
+    ) -> None:
+        pending = queue.Queue()
+        for job in jobs:
+            pending.put(job)
+
+        results_file = open(results_path, "a") if results_path else None
+        finished = threading.Event()
+
+        def report_periodically():
+            while not finished.wait(report_interval):
+                print(self.metrics.report(queue_depth=pending.qsize()))
+
+        def work():
+            while True:
+                try:
+                    job = pending.get_nowait()
+                except queue.Empty:
+                    return
+                self._write_result(self.process(job), results_file)
+
+        workers = [
+            threading.Thread(target=work)
+            for _ in range(self.max_concurrent_encodings + self.max_configured_ahead)
+        ]
+        reporter = threading.Thread(target=report_periodically, daemon=True)
+
+        try:
+            reporter.start()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            finished.set()
+            if results_file:
+                results_file.close()
+
+    def process(self, job: Job) -> Dict:
+        """Encode and provision the asset of a job, and return its result.
+
+        Jobs can be processed from any number of threads at once, as encodings
+        still wait for a free slot.
+        """
+        if self.journal_path:
+            journal = JobJournal(
+                self.journal_path,
+                job_id=job.id,
+                fingerprint=job_fingerprint(self.config, **job._asdict()),
+            )
+            with closing(journal):
+                return self._process_job(job, journal)
+        else:
+            return self._process_job(job, None)
+
+    def _process_job(self, job: Job, journal: Optional[JobJournal]) -> Dict:
+        result = {"id": job.id, "video": job.video}
+
+        if journal and journal.is_completed("provision"):
+            print(f"Asset {job.id} was completed by a previous run, skipping")
+            result.update(journal.phase_data("provision"), status="done")
+            self.metrics.record_result(success=True)
+            return result
+
+        try:
+            if not job.splice_points and self.splice_detector:
+                with self.metrics.phase("detect"):
+                    job = job._replace(
+                        splice_points=self._detect_splice_points(job, journal)
+                    )
+                result["splice_points"] = job.splice_points
+
+            manifest_urls = self._encode(job, journal, result)
+
+            with self.metrics.phase("provision"):
+                service = self._get_or_create_service(origin_urls=manifest_urls)
+                result["manifest_urls"] = manifest_urls
+                result["streaming_urls"] = self.broadpeakio.calculate_streaming_urls(
+                    service_id=service["id"],
+                    origin_manifest_urls=manifest_urls,
+                    splice_points=job.splice_points,
+                )
+
+            if journal:
+                journal.complete_phase(
+                    "provision",
+                    manifest_urls=manifest_urls,
+                    streaming_urls=result["streaming_urls"],
+                )
+
+            result["status"] = "done"
+            self.metrics.record_result(success=True)
+
+        except Exception as e:
+            print(f"Asset {job.id} failed: {e}")
+            result["status"] = "failed"
+            result["error"] = str(e)
+            self.metrics.record_result(success=False)
+
+        return result
+
+    def _detect_splice_points(
+        self, job: Job, journal: Optional[JobJournal]
+    ) -> List[float]:
+        if journal and journal.is_completed("detect_splice_points"):
+            return journal.phase_data("detect_splice_points")["splice_points"]
+
+        source_url = urlparse(self.config.SOURCE_FILE_PATH)
+        splice_points = self.splice_detector.detect(
+            urlunparse(source_url._replace(path=path.join(job.source_path, job.video)))
+        )
+
+        if journal:
+            journal.complete_phase("detect_splice_points", splice_points=splice_points)
+        return splice_points
+
+    def _encode(
+        self, job: Job, journal: Optional[JobJournal], result: Dict
+    ) -> List[str]:
+        """Encode the asset of a job, and return its manifest URLs"""
+        if journal and journal.phase_status("encode"):
+            result["encoding_id"] = journal.phase_data("encode")["encoding_id"]
+
+        if journal and journal.is_completed("encode"):
+            return self.bitmovin.resume_encoding(journal)
+
+        if journal and journal.phase_status("encode"):
+            # The encoding of a previous run may still be running, and if so
+            # it holds one of the slots
+            with self.metrics.phase("wait_for_slot"):
+                self.encoding_slots.acquire()
+            try:
+                with self.metrics.phase("encode"):
+                    manifest_urls = self.bitmovin.resume_encoding(journal)
+            finally:
+                self.encoding_slots.release()
+
+            if manifest_urls is not None:
+                return manifest_urls
+
+        asset_name = path.splitext(path.basename(job.video))[0]
+        with self.metrics.phase("configure"):
+            (
+                encoding,
+                start_encoding_request,
+                manifests,
+            ) = self.bitmovin.configure_encoding(
+                name=f"{asset_name} - {job.id}",
+                source_path=job.source_path,
+                source_video_file=job.video,
+                source_audio_files=job.audio,
+                source_subtitle_files=job.subtitles,
+                output_sub_path=f"{asset_name}/{job.id}",
+                splice_points=job.splice_points,
+            )
+        result["encoding_id"] = encoding.id
+        if journal:
+            self.bitmovin.record_encoding(
+                journal=journal, encoding=encoding, manifests=manifests
+            )
+
+        with self.metrics.phase("wait_for_slot"):
+            self.encoding_slots.acquire()
+        try:
+            with self.metrics.phase("encode"):
+                self.bitmovin.execute_encoding(
+                    encoding=encoding,
+                    start_encoding_request=start_encoding_request,
+                )
+        finally:
+            self.encoding_slots.release()
+
+        if journal:
+            journal.complete_phase("encode")
+
+        return [self.bitmovin.determine_origin_url(manifest) for manifest in manifests]
+
+    def _write_result(self, result: Dict, results_file) -> None:
+        if results_file:
+            with self._results_lock:
+                results_file.write(json.dumps(result) + "\n")
+                results_file.flush()
+
+    def _get_or_create_service(self, origin_urls: List[str]) -> Dict:
+        # All assets share the same asset catalog, and therefore the same service
+        with self._service_lock:
+            if self._service is None:
+                uid = getattr(self.config, "JOB_ID", "batch")
+                journal = None
+                if self.journal_path:
+                    # Not under the JOB_ID itself, which main.py uses
+                    journal = JobJournal(
+                        self.journal_path,
+                        job_id=f"{uid}-service",
+                        fingerprint=job_fingerprint(self.config),
+                    )
+
+                try:
+                    (_, _, self._service) = self.broadpeakio.create_resources(
+                        origin_urls=origin_urls,
+                        service_name=f"AVOD w/ Bitmovin encoding and Ad Proxy - {uid}",
+                        journal=journal,
+                    )
+                finally:
+                    if journal:
+                        journal.close()
+
+        return self._service
+
+
+def read_jobs(cfg, jobs_path: str) -> Iterator[Job]:
+    """Read a job list, in JSONL or CSV format.
+
+    JSONL lines have the fields `video`, `audio` and `subtitles` (dicts of
+    language to file), `splice_points` (list of seconds) and optionally `id`
+    and `source_path`. CSV files have the same columns, with the language maps
+    written as `en=file.mp4;it=file-it.mp3` and splice points as `69.9;257.9`.
+    """
+    with open(jobs_path, newline="") as f:
+        if jobs_path.endswith(".csv"):
+            rows = (
+                dict(
+                    row,
+                    audio=_parse_language_map(row.get("audio")),
+                    subtitles=_parse_language_map(row.get("subtitles")),
+                    splice_points=[
+                        float(p)
+                        for p in (row.get("splice_points") or "").split(";")
+                        if p
+                    ],
+                )
+                for row in csv.DictReader(f)
+            )
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for i, row in enumerate(rows):
+            yield job_from_row(
+                cfg, row, default_id=f"{getattr(cfg, 'JOB_ID', 'batch')}-{i}"
+            )
+
+
+def job_from_row(cfg, row: Dict, default_id: str) -> Job:
+    """A job from the fields of a line of a JSONL job list"""
+    return Job(
+        id=row.get("id") or default_id,
+        source_path=row.get("source_path") or urlparse(cfg.SOURCE_FILE_PATH).path,
+        video=row["video"],
+        audio=row.get("audio") or {},
+        subtitles=row.get("subtitles") or {},
+        splice_points=[float(p) for p in row.get("splice_points") or []],
+    )
+
+
+def generate_synthetic_jobs(cfg, count: int) -> Iterator[Job]:
+    for i in range(count):
+        yield Job(
+            id=f"synthetic-{i:05d}",
+            source_path=urlparse(cfg.SOURCE_FILE_PATH).path,
+            video=cfg.SOURCE_FILE_PATH_VIDEO,
+            audio=cfg.SOURCE_FILE_PATHS_AUDIO,
+            subtitles=cfg.SOURCE_FILE_PATHS_SUBTITLES,
+            splice_points=getattr(cfg, "SPLICE_POINTS", []),
+        )
+
+
+def _parse_language_map(value: Optional[str]) -> Dict[str, str]:
+    if not value:
+        return {}
+
+    return dict(item.split("=", 1) for item in value.split(";") if item)
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--config", help="path to config file", default="config")
+    parser.add_argument("-j", "--jobs", help="path to a JSONL or CSV job list")
+    parser.add_argument(
+        "-o", "--output", help="path to a JSONL file to append the results to"
+    )
+    parser.add_argument(
+        "--max-concurrent-encodings",
+        type=int,
+        help="number of encodings to run at once "
+        "(defaults to MAX_CONCURRENT_ENCODINGS in the config file)",
+    )
+    parser.add_argument(
+        "--max-configured-ahead",
+        type=int,
+        default=2,
+        help="number of encodings to configure ahead of a free encoding slot",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=60,
+        help="interval in seconds between progress reports",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="simulate the Bitmovin and broadpeak.io APIs instead of calling them",
+    )
+    parser.add_argument(
+        "--offline-api-latency",
+        type=float,
+        default=0.1,
+        help="simulated latency of an API call, in seconds",
+    )
+    parser.add_argument(
+        "--offline-encoding-duration",
+        type=float,
+        default=5.0,
+        help="simulated duration of an encoding, in seconds",
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        help="process this number of synthetic jobs made from the config file",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,24 @@
+import hashlib
 import os
+import threading
 from os import path
-from time import sleep
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import bitmovin_api_sdk as bm
+import codec_configs
+from config_cache import ConfigurationCache
+from executor import ResourceGraph
+from journal import STARTED, JobJournal
+from status_watcher import EncodingStatusWatcher
+from template import EncodingTemplateCompiler
+from webhooks import WebhookListener
 
 
 class BitmovinController:
-    def __init__(self, config) -> None:
+    def __init__(self, config, journal: Optional[JobJournal] = None) -> None:
         self.config = config
+        self.journal = journal
         self.bitmovin_api = bm.BitmovinApi(
             api_key=self.config.BITMOVIN_API_KEY,
             tenant_org_id=getattr(self.config, "BITMOVIN_TENANT_ORG_ID", ""),
@@ -20,23 +29,80 @@ class BitmovinController:
         self.dash_api = self.bitmovin_api.encoding.manifests.dash
         self.hls_api = self.bitmovin_api.encoding.manifests.hls
 
-        if hasattr(self.config, "HTTPS_INPUT_ID"):
-            self.input = self._get_https_input(input_id=self.config.HTTPS_INPUT_ID)
+        self.webhook_listener = None
+        if hasattr(self.config, "WEBHOOK_PUBLIC_URL"):
+            # Notifications tell when encodings finish, polling is only a fallback
+            # in case one of them gets lost
+            fallback_interval = getattr(
+                self.config, "WEBHOOK_FALLBACK_POLL_INTERVAL", 60
+            )
+            self.status_watcher = EncodingStatusWatcher(
+                encoding_api=self.encoding_api,
+                min_interval=fallback_interval,
+                max_interval=fallback_interval,
+            )
+            self.webhook_listener = WebhookListener(
+                status_watcher=self.status_watcher,
+                public_url=self.config.WEBHOOK_PUBLIC_URL,
+                port=getattr(self.config, "WEBHOOK_LISTEN_PORT", 8080),
+            )
+            self.webhook_listener.start()
         else:
-            self.input = self._create_https_input(
-                source_path=self.config.SOURCE_FILE_PATH
+            self.status_watcher = EncodingStatusWatcher(encoding_api=self.encoding_api)
+
+        self.configuration_cache = None
+        if hasattr(self.config, "CONFIGURATION_CACHE_PATH"):
+            self.configuration_cache = ConfigurationCache(
+                db_path=self.config.CONFIGURATION_CACHE_PATH,
+                namespace=self._account_namespace(),
             )
-            print(f"Created HTTPS input with id {self.input.id}")
 
+        # The input and output are only looked up (or created) when first used
+        self._input = None
+        self._output = None
+        self._resources_lock = threading.Lock()
+
+    @property
+    def input(self) -> bm.HttpsInput:
+        with self._resources_lock:
+            if self._input is None:
+                self._input = self._get_or_create_https_input()
+
+        return self._input
+
+    @property
+    def output(self) -> bm.S3Output:
+        with self._resources_lock:
+            if self._output is None:
+                self._output = self._get_or_create_s3_output()
+
+        return self._output
+
+    def _get_or_create_https_input(self) -> bm.HttpsInput:
+        if hasattr(self.config, "HTTPS_INPUT_ID"):
+            return self._get_https_input(input_id=self.config.HTTPS_INPUT_ID)
+        if self._recorded_id("https_input"):
+            return self._get_https_input(input_id=self._recorded_id("https_input"))
+
+        https_input = self._create_https_input(source_path=self.config.SOURCE_FILE_PATH)
+        self._record_resource("https_input", https_input.id)
+        print(f"Using HTTPS input with id {https_input.id}")
+        return https_input
+
+    def _get_or_create_s3_output(self) -> bm.S3Output:
         if hasattr(self.config, "S3_OUTPUT_ID"):
-            self.output = self._get_s3_output(output_id=self.config.S3_OUTPUT_ID)
-        else:
-            self.output = self._create_s3_output(
-                bucket_name=getattr(self.config, "S3_OUTPUT_BUCKET_NAME"),
-                access_key=getattr(self.config, "S3_OUTPUT_ACCESS_KEY"),
-                secret_key=getattr(self.config, "S3_OUTPUT_SECRET_KEY"),
-            )
-            print(f"Created S3 output with id {self.output.id}")
+            return self._get_s3_output(output_id=self.config.S3_OUTPUT_ID)
+        if self._recorded_id("s3_output"):
+            return self._get_s3_output(output_id=self._recorded_id("s3_output"))
+
+        s3_output = self._create_s3_output(
+            bucket_name=getattr(self.config, "S3_OUTPUT_BUCKET_NAME"),
+            access_key=getattr(self.config, "S3_OUTPUT_ACCESS_KEY"),
+            secret_key=getattr(self.config, "S3_OUTPUT_SECRET_KEY"),
+        )
+        self._record_resource("s3_output", s3_output.id)
+        print(f"Using S3 output with id {s3_output.id}")
+        return s3_output
 
     def encode_and_package(
         self,
@@ -46,179 +112,400 @@ class BitmovinController:
         source_audio_files: Dict[str, str],
         source_subtitle_files: Dict[str, str],
         output_sub_path: str,
+        splice_points: Optional[List[float]] = None,
     ) -> Tuple[bm.Encoding, List[bm.HlsManifest | bm.DashManifest]]:
-        self.encoding = self._create_encoding(name=name, description="")
+        if getattr(self.config, "USE_ENCODING_TEMPLATE", False):
+            (encoding, manifests) = self._encode_and_package_with_template(
+                name=name,
+                source_path=source_path,
+                source_video_file=source_video_file,
+                source_audio_files=source_audio_files,
+                source_subtitle_files=source_subtitle_files,
+                output_sub_path=output_sub_path,
+                splice_points=splice_points,
+            )
+        else:
+            (encoding, start_encoding_request, manifests) = self.configure_encoding(
+                name=name,
+                source_path=source_path,
+                source_video_file=source_video_file,
+                source_audio_files=source_audio_files,
+                source_subtitle_files=source_subtitle_files,
+                output_sub_path=output_sub_path,
+                splice_points=splice_points,
+            )
+            if self.journal:
+                self.record_encoding(
+                    journal=self.journal, encoding=encoding, manifests=manifests
+                )
+
+            self.execute_encoding(
+                encoding=encoding, start_encoding_request=start_encoding_request
+            )
+
+        if self.journal:
+            self.journal.complete_phase("encode")
+
+        return (encoding, manifests)
+
+    def resume_encoding(self, journal: JobJournal) -> Optional[List[str]]:
+        """Manifest URLs of the job's encoding recorded in the journal.
+
+        An encoding that is still queued or running is reattached to and waited
+        for. None is returned if there is no encoding to resume, ie. if the job
+        needs a new one.
+        """
+        data = journal.phase_data("encode")
+        if journal.is_completed("encode"):
+            print(f"Encoding {data['encoding_id']} already finished")
+            return data["manifest_urls"]
+
+        if journal.phase_status("encode") != STARTED:
+            return None
+
+        # Encodings recorded before being started never got past CREATED,
+        # and may not have been fully configured: they are not reused
+        encoding = bm.Encoding(name=journal.job_id)
+        encoding.id = data["encoding_id"]
+        task = self.encoding_api.encodings.status(encoding_id=encoding.id)
+        if task.status in [bm.Status.QUEUED, bm.Status.RUNNING]:
+            print(f"Reattaching to encoding {encoding.id} ({task.status.value})")
+            self._wait_until_encoding_is_finished(encoding=encoding)
+        elif task.status is not bm.Status.FINISHED:
+            print(
+                f"Encoding {encoding.id} is {task.status.value}, "
+                "it will be replaced by a new one"
+            )
+            return None
+
+        journal.complete_phase("encode")
+        return data["manifest_urls"]
+
+    def record_encoding(
+        self,
+        journal: JobJournal,
+        encoding: bm.Encoding,
+        manifests: List[bm.HlsManifest | bm.DashManifest],
+    ) -> None:
+        journal.record_resource("encoding", encoding.id)
+        journal.start_phase(
+            "encode",
+            encoding_id=encoding.id,
+            manifest_urls=[self.determine_origin_url(m) for m in manifests],
+        )
+
+    def configure_encoding(
+        self,
+        name: str,
+        source_path: str,
+        source_video_file: str,
+        source_audio_files: Dict[str, str],
+        source_subtitle_files: Dict[str, str],
+        output_sub_path: str,
+        splice_points: Optional[List[float]] = None,
+    ) -> Tuple[
+        bm.Encoding,
+        bm.StartEncodingRequest,
+        List[bm.HlsManifest | bm.DashManifest],
+    ]:
+        if splice_points is None:
+            splice_points = getattr(self.config, "SPLICE_POINTS", [])
+
+        # In CMAF mode, HLS uses the same fMP4 segments as DASH instead of TS ones.
+        # Splice point keyframes apply to the encoding, and therefore cut the
+        # segments at the same place either way
+        use_cmaf = getattr(self.config, "USE_CMAF", False)
+
+        # All resources are declared in a graph, and created in parallel
+        # as soon as the resources they depend on are available
+        graph = ResourceGraph(
+            max_workers=getattr(self.config, "MAX_PARALLEL_API_CALLS", 8)
+        )
+
+        encoding = graph.add(
+            "encoding", self._create_encoding, name=name, description=""
+        )
 
         # Manifests
-        (
-            dash_manifest,
-            period,
-        ) = self._generate_dash_manifest_with_single_period(
+        dash_manifest = graph.add(
+            "dash_manifest",
+            self._generate_dash_manifest,
             output_path=output_sub_path,
         )
+        period = graph.add("period", self._add_dash_period, dash_manifest=dash_manifest)
 
-        hls_manifest = self._generate_hls_manifest(output_path=output_sub_path)
+        hls_manifest = graph.add(
+            "hls_manifest",
+            self._generate_hls_manifest,
+            output_path=output_sub_path,
+            use_cmaf=use_cmaf,
+        )
 
         # ABR Ladder
         video_configurations = [
-            self._create_h264_video_configuration(
+            graph.add(
+                f"video_config_{i}",
+                self._create_h264_video_configuration,
                 height=r.height,
                 bitrate=r.bitrate,
                 profile=bm.ProfileH264(r.profile.upper()),
                 level=bm.LevelH264(r.level),
                 rate=self.config.FRAME_RATE,
             )
-            for r in self.config.VIDEO_LADDER
+            for i, r in enumerate(self.config.VIDEO_LADDER)
         ]
 
         audio_configurations = [
-            self._create_aac_audio_configuration(bitrate=r.bitrate)
-            for r in self.config.AUDIO_LADDER
+            graph.add(
+                f"audio_config_{i}",
+                self._create_aac_audio_configuration,
+                bitrate=r.bitrate,
+            )
+            for i, r in enumerate(self.config.AUDIO_LADDER)
         ]
 
-        webvtt_subtitle_configuration = self._create_webvtt_configuration()
-        sidecars = {}
+        webvtt_subtitle_configuration = graph.add(
+            "webvtt_config", self._create_webvtt_configuration
+        )
+
+        # HLS renditions, DASH adaptation sets and representations are added one
+        # after the other, to keep them in the same order in the manifests
+        hls_entries = [hls_manifest.key]
+        dash_adaptation_sets = [period.key]
+        dash_entries = [period.key]
 
         # create video stream, muxings, dash representations and hls variant playlists
-        video_adaptation_set = self._add_video_adaptation_set(
-            dash_manifest=dash_manifest, period=period
+        video_adaptation_set = graph.add(
+            "video_adaptation_set",
+            self._add_video_adaptation_set,
+            after=dash_adaptation_sets[-1:],
+            dash_manifest=dash_manifest,
+            period=period,
         )
-        for i, video_config in enumerate(video_configurations):
-            h264_video_stream = self._create_stream(
+        dash_adaptation_sets.append(video_adaptation_set.key)
+        for i, (r, video_config) in enumerate(
+            zip(self.config.VIDEO_LADDER, video_configurations)
+        ):
+            h264_video_stream = graph.add(
+                f"video_stream_{i}",
+                self._create_stream,
+                encoding=encoding,
                 input_path=os.path.join(source_path, source_video_file),
                 codec_configuration=video_config,
             )
 
-            relative_path_ts = f"video/{video_config.bitrate}/ts"
-            ts_muxing = self._create_ts_muxing(
-                output_path=f"{output_sub_path}/{relative_path_ts}",
-                stream=h264_video_stream,
-            )
-
-            relative_path_fmp4 = f"video/{video_config.bitrate}/fmp4"
-            fmp4_muxing = self._create_fmp4_muxing(
+            relative_path_fmp4 = f"video/{r.bitrate}/fmp4"
+            fmp4_muxing = graph.add(
+                f"video_fmp4_muxing_{i}",
+                self._create_fmp4_muxing,
+                encoding=encoding,
                 output_path=f"{output_sub_path}/{relative_path_fmp4}",
                 stream=h264_video_stream,
             )
 
-            self._add_dash_fmp4_representation(
-                dash_manifest=dash_manifest,
-                period=period,
-                adaptation_set=video_adaptation_set,
-                fmp4_muxing=fmp4_muxing,
-                relative_path=relative_path_fmp4,
+            if use_cmaf:
+                (hls_muxing, relative_path_hls) = (fmp4_muxing, relative_path_fmp4)
+            else:
+                relative_path_hls = f"video/{r.bitrate}/ts"
+                hls_muxing = graph.add(
+                    f"video_ts_muxing_{i}",
+                    self._create_ts_muxing,
+                    encoding=encoding,
+                    output_path=f"{output_sub_path}/{relative_path_hls}",
+                    stream=h264_video_stream,
+                )
+
+            dash_entries.append(
+                graph.add(
+                    f"video_dash_representation_{i}",
+                    self._add_dash_fmp4_representation,
+                    after=dash_entries[-1:],
+                    encoding=encoding,
+                    dash_manifest=dash_manifest,
+                    period=period,
+                    adaptation_set=video_adaptation_set,
+                    fmp4_muxing=fmp4_muxing,
+                    relative_path=relative_path_fmp4,
+                ).key
             )
 
-            self._add_hls_variant(
-                hls_manifest=hls_manifest,
-                stream=h264_video_stream,
-                ts_muxing=ts_muxing,
-                relative_path=relative_path_ts,
-                filename_suffix=f"{video_config.height}p_{video_config.bitrate}",
+            hls_entries.append(
+                graph.add(
+                    f"video_hls_variant_{i}",
+                    self._add_hls_variant,
+                    after=hls_entries[-1:],
+                    encoding=encoding,
+                    hls_manifest=hls_manifest,
+                    stream=h264_video_stream,
+                    muxing=hls_muxing,
+                    relative_path=relative_path_hls,
+                    filename_suffix=f"{r.height}p_{r.bitrate}",
+                ).key
             )
 
         # create audio streams and muxings, dash representations and hls media playlists
         for lang, source_audio_file in source_audio_files.items():
-            audio_adaptation_set = self._add_audio_adaptation_set(
+            audio_adaptation_set = graph.add(
+                f"audio_adaptation_set_{lang}",
+                self._add_audio_adaptation_set,
+                after=dash_adaptation_sets[-1:],
                 dash_manifest=dash_manifest,
                 period=period,
                 lang=self._make_language_label(lang),
             )
-
-            for i, audio_config in enumerate(audio_configurations):
-                audio_stream = self._create_stream(
+            dash_adaptation_sets.append(audio_adaptation_set.key)
+
+            for i, (r, audio_config) in enumerate(
+                zip(self.config.AUDIO_LADDER, audio_configurations)
+            ):
+                audio_stream = graph.add(
+                    f"audio_stream_{lang}_{i}",
+                    self._create_stream,
+                    encoding=encoding,
                     input_path=os.path.join(source_path, source_audio_file),
                     codec_configuration=audio_config,
                     language=lang,
                 )
 
-                relative_path_ts = f"audio_{lang}/{audio_config.bitrate}/ts"
-                ts_muxing = self._create_ts_muxing(
-                    output_path=f"{output_sub_path}/{relative_path_ts}",
-                    stream=audio_stream,
-                )
-
-                relative_path_fmp4 = f"audio_{lang}/{audio_config.bitrate}/fmp4"
-                fmp4_muxing = self._create_fmp4_muxing(
+                relative_path_fmp4 = f"audio_{lang}/{r.bitrate}/fmp4"
+                fmp4_muxing = graph.add(
+                    f"audio_fmp4_muxing_{lang}_{i}",
+                    self._create_fmp4_muxing,
+                    encoding=encoding,
                     output_path=f"{output_sub_path}/{relative_path_fmp4}",
                     stream=audio_stream,
                 )
 
-                self._add_dash_fmp4_representation(
-                    dash_manifest=dash_manifest,
-                    period=period,
-                    adaptation_set=audio_adaptation_set,
-                    fmp4_muxing=fmp4_muxing,
-                    relative_path=relative_path_fmp4,
+                if use_cmaf:
+                    (hls_muxing, relative_path_hls) = (fmp4_muxing, relative_path_fmp4)
+                else:
+                    relative_path_hls = f"audio_{lang}/{r.bitrate}/ts"
+                    hls_muxing = graph.add(
+                        f"audio_ts_muxing_{lang}_{i}",
+                        self._create_ts_muxing,
+                        encoding=encoding,
+                        output_path=f"{output_sub_path}/{relative_path_hls}",
+                        stream=audio_stream,
+                    )
+
+                dash_entries.append(
+                    graph.add(
+                        f"audio_dash_representation_{lang}_{i}",
+                        self._add_dash_fmp4_representation,
+                        after=dash_entries[-1:],
+                        encoding=encoding,
+                        dash_manifest=dash_manifest,
+                        period=period,
+                        adaptation_set=audio_adaptation_set,
+                        fmp4_muxing=fmp4_muxing,
+                        relative_path=relative_path_fmp4,
+                    ).key
                 )
 
-                self._add_hls_media(
-                    hls_manifest=hls_manifest,
-                    stream=audio_stream,
-                    ts_muxing=ts_muxing,
-                    relative_path=relative_path_ts,
-                    filename_suffix=f"{audio_config.bitrate}",
-                    language=lang,
-                    label=self._make_language_label(lang),
+                hls_entries.append(
+                    graph.add(
+                        f"audio_hls_media_{lang}_{i}",
+                        self._add_hls_media,
+                        after=hls_entries[-1:],
+                        encoding=encoding,
+                        hls_manifest=hls_manifest,
+                        stream=audio_stream,
+                        muxing=hls_muxing,
+                        relative_path=relative_path_hls,
+                        filename_suffix=f"{r.bitrate}",
+                        language=lang,
+                        label=self._make_language_label(lang),
+                    ).key
                 )
 
         # create subtitle streams and muxings
         for lang, source_sub_file in source_subtitle_files.items():
             # In-manifest HLS
-            vtt_subtitle_stream = self._create_subtitle_stream(
+            vtt_subtitle_stream = graph.add(
+                f"subtitle_stream_{lang}",
+                self._create_subtitle_stream,
+                encoding=encoding,
                 input_path=os.path.join(source_path, source_sub_file),
                 codec_configuration=webvtt_subtitle_configuration,
                 language=lang,
             )
 
             relative_path_vtt = f"subtitles_{lang}/vtt"
-            vtt_chunked_text_muxing = self._create_chunked_text_muxing(
+            vtt_chunked_text_muxing = graph.add(
+                f"subtitle_muxing_{lang}",
+                self._create_chunked_text_muxing,
+                encoding=encoding,
                 output_path=f"{output_sub_path}/{relative_path_vtt}",
                 stream=vtt_subtitle_stream,
                 extension="vtt",
             )
 
-            self._add_hls_subtitle_media(
-                hls_manifest=hls_manifest,
-                stream=vtt_subtitle_stream,
-                text_muxing=vtt_chunked_text_muxing,
-                relative_path=relative_path_vtt,
-                label=self._make_language_label(lang),
-                language=lang,
+            hls_entries.append(
+                graph.add(
+                    f"subtitle_hls_media_{lang}",
+                    self._add_hls_subtitle_media,
+                    after=hls_entries[-1:],
+                    encoding=encoding,
+                    hls_manifest=hls_manifest,
+                    stream=vtt_subtitle_stream,
+                    text_muxing=vtt_chunked_text_muxing,
+                    relative_path=relative_path_vtt,
+                    label=self._make_language_label(lang),
+                    language=lang,
+                ).key
             )
 
             # In-manifest DASH
-            subtitle_adaptation_set = self._add_subtitle_adaptation_set(
+            subtitle_adaptation_set = graph.add(
+                f"subtitle_adaptation_set_{lang}",
+                self._add_subtitle_adaptation_set,
+                after=dash_adaptation_sets[-1:],
                 dash_manifest=dash_manifest,
                 period=period,
                 lang=self._make_language_label(lang),
             )
+            dash_adaptation_sets.append(subtitle_adaptation_set.key)
+
+            dash_entries.append(
+                graph.add(
+                    f"subtitle_dash_representation_{lang}",
+                    self._add_dash_chunked_text_representation,
+                    after=dash_entries[-1:],
+                    encoding=encoding,
+                    dash_manifest=dash_manifest,
+                    period=period,
+                    adaptation_set=subtitle_adaptation_set,
+                    text_muxing=vtt_chunked_text_muxing,
+                    relative_path=relative_path_vtt,
+                ).key
+            )
 
-            self._add_dash_chunked_text_representation(
-                dash_manifest=dash_manifest,
-                period=period,
-                adaptation_set=subtitle_adaptation_set,
-                text_muxing=vtt_chunked_text_muxing,
-                relative_path=relative_path_vtt,
+        if splice_points:
+            graph.add(
+                "keyframes",
+                self._create_keyframes,
+                encoding=encoding,
+                splice_points=splice_points,
             )
 
-        if hasattr(self.config, "SPLICE_POINTS"):
-            self._create_keyframes(splice_points=self.config.SPLICE_POINTS)
+        resources = graph.run()
 
         start_encoding_request = bm.StartEncodingRequest(
             manifest_generator=bm.ManifestGenerator.V2
         )
 
         start_encoding_request.vod_hls_manifests = [
-            bm.ManifestResource(manifest_id=hls_manifest.id)
+            bm.ManifestResource(manifest_id=resources["hls_manifest"].id)
         ]
         start_encoding_request.vod_dash_manifests = [
-            bm.ManifestResource(manifest_id=dash_manifest.id)
+            bm.ManifestResource(manifest_id=resources["dash_manifest"].id)
         ]
 
-        self._execute_encoding(start_encoding_request=start_encoding_request)
-
-        return (self.encoding, [hls_manifest, dash_manifest])
+        return (
+            resources["encoding"],
+            start_encoding_request,
+            [resources["hls_manifest"], resources["dash_manifest"]],
+        )
 
     def determine_origin_url(self, resource: bm.HlsManifest | bm.DashManifest) -> str:
         baseurl = f"https://{self.output.bucket_name}.s3.amazonaws.com/"
@@ -228,50 +515,149 @@ class BitmovinController:
             for p in [baseurl, resource.outputs[0].output_path, resource.manifest_name]
         )
 
-    def _poll_encoding_status(self) -> bm.Task:
-        sleep(5)
-        task = self.encoding_api.encodings.status(encoding_id=self.encoding.id)
-        print(
-            "Encoding status is {} (progress: {} %)".format(
-                task.status.value, task.progress
-            )
-        )
-        return task
+    def execute_encoding(
+        self, encoding: bm.Encoding, start_encoding_request: bm.StartEncodingRequest
+    ):
+        if self.webhook_listener:
+            self._register_webhooks(encoding=encoding)
 
-    def _execute_encoding(self, start_encoding_request):
         self.encoding_api.encodings.start(
-            encoding_id=self.encoding.id, start_encoding_request=start_encoding_request
+            encoding_id=encoding.id, start_encoding_request=start_encoding_request
         )
 
-        task = self._poll_encoding_status()
+        self._wait_until_encoding_is_finished(encoding=encoding)
 
-        while task.status not in [
-            bm.Status.FINISHED,
-            bm.Status.ERROR,
-            bm.Status.CANCELED,
-        ]:
-            task = self._poll_encoding_status()
+    def compile_encoding_template(
+        self,
+        name: str,
+        source_path: str,
+        source_video_file: str,
+        source_audio_files: Dict[str, str],
+        source_subtitle_files: Dict[str, str],
+        output_sub_path: str,
+        splice_points: Optional[List[float]] = None,
+    ) -> Tuple[Dict, List[bm.HlsManifest | bm.DashManifest]]:
+        compiler = EncodingTemplateCompiler(
+            config=self.config, input_id=self.input.id, output_id=self.output.id
+        )
+
+        template = compiler.compile(
+            name=name,
+            source_path=source_path,
+            source_video_file=source_video_file,
+            source_audio_files=source_audio_files,
+            source_subtitle_files=source_subtitle_files,
+            output_sub_path=output_sub_path,
+            splice_points=splice_points,
+        )
+
+        # The manifests are created by the template, these local copies are only
+        # there to tell where they will be written
+        manifests = [
+            compiler.hls_manifest(output_sub_path),
+            compiler.dash_manifest(output_sub_path),
+        ]
+
+        return (template, manifests)
+
+    def _encode_and_package_with_template(
+        self,
+        name: str,
+        source_path: str,
+        source_video_file: str,
+        source_audio_files: Dict[str, str],
+        source_subtitle_files: Dict[str, str],
+        output_sub_path: str,
+        splice_points: Optional[List[float]] = None,
+    ) -> Tuple[bm.Encoding, List[bm.HlsManifest | bm.DashManifest]]:
+        (template, manifests) = self.compile_encoding_template(
+            name=name,
+            source_path=source_path,
+            source_video_file=source_video_file,
+            source_audio_files=source_audio_files,
+            source_subtitle_files=source_subtitle_files,
+            output_sub_path=output_sub_path,
+            splice_points=splice_points,
+        )
+        encoding = self.execute_encoding_template(
+            name=name, template=template, manifests=manifests
+        )
+
+        return (encoding, manifests)
+
+    def execute_encoding_template(
+        self,
+        name: str,
+        template: Dict,
+        manifests: List[bm.HlsManifest | bm.DashManifest],
+    ) -> bm.Encoding:
+        """Start an encoding from a compiled template, and wait until it is finished"""
+        response = self.encoding_api.templates.start(encoding_template_request=template)
+        encoding = bm.Encoding(name=name)
+        encoding.id = response.encoding_id
+        print(f"Started encoding {encoding.id} from an encoding template")
+        if self.journal:
+            self.record_encoding(
+                journal=self.journal, encoding=encoding, manifests=manifests
+            )
+
+        if self.webhook_listener:
+            # The ID of an encoding started from a template is only known once it
+            # has started, so its webhooks can't be registered before. The status
+            # is only watched (and checked straight away) once they are, so that
+            # an encoding that finished in between isn't waited for
+            self._register_webhooks(encoding=encoding)
+
+        self._wait_until_encoding_is_finished(encoding=encoding)
+
+        return encoding
+
+    def _wait_until_encoding_is_finished(self, encoding: bm.Encoding) -> None:
+        task = self.status_watcher.watch(
+            encoding_id=encoding.id, on_update=self._print_encoding_status
+        ).result()
 
-        if task.status is bm.Status.ERROR:
+        if task.status is not bm.Status.FINISHED:
             self._log_task_errors(task=task)
             raise Exception("Encoding failed")
 
         print("Encoding finished successfully")
 
+    def _register_webhooks(self, encoding: bm.Encoding) -> None:
+        webhooks_api = self.bitmovin_api.notifications.webhooks.encoding.encodings
+        webhook = bm.Webhook(
+            url=self.webhook_listener.url_for(encoding.id),
+            method=bm.WebhookHttpMethod.POST,
+        )
+
+        for api in [
+            webhooks_api.finished,
+            webhooks_api.error,
+            webhooks_api.transfer_error,
+        ]:
+            api.create_by_encoding_id(encoding_id=encoding.id, webhook=webhook)
+
+    def _print_encoding_status(self, task: bm.Task) -> None:
+        print(
+            "Encoding status is {} (progress: {} %)".format(
+                task.status.value, task.progress
+            )
+        )
+
     def _create_encoding(self, name: str, description: str) -> bm.Encoding:
         encoding = bm.Encoding(name=name, description=description)
 
         return self.encoding_api.encodings.create(encoding=encoding)
 
-    def _create_keyframes(self, splice_points):
+    def _create_keyframes(self, encoding: bm.Encoding, splice_points: List[float]):
         keyframes = []
 
         for splice_point in splice_points:
-            keyframe = bm.Keyframe(time=splice_point, segment_cut=True)
+            keyframe = codec_configs.splice_point_keyframe(time=splice_point)
 
             keyframes.append(
                 self.encoding_api.encodings.keyframes.create(
-                    encoding_id=self.encoding.id, keyframe=keyframe
+                    encoding_id=encoding.id, keyframe=keyframe
                 )
             )
 
@@ -290,7 +676,14 @@ class BitmovinController:
             bucket_name=bucket_name,
         )
 
-        return self.encoding_api.outputs.s3.create(s3_output=s3_output)
+        # Outputs are cached like codec configurations, so that the one created
+        # by a previous run is reused
+        s3_api = self.encoding_api.outputs.s3
+        return self._create_or_reuse_configuration(
+            configuration=s3_output,
+            create=lambda o: s3_api.create(s3_output=o),
+            get=lambda id: s3_api.get(output_id=id),
+        )
 
     def _get_https_input(self, input_id: str) -> bm.HttpsInput:
         return self.encoding_api.inputs.https.get(input_id=input_id)
@@ -302,7 +695,12 @@ class BitmovinController:
             host=source_file.hostname, name=source_file.hostname
         )
 
-        return self.encoding_api.inputs.https.create(https_input=https_input)
+        https_api = self.encoding_api.inputs.https
+        return self._create_or_reuse_configuration(
+            configuration=https_input,
+            create=lambda i: https_api.create(https_input=i),
+            get=lambda id: https_api.get(input_id=id),
+        )
 
     def _create_h264_video_configuration(
         self,
@@ -312,60 +710,68 @@ class BitmovinController:
         level: bm.LevelH264,
         rate: Optional[float] = None,
     ) -> bm.H264VideoConfiguration:
-        config = bm.H264VideoConfiguration(
-            name="H.264 {0} {1} Mbit/s".format(height, bitrate / (1000 * 1000)),
-            preset_configuration=bm.PresetConfiguration.VOD_STANDARD,
-            height=height,
-            bitrate=bitrate,
-            rate=rate,
-            profile=profile,
-            level=level,
+        config = codec_configs.h264_video_configuration(
+            height=height, bitrate=bitrate, profile=profile, level=level, rate=rate
         )
 
-        # For correct alignment between content and ads, it's critical that the Bitmovin
-        # encoding complies with the selected profile. The following code makes sure of it,
-        # see https://developer.bitmovin.com/encoding/docs/h264-presets#conformance-with-h264-profiles,
-        # written by the author when he was working at Bitmovin ;)
+        h264_api = self.encoding_api.configurations.video.h264
+        return self._create_or_reuse_configuration(
+            configuration=config,
+            create=lambda c: h264_api.create(h264_video_configuration=c),
+            get=lambda id: h264_api.get(configuration_id=id),
+        )
 
-        if profile is bm.ProfileH264.BASELINE:
-            config.adaptive_spatial_transform = False
-            config.bframes = 0
-            config.cabac = False
-            config.weighted_prediction_p_frames = bm.WeightedPredictionPFrames.DISABLED
+    def _create_aac_audio_configuration(self, bitrate: int) -> bm.AacAudioConfiguration:
+        config = codec_configs.aac_audio_configuration(bitrate=bitrate)
 
-        if profile is bm.ProfileH264.MAIN:
-            config.adaptive_spatial_transform = False
+        aac_api = self.encoding_api.configurations.audio.aac
+        return self._create_or_reuse_configuration(
+            configuration=config,
+            create=lambda c: aac_api.create(aac_audio_configuration=c),
+            get=lambda id: aac_api.get(configuration_id=id),
+        )
 
-        if profile is bm.ProfileH264.HIGH:
-            config.adaptive_spatial_transform = True
+    def _create_webvtt_configuration(self) -> bm.WebVttConfiguration:
+        config = codec_configs.webvtt_configuration()
 
-        return self.encoding_api.configurations.video.h264.create(
-            h264_video_configuration=config
+        webvtt_api = self.encoding_api.configurations.subtitles.webvtt
+        return self._create_or_reuse_configuration(
+            configuration=config,
+            create=lambda c: webvtt_api.create(web_vtt_configuration=c),
+            get=lambda id: webvtt_api.get(configuration_id=id),
         )
 
-    def _create_aac_audio_configuration(self, bitrate: int) -> bm.AacAudioConfiguration:
-        config = bm.AacAudioConfiguration(
-            name="AAC {0} kbit/s".format(bitrate / 1000), bitrate=bitrate
+    def _create_or_reuse_configuration(
+        self,
+        configuration: bm.CodecConfiguration,
+        create: Callable[[bm.CodecConfiguration], bm.CodecConfiguration],
+        get: Callable[[str], bm.CodecConfiguration],
+    ) -> bm.CodecConfiguration:
+        if self.configuration_cache is None:
+            return create(configuration)
+
+        return self.configuration_cache.get_or_create(
+            configuration=configuration, create=create, get=get
         )
 
-        return self.encoding_api.configurations.audio.aac.create(
-            aac_audio_configuration=config
-        )
+    def _recorded_id(self, key: str) -> Optional[str]:
+        return self.journal.resource_id(key) if self.journal else None
 
-    def _create_webvtt_configuration(self) -> bm.WebVttConfiguration:
-        config = bm.WebVttConfiguration(
-            name="WebVTT",
-            # styling=bm.WebVttStyling(mode=bm.WebVttStylingMode.PASSTHROUGH),
-            cue_identifier_policy=bm.WebVttCueIdentifierPolicy.OMIT_IDENTIFIERS,
-            append_optional_zero_hour=True,
-        )
+    def _record_resource(self, key: str, resource_id: str) -> None:
+        if self.journal:
+            self.journal.record_resource(key, resource_id)
 
-        return self.encoding_api.configurations.subtitles.webvtt.create(
-            web_vtt_configuration=config
+    def _account_namespace(self) -> str:
+        # Configuration IDs are only valid on the account they were created on
+        account = "{0}/{1}".format(
+            self.config.BITMOVIN_API_KEY,
+            getattr(self.config, "BITMOVIN_TENANT_ORG_ID", ""),
         )
+        return hashlib.sha256(account.encode("utf-8")).hexdigest()[:16]
 
     def _create_stream(
         self,
+        encoding: bm.Encoding,
         input_path: str,
         codec_configuration: bm.CodecConfiguration,
         language: Optional[str] = None,
@@ -383,11 +789,12 @@ class BitmovinController:
             stream.metadata = bm.StreamMetadata(language=language)
 
         return self.encoding_api.encodings.streams.create(
-            encoding_id=self.encoding.id, stream=stream
+            encoding_id=encoding.id, stream=stream
         )
 
     def _create_subtitle_stream(
         self,
+        encoding: bm.Encoding,
         input_path: str,
         codec_configuration: bm.CodecConfiguration,
         language: Optional[str] = None,
@@ -399,7 +806,7 @@ class BitmovinController:
             input_stream.file_type = bm.FileInputStreamType.WEBVTT
 
         input_stream = self.encoding_api.encodings.input_streams.file.create(
-            encoding_id=self.encoding.id, file_input_stream=input_stream
+            encoding_id=encoding.id, file_input_stream=input_stream
         )
 
         stream_input = bm.StreamInput(input_stream_id=input_stream.id)
@@ -409,11 +816,12 @@ class BitmovinController:
         )
 
         return self.encoding_api.encodings.streams.create(
-            encoding_id=self.encoding.id, stream=stream
+            encoding_id=encoding.id, stream=stream
         )
 
     def _create_ts_muxing(
         self,
+        encoding: bm.Encoding,
         output_path: str,
         stream: bm.Stream,
     ) -> bm.TsMuxing:
@@ -425,11 +833,12 @@ class BitmovinController:
         )
 
         return self.encoding_api.encodings.muxings.ts.create(
-            encoding_id=self.encoding.id, ts_muxing=muxing
+            encoding_id=encoding.id, ts_muxing=muxing
         )
 
     def _create_fmp4_muxing(
         self,
+        encoding: bm.Encoding,
         output_path: str,
         stream: bm.Stream,
     ) -> bm.Fmp4Muxing:
@@ -440,11 +849,12 @@ class BitmovinController:
         )
 
         return self.encoding_api.encodings.muxings.fmp4.create(
-            encoding_id=self.encoding.id, fmp4_muxing=muxing
+            encoding_id=encoding.id, fmp4_muxing=muxing
         )
 
     def _create_text_muxing(
         self,
+        encoding: bm.Encoding,
         output_path: str,
         stream: bm.Stream,
         filename: str,
@@ -457,11 +867,12 @@ class BitmovinController:
         )
 
         return self.encoding_api.encodings.muxings.text.create(
-            encoding_id=self.encoding.id, text_muxing=muxing
+            encoding_id=encoding.id, text_muxing=muxing
         )
 
     def _create_chunked_text_muxing(
         self,
+        encoding: bm.Encoding,
         output_path: str,
         stream: bm.Stream,
         extension: str,
@@ -475,39 +886,39 @@ class BitmovinController:
         )
 
         return self.encoding_api.encodings.muxings.chunked_text.create(
-            encoding_id=self.encoding.id, chunked_text_muxing=muxing
+            encoding_id=encoding.id, chunked_text_muxing=muxing
         )
 
-    def _generate_hls_manifest(self, output_path: str) -> bm.HlsManifest:
+    def _generate_hls_manifest(
+        self, output_path: str, use_cmaf: bool = False
+    ) -> bm.HlsManifest:
+        # fMP4 segments in HLS need EXT-X-MAP, ie. version 7 of the playlists
+        hls_version = bm.HlsVersion.HLS_V7 if use_cmaf else bm.HlsVersion.HLS_V6
         hls_manifest = bm.HlsManifest(
             outputs=[self._build_encoding_output(output_path)],
-            name="HLS/ts Manifest",
-            hls_master_playlist_version=bm.HlsVersion.HLS_V6,
-            hls_media_playlist_version=bm.HlsVersion.HLS_V6,
+            name="HLS/fmp4 Manifest" if use_cmaf else "HLS/ts Manifest",
+            hls_master_playlist_version=hls_version,
+            hls_media_playlist_version=hls_version,
             manifest_name="stream.m3u8",
         )
 
         return self.hls_api.create(hls_manifest=hls_manifest)
 
-    def _generate_dash_manifest_with_single_period(
-        self,
-        output_path: str,
-    ) -> Tuple[bm.DashManifest, bm.Period]:
-        dash_manifest = self.dash_api.create(
-            dash_manifest=bm.DashManifest(
-                name="Single-Period DASH Manifest",
-                manifest_name="stream.mpd",
-                outputs=[self._build_encoding_output(output_path)],
-                profile=bm.DashProfile.LIVE,
-            )
+    def _generate_dash_manifest(self, output_path: str) -> bm.DashManifest:
+        dash_manifest = bm.DashManifest(
+            name="Single-Period DASH Manifest",
+            manifest_name="stream.mpd",
+            outputs=[self._build_encoding_output(output_path)],
+            profile=bm.DashProfile.LIVE,
         )
 
-        period = self.dash_api.periods.create(
+        return self.dash_api.create(dash_manifest=dash_manifest)
+
+    def _add_dash_period(self, dash_manifest: bm.DashManifest) -> bm.Period:
+        return self.dash_api.periods.create(
             manifest_id=dash_manifest.id, period=bm.Period()
         )
 
-        return (dash_manifest, period)
-
     def _add_video_adaptation_set(
         self, dash_manifest: bm.DashManifest, period: bm.Period
     ):
@@ -537,6 +948,7 @@ class BitmovinController:
 
     def _add_dash_fmp4_representation(
         self,
+        encoding: bm.Encoding,
         dash_manifest: bm.DashManifest,
         period: bm.Period,
         adaptation_set: bm.AdaptationSet,
@@ -545,7 +957,7 @@ class BitmovinController:
     ) -> bm.DashFmp4Representation:
         representation = bm.DashFmp4Representation(
             type_=bm.DashRepresentationType.TIMELINE,
-            encoding_id=self.encoding.id,
+            encoding_id=encoding.id,
             muxing_id=fmp4_muxing.id,
             segment_path=relative_path,
         )
@@ -559,6 +971,7 @@ class BitmovinController:
 
     def _add_dash_chunked_text_representation(
         self,
+        encoding: bm.Encoding,
         dash_manifest: bm.DashManifest,
         period: bm.Period,
         adaptation_set: bm.SubtitleAdaptationSet,
@@ -567,7 +980,7 @@ class BitmovinController:
     ) -> bm.DashChunkedTextRepresentation:
         representation = bm.DashChunkedTextRepresentation(
             type_=bm.DashRepresentationType.TIMELINE,
-            encoding_id=self.encoding.id,
+            encoding_id=encoding.id,
             muxing_id=text_muxing.id,
             segment_path=relative_path,
         )
@@ -581,9 +994,10 @@ class BitmovinController:
 
     def _add_hls_variant(
         self,
+        encoding: bm.Encoding,
         hls_manifest: bm.HlsManifest,
         stream: bm.Stream,
-        ts_muxing: bm.TsMuxing,
+        muxing: bm.TsMuxing | bm.Fmp4Muxing,
         relative_path: str,
         filename_suffix: str,
     ) -> bm.StreamInfo:
@@ -592,9 +1006,9 @@ class BitmovinController:
             subtitles="SUBS",
             segment_path=relative_path,
             uri=f"video_{filename_suffix}.m3u8",
-            encoding_id=self.encoding.id,
+            encoding_id=encoding.id,
             stream_id=stream.id,
-            muxing_id=ts_muxing.id,
+            muxing_id=muxing.id,
             force_frame_rate_attribute=True,
             force_video_range_attribute=True,
         )
@@ -605,9 +1019,10 @@ class BitmovinController:
 
     def _add_hls_media(
         self,
+        encoding: bm.Encoding,
         hls_manifest: bm.HlsManifest,
         stream: bm.Stream,
-        ts_muxing: bm.TsMuxing,
+        muxing: bm.TsMuxing | bm.Fmp4Muxing,
         relative_path: str,
         filename_suffix: str,
         label: str,
@@ -618,9 +1033,9 @@ class BitmovinController:
             group_id="AUDIO",
             segment_path=relative_path,
             uri=f"audio_{language}_{filename_suffix}.m3u8",
-            encoding_id=self.encoding.id,
+            encoding_id=encoding.id,
             stream_id=stream.id,
-            muxing_id=ts_muxing.id,
+            muxing_id=muxing.id,
             language=language,
         )
 
@@ -630,6 +1045,7 @@ class BitmovinController:
 
     def _add_hls_subtitle_media(
         self,
+        encoding: bm.Encoding,
         hls_manifest: bm.HlsManifest,
         stream: bm.Stream,
         text_muxing: bm.ChunkedTextMuxing,
@@ -642,7 +1058,7 @@ class BitmovinController:
             group_id="SUBS",
             segment_path=relative_path,
             uri=f"subtitles_{language}.m3u8",
-            encoding_id=self.encoding.id,
+            encoding_id=encoding.id,
             stream_id=stream.id,
             muxing_id=text_muxing.id,
             language=language,
@@ -1,9 +1,13 @@
+import asyncio
+import functools
 import json
-import sys
-from typing import Dict, List, Tuple
-from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
-import requests
+from http_session import DEFAULT_TIMEOUT, create_session
+from journal import JobJournal
+from resource_index import ResourceIndex
+from streaming_urls import StreamingUrlGenerator
 
 API_BASE_URL = "https://api.broadpeak.io"
 
@@ -11,74 +15,173 @@ API_BASE_URL = "https://api.broadpeak.io"
 class BroadpeakIOController:
     def __init__(self, config) -> None:
         self.config = config
+        self.api_base_url = getattr(self.config, "BPKIO_API_BASE_URL", API_BASE_URL)
         self.headers = {
             "accept": "application/json",
             "content-type": "application/json",
             "authorization": f"Bearer {self.config.BPKIO_API_KEY}",
         }
-
-        if not hasattr(self.config, "TRANSCODING_PROFILE_ID"):
-            print("You need to provide a Transcoding Profile ID in the config file")
-            self.build_transcoding_profile_config()
-            sys.exit(0)
+        self.session = create_session(
+            pool_size=getattr(self.config, "BPKIO_API_MAX_CONNECTIONS", 10)
+        )
+        self.index = ResourceIndex(
+            session=self.session,
+            headers=self.headers,
+            api_base_url=self.api_base_url,
+            ttl=getattr(self.config, "BPKIO_RESOURCE_INDEX_TTL", 300),
+        )
+        self._streaming_url_generators: Dict[str, StreamingUrlGenerator] = {}
 
     def create_resources(
-        self, service_name: str, origin_urls: List[str]
+        self,
+        service_name: str,
+        origin_urls: List[str],
+        journal: Optional[JobJournal] = None,
     ) -> Tuple[Dict, Dict, Dict]:
-        """Create resources for the broadpeak.io service"""
+        """Create resources for the broadpeak.io service
+
+        Resources recorded in the journal by a previous run of the job are
+        retrieved instead of being created again, and so are identical resources
+        found in the index of the account.
+        """
+        ad_server = self._create_or_retrieve_ad_server(journal=journal)
+        asset_catalog = self._create_or_retrieve_asset_catalog(
+            origin_urls=origin_urls, journal=journal
+        )
+        avod_service = self._create_or_retrieve_avod_service(
+            service_name=service_name,
+            ad_server=ad_server,
+            asset_catalog=asset_catalog,
+            journal=journal,
+        )
+
+        return (ad_server, asset_catalog, avod_service)
+
+    def _create_or_retrieve_ad_server(self, journal: Optional[JobJournal]) -> Dict:
         if hasattr(self.config, "AD_SERVER_ID"):
             ad_server = self._get_ad_server(getattr(self.config, "AD_SERVER_ID"))
+        elif _recorded_id(journal, "ad_server"):
+            ad_server = self._get_ad_server(_recorded_id(journal, "ad_server"))
         else:
-            ad_server = self._create_ad_server_ad_proxy_vmap_gen(
+            payload = self._ad_server_ad_proxy_vmap_gen_payload(
                 vast_tag=self.config.VAST_TAG
             )
+            ad_server = self.index.find("ad_servers", **payload)
+            if ad_server is None:
+                ad_server = self._create_ad_server_ad_proxy_vmap_gen(
+                    vast_tag=self.config.VAST_TAG
+                )
+                self.index.add("ad_servers", ad_server)
+            _record_resource(journal, "ad_server", ad_server["id"])
+
+        return ad_server
 
+    def _create_or_retrieve_asset_catalog(
+        self, origin_urls: List[str], journal: Optional[JobJournal]
+    ) -> Dict:
         if hasattr(self.config, "ASSET_CATALOG_ID"):
             asset_catalog = self._get_asset_catalog(
                 getattr(self.config, "ASSET_CATALOG_ID")
             )
+        elif _recorded_id(journal, "asset_catalog"):
+            asset_catalog = self._get_asset_catalog(
+                _recorded_id(journal, "asset_catalog")
+            )
         else:
-            asset_catalog = self._create_asset_catalog(origin_urls=origin_urls)
+            payload = self._asset_catalog_payload(origin_urls=origin_urls)
+            asset_catalog = self.index.find("asset_catalogs", url=payload["url"])
+            if asset_catalog is None:
+                asset_catalog = self._create_asset_catalog(origin_urls=origin_urls)
+                self.index.add("asset_catalogs", asset_catalog)
+            _record_resource(journal, "asset_catalog", asset_catalog["id"])
 
+        return asset_catalog
+
+    def _create_or_retrieve_avod_service(
+        self,
+        service_name: str,
+        ad_server: Dict,
+        asset_catalog: Dict,
+        journal: Optional[JobJournal],
+    ) -> Dict:
         if hasattr(self.config, "AVOD_SERVICE_ID"):
             avod_service = self._get_avod_service(
                 getattr(self.config, "AVOD_SERVICE_ID")
             )
+        elif _recorded_id(journal, "avod_service"):
+            avod_service = self._get_avod_service(_recorded_id(journal, "avod_service"))
         else:
-            avod_service = self._create_avod_service(
-                service_name=service_name,
-                ad_server_id=ad_server["id"],
-                asset_catalog_id=asset_catalog["id"],
-                transcoding_profile_id=self.config.TRANSCODING_PROFILE_ID,
+            # Only a service with the same ad server and transcoding profile is
+            # reused
+            avod_service = self.index.find(
+                "services",
+                **self._avod_service_payload(
+                    service_name=service_name,
+                    ad_server_id=ad_server["id"],
+                    asset_catalog_id=asset_catalog["id"],
+                    transcoding_profile_id=self.config.TRANSCODING_PROFILE_ID,
+                ),
             )
+            if avod_service is None:
+                avod_service = self._create_avod_service(
+                    service_name=service_name,
+                    ad_server_id=ad_server["id"],
+                    asset_catalog_id=asset_catalog["id"],
+                    transcoding_profile_id=self.config.TRANSCODING_PROFILE_ID,
+                )
+                self.index.add("services", avod_service)
+            _record_resource(journal, "avod_service", avod_service["id"])
 
-        return (ad_server, asset_catalog, avod_service)
+        return avod_service
+
+    def create_avod_services(
+        self, service_names: List[str], ad_server_id: int, asset_catalog_id: int
+    ) -> List[Dict]:
+        """Create many AVOD services at once, on the same sources"""
+        async_controller = AsyncBroadpeakIOController(self)
+        try:
+            return asyncio.run(
+                async_controller.create_avod_services(
+                    service_names=service_names,
+                    ad_server_id=ad_server_id,
+                    asset_catalog_id=asset_catalog_id,
+                )
+            )
+        finally:
+            async_controller.close()
 
     def _create_asset_catalog(self, origin_urls: List[str]) -> Dict:
+        return self._post_wrapper(
+            endpoint_url=f"{self.api_base_url}/v1/sources/asset-catalog",
+            payload=self._asset_catalog_payload(origin_urls=origin_urls),
+        )
+
+    def _asset_catalog_payload(self, origin_urls: List[str]) -> Dict:
         # Define source URL from origin_urls
         url = origin_urls[0]
         pos = url.find(self.config.S3_OUTPUT_BASE_PATH) + len(
             self.config.S3_OUTPUT_BASE_PATH
         )
 
-        asset_catalog_payload = {
+        return {
             "name": "Bitmovin AVOD outputs",
             "url": url[:pos],
             "assetSample": url[pos:],
         }
 
-        return self._post_wrapper(
-            endpoint_url=f"{API_BASE_URL}/v1/sources/asset-catalog",
-            payload=asset_catalog_payload,
-        )
-
     def _get_asset_catalog(self, id: int):
         return self._get_wrapper(
-            endpoint_url=f"{API_BASE_URL}/v1/sources/asset-catalog/{id}"
+            endpoint_url=f"{self.api_base_url}/v1/sources/asset-catalog/{id}"
         )
 
     def _create_ad_server_ad_proxy_vmap_gen(self, vast_tag: str):
-        ad_proxy_payload = {
+        return self._post_wrapper(
+            endpoint_url=f"{self.api_base_url}/v1/sources/ad-server",
+            payload=self._ad_server_ad_proxy_vmap_gen_payload(vast_tag=vast_tag),
+        )
+
+    def _ad_server_ad_proxy_vmap_gen_payload(self, vast_tag: str) -> Dict:
+        return {
             "name": "AdProxy VMAP Generator",
             "template": "ad-proxy-vmap-generator",
             "queries": "&".join(
@@ -91,14 +194,9 @@ class BroadpeakIOController:
             ),
         }
 
-        return self._post_wrapper(
-            endpoint_url=f"{API_BASE_URL}/v1/sources/ad-server",
-            payload=ad_proxy_payload,
-        )
-
     def _get_ad_server(self, id: int):
         return self._get_wrapper(
-            endpoint_url=f"{API_BASE_URL}/v1/sources/ad-server/{id}"
+            endpoint_url=f"{self.api_base_url}/v1/sources/ad-server/{id}"
         )
 
     def _create_avod_service(
@@ -108,7 +206,24 @@ class BroadpeakIOController:
         ad_server_id: int,
         transcoding_profile_id: int,
     ):
-        adinsertion_service_payload = {
+        return self._post_wrapper(
+            endpoint_url=f"{self.api_base_url}/v1/services/ad-insertion",
+            payload=self._avod_service_payload(
+                service_name=service_name,
+                asset_catalog_id=asset_catalog_id,
+                ad_server_id=ad_server_id,
+                transcoding_profile_id=transcoding_profile_id,
+            ),
+        )
+
+    def _avod_service_payload(
+        self,
+        service_name: str,
+        asset_catalog_id: int,
+        ad_server_id: int,
+        transcoding_profile_id: int,
+    ) -> Dict:
+        return {
             "name": service_name,
             "source": {"id": asset_catalog_id},
             "vodAdInsertion": {"adServer": {"id": ad_server_id}},
@@ -116,52 +231,51 @@ class BroadpeakIOController:
             "enableAdTranscoding": True,
         }
 
-        return self._post_wrapper(
-            endpoint_url=f"{API_BASE_URL}/v1/services/ad-insertion",
-            payload=adinsertion_service_payload,
-        )
-
     def _get_avod_service(self, id: int):
         return self._get_wrapper(
-            endpoint_url=f"{API_BASE_URL}/v1/services/ad-insertion/{id}"
+            endpoint_url=f"{self.api_base_url}/v1/services/ad-insertion/{id}"
         )
 
     def calculate_streaming_urls(
-        self, service_id: int, origin_manifest_urls: List[str]
+        self,
+        service_id: int,
+        origin_manifest_urls: List[str],
+        splice_points: Optional[List[float]] = None,
     ) -> List[str]:
-        streaming_urls = []
-        adinsertion_service = self._get_avod_service(service_id)
-
-        for origin_url in origin_manifest_urls:
-            service_url = adinsertion_service["url"]
-            if hasattr(self.config, "CDN_FQDN"):
-                service_url = service_url.replace(
-                    "stream.broadpeak.io", self.config.CDN_FQDN
-                )
+        generator = self.streaming_url_generator(service_id)
+
+        return [generator.url(url, splice_points) for url in origin_manifest_urls]
 
-            origin_url = urlparse(origin_url)
-            source_url = urlparse(adinsertion_service["source"]["url"])
+    def streaming_url_generator(self, service_id: int) -> StreamingUrlGenerator:
+        """Streaming URL generator of a service, which is only retrieved once"""
+        generator = self._streaming_url_generators.get(str(service_id))
+        if generator is None:
+            # A single known service is retrieved directly, without listing them
+            adinsertion_service = self._get_avod_service(service_id)
+            self.index.add("services", adinsertion_service)
 
-            full_url = "{base}{asset}?bpkio_mids={mids}".format(
-                base=service_url,
-                asset=origin_url.path.replace(source_url.path, ""),
-                mids=",".join([str(i) for i in self.config.SPLICE_POINTS])
-                if hasattr(self.config, "SPLICE_POINTS")
-                else "",
+            generator = StreamingUrlGenerator(
+                service=adinsertion_service,
+                cdn_fqdn=getattr(self.config, "CDN_FQDN", None),
+                splice_points=getattr(self.config, "SPLICE_POINTS", []),
             )
-            streaming_urls.append(full_url)
+            self._streaming_url_generators[str(service_id)] = generator
 
-        return streaming_urls
+        return generator
 
     def _get_wrapper(self, endpoint_url: str):
-        response = requests.get(endpoint_url, headers=self.headers)
+        response = self.session.get(
+            endpoint_url, headers=self.headers, timeout=DEFAULT_TIMEOUT
+        )
         if response.status_code != 200:
             raise Exception(f"Unable to retrieve {endpoint_url}: " + response.text)
 
         return response.json()
 
     def _post_wrapper(self, endpoint_url: str, payload: Dict):
-        response = requests.post(endpoint_url, json=payload, headers=self.headers)
+        response = self.session.post(
+            endpoint_url, json=payload, headers=self.headers, timeout=DEFAULT_TIMEOUT
+        )
         if response.status_code != 201:
             raise Exception(f"Unable to create {endpoint_url}: " + response.text)
         else:
@@ -172,7 +286,10 @@ class BroadpeakIOController:
     def build_transcoding_profile_config(self):
         config = {
             "packaging": {
-                "--hls.client_manifest_version=": "4",
+                # fMP4 segments in HLS need version 7 of the playlists
+                "--hls.client_manifest_version=": (
+                    "7" if getattr(self.config, "USE_CMAF", False) else "4"
+                ),
                 "--hls.minimum_fragment_length=": "4",
             },
             "servicetype": "offline_transcoding",
@@ -202,3 +319,83 @@ class BroadpeakIOController:
             "Ask your broadpeak.io account manager to add the profile above to your account. \n"
             "Then add its identifier in the config.py file, before re-running the script."
         )
+
+
+class AsyncBroadpeakIOController:
+    """Asyncio front of BroadpeakIOController, to provision in bulk.
+
+    This is not an asyncio HTTP client: each call is made by the blocking
+    controller, on one of `max_concurrency` threads, so every call in flight
+    holds an OS thread. The pool caps the number of calls in flight, so that
+    any number of resources can be requested at once. The cap defaults to
+    BPKIO_API_MAX_CONNECTIONS, the size of the controller's connection pool,
+    so that each thread has a kept-alive connection to use.
+    """
+
+    def __init__(
+        self, controller: BroadpeakIOController, max_concurrency: Optional[int] = None
+    ) -> None:
+        self.controller = controller
+        self.max_concurrency = max_concurrency or getattr(
+            controller.config, "BPKIO_API_MAX_CONNECTIONS", 10
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="bpkio-api"
+        )
+
+    async def create_resources(
+        self,
+        service_name: str,
+        origin_urls: List[str],
+        journal: Optional[JobJournal] = None,
+    ) -> Tuple[Dict, Dict, Dict]:
+        (ad_server, asset_catalog) = await asyncio.gather(
+            self._call(self.controller._create_or_retrieve_ad_server, journal=journal),
+            self._call(
+                self.controller._create_or_retrieve_asset_catalog,
+                origin_urls=origin_urls,
+                journal=journal,
+            ),
+        )
+        avod_service = await self._call(
+            self.controller._create_or_retrieve_avod_service,
+            service_name=service_name,
+            ad_server=ad_server,
+            asset_catalog=asset_catalog,
+            journal=journal,
+        )
+
+        return (ad_server, asset_catalog, avod_service)
+
+    async def create_avod_services(
+        self, service_names: List[str], ad_server_id: int, asset_catalog_id: int
+    ) -> List[Dict]:
+        return await asyncio.gather(
+            *[
+                self._call(
+                    self.controller._create_avod_service,
+                    service_name=service_name,
+                    ad_server_id=ad_server_id,
+                    asset_catalog_id=asset_catalog_id,
+                    transcoding_profile_id=self.controller.config.TRANSCODING_PROFILE_ID,
+                )
+                for service_name in service_names
+            ]
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    async def _call(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+
+def _recorded_id(journal: Optional[JobJournal], key: str) -> Optional[str]:
+    return journal.resource_id(key) if journal else None
+
+
+def _record_resource(journal: Optional[JobJournal], key: str, resource_id) -> None:
+    if journal:
+        journal.record_resource(key, resource_id)
@@ -0,0 +1,68 @@
+from typing import Optional
+
+import bitmovin_api_sdk as bm
+
+# Definitions of the codec configurations used by the encodings, shared by the
+# API calls in BitmovinController and by the encoding template compiler
+
+
+def h264_video_configuration(
+    height: int,
+    bitrate: int,
+    profile: bm.ProfileH264,
+    level: bm.LevelH264,
+    rate: Optional[float] = None,
+) -> bm.H264VideoConfiguration:
+    config = bm.H264VideoConfiguration(
+        name="H.264 {0} {1} Mbit/s".format(height, bitrate / (1000 * 1000)),
+        preset_configuration=bm.PresetConfiguration.VOD_STANDARD,
+        height=height,
+        bitrate=bitrate,
+        rate=rate,
+        profile=profile,
+        level=level,
+    )
+
+    # For correct alignment between content and ads, it's critical that the Bitmovin
+    # encoding complies with the selected profile. The following code makes sure of it,
+    # see https://developer.bitmovin.com/encoding/docs/h264-presets#conformance-with-h264-profiles,
+    # written by the author when he was working at Bitmovin ;)
+
+    if profile is bm.ProfileH264.BASELINE:
+        config.adaptive_spatial_transform = False
+        config.bframes = 0
+        config.cabac = False
+        config.weighted_prediction_p_frames = bm.WeightedPredictionPFrames.DISABLED
+
+    if profile is bm.ProfileH264.MAIN:
+        config.adaptive_spatial_transform = False
+
+    if profile is bm.ProfileH264.HIGH:
+        config.adaptive_spatial_transform = True
+
+    return config
+
+
+def aac_audio_configuration(bitrate: int) -> bm.AacAudioConfiguration:
+    return bm.AacAudioConfiguration(
+        name="AAC {0} kbit/s".format(bitrate / 1000), bitrate=bitrate
+    )
+
+
+def webvtt_configuration() -> bm.WebVttConfiguration:
+    return bm.WebVttConfiguration(
+        name="WebVTT",
+        # styling=bm.WebVttStyling(mode=bm.WebVttStylingMode.PASSTHROUGH),
+        cue_identifier_policy=bm.WebVttCueIdentifierPolicy.OMIT_IDENTIFIERS,
+        append_optional_zero_hour=True,
+    )
+
+
+def splice_point_keyframe(time: float) -> bm.Keyframe:
+    keyframe = bm.Keyframe(time=time)
+    # SDK releases before 1.199.0 have segments cut at keyframes on request
+    # only, later ones don't have the option anymore
+    if "segment_cut" in keyframe.attribute_map:
+        keyframe.segment_cut = True
+
+    return keyframe
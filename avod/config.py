@@ -14,6 +14,16 @@ JOB_ID = "avod-conditioned"
 # broadpeak.io API key
 BPKIO_API_KEY = os.getenv("BPKIO_API_KEY")
 
+# Maximum number of connections kept open to the broadpeak.io API, which is
+# also the number of calls in flight when provisioning many services at once.
+# Raise it when provisioning many assets in parallel
+# BPKIO_API_MAX_CONNECTIONS = 10
+
+# Existing broadpeak.io resources identical to the ones the script needs are
+# reused instead of creating duplicates. They are listed once, and the listing
+# is kept for this number of seconds before being revalidated
+# BPKIO_RESOURCE_INDEX_TTL = 300
+
 # ID of the transcoding profile to use.
 # Run this script with the following line commented out to get a profile definition
 # that you can pass to your broadpeak.io account manager to add to your account.
@@ -40,6 +50,24 @@ VAST_TAG = "https://bpkiovast.s3.eu-west-1.amazonaws.com/vastbpkio10s"
 BITMOVIN_API_KEY = os.getenv("BITMOVIN_API_KEY")
 BITMOVIN_TENANT_ORG_ID = os.getenv("BITMOVIN_TENANT_ORG_ID")
 
+# Local cache of the codec configurations created on the Bitmovin account, used to
+# reuse identical configurations across runs instead of creating new ones.
+# Comment out to always create new configurations
+CONFIGURATION_CACHE_PATH = "bitmovin_configurations.sqlite"
+
+# Local journal of the resources created and the phases completed by each job,
+# used to resume a job that failed halfway when it is re-run with the same JOB_ID.
+# Comment out to disable
+JOURNAL_PATH = "jobs_journal.sqlite"
+
+# Optional: receive Bitmovin webhook notifications on an embedded HTTP server
+# to know about encoding status changes immediately, instead of polling for them.
+# The server must be reachable by Bitmovin at the public URL.
+# WEBHOOK_PUBLIC_URL = "https://my-host.example.com:8080"
+# WEBHOOK_LISTEN_PORT = 8080
+# Interval (in seconds) of the status checks that remain as a fallback
+# WEBHOOK_FALLBACK_POLL_INTERVAL = 60
+
 
 # === Source File ===
 SOURCE_FILE_PATH = (
@@ -64,6 +92,18 @@ SOURCE_FILE_PATHS_SUBTITLES = {
 # Ad opportunity placements (expressed in seconds)
 SPLICE_POINTS = [69.91, 257.91, 588.40]
 
+# Set to True to detect the ad opportunity placements instead, by analysing the
+# source with FFmpeg (scene changes, black frames and silences).
+# FFmpeg and FFprobe must be installed locally
+DETECT_SPLICE_POINTS = False
+# Minimum interval (in seconds) between detected splice points
+SPLICE_DETECTION_MIN_SPACING = 120
+# Maximum number of detected splice points. Comment out for no limit
+SPLICE_DETECTION_MAX_COUNT = 5
+# Number of FFmpeg processes analysing the source in parallel.
+# Comment out to use one per CPU core
+# SPLICE_DETECTION_WORKERS = 8
+
 
 # === Origin ===
 # Bitmovin ID of the S3 output bucket where the transcoded files will be stored.
@@ -128,6 +168,12 @@ FRAME_RATE = 24.0
 # Segment duration applies to both HLS and DASH
 SEGMENT_DURATION = 4.0
 
+# Set to True to package HLS and DASH from the same fMP4 (CMAF) segments,
+# instead of writing separate TS segments for HLS. This halves the number of
+# segments stored and cached, but requires players that support HLS with fMP4,
+# and a transcoding profile that packages the ads the same way
+USE_CMAF = False
+
 
 # === Miscellaneous ===
 # Specific language labels for subtitles or audio streams,
@@ -135,3 +181,20 @@ SEGMENT_DURATION = 4.0
 LANGUAGE_LABELS = dict(
     en="English", it="Italiano", fr="Français", de="Deutsch", ar="عربي"
 )
+
+# Maximum number of encodings that the Bitmovin account can run at once,
+# used when encoding a catalog of assets with batch.py
+MAX_CONCURRENT_ENCODINGS = 10
+
+# Local queue of the jobs submitted to the long-running worker (worker.py),
+# and port of its HTTP API, which only listens on the loopback interface
+# WORKER_QUEUE_PATH = "jobs_queue.sqlite"
+# WORKER_PORT = 8090
+
+# Set to True to create and start each encoding with a single Bitmovin
+# encoding template, rather than with one API call per resource
+USE_ENCODING_TEMPLATE = False
+
+# Maximum number of Bitmovin API calls made in parallel
+# when configuring the encoding and its manifests
+MAX_PARALLEL_API_CALLS = 8
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from time import time
+from typing import Callable, Optional, TypeVar
+
+import bitmovin_api_sdk as bm
+
+Configuration = TypeVar("Configuration", bound=bm.CodecConfiguration)
+
+
+class ConfigurationCache:
+    """Local cache of the codec configurations created on the Bitmovin account.
+
+    Configurations are identified by a hash of their parameters, so that a
+    configuration identical to one created by a previous run is reused instead
+    of being created again. Cached IDs are only checked against the API once
+    they are older than `verify_after` seconds, and entries that have not been
+    used for `max_age` seconds (or beyond `max_entries`) are evicted.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        namespace: str = "",
+        verify_after: float = 24 * 3600,
+        max_age: float = 90 * 24 * 3600,
+        max_entries: int = 10_000,
+    ) -> None:
+        self.namespace = namespace
+        self.verify_after = verify_after
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS configurations ("
+            " hash TEXT PRIMARY KEY,"
+            " type TEXT NOT NULL,"
+            " configuration_id TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " verified_at REAL NOT NULL,"
+            " last_used_at REAL NOT NULL)"
+        )
+        self.evict()
+
+    def get_or_create(
+        self,
+        configuration: Configuration,
+        create: Callable[[Configuration], Configuration],
+        get: Callable[[str], Configuration],
+    ) -> Configuration:
+        key = self.hash(configuration)
+        now = time()
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT configuration_id, verified_at FROM configurations "
+                "WHERE hash = ?",
+                (key,),
+            ).fetchone()
+
+        configuration_id = None
+        if row:
+            (configuration_id, verified_at) = row
+            if now - verified_at >= self.verify_after:
+                exists = self._exists(get, configuration_id)
+                if exists:
+                    verified_at = now
+                elif exists is False:
+                    self.invalidate(key)
+                    configuration_id = None
+
+        if configuration_id:
+            with self._lock:
+                self._db.execute(
+                    "UPDATE configurations SET verified_at = ?, last_used_at = ? "
+                    "WHERE hash = ?",
+                    (verified_at, now, key),
+                )
+                self._db.commit()
+                self.hits += 1
+
+            configuration.id = configuration_id
+            return configuration
+
+        created = create(configuration)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO configurations VALUES (?, ?, ?, ?, ?, ?)",
+                (key, type(configuration).__name__, created.id, now, now, now),
+            )
+            self._db.commit()
+            self.misses += 1
+
+        return created
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Remove one entry, or the whole cache if no key is given"""
+        with self._lock:
+            if key is None:
+                cursor = self._db.execute("DELETE FROM configurations")
+            else:
+                cursor = self._db.execute(
+                    "DELETE FROM configurations WHERE hash = ?", (key,)
+                )
+            self._db.commit()
+            self.invalidations += cursor.rowcount
+
+    def evict(self) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM configurations WHERE last_used_at < ?",
+                (time() - self.max_age,),
+            )
+            self._db.execute(
+                "DELETE FROM configurations WHERE hash NOT IN ("
+                " SELECT hash FROM configurations"
+                " ORDER BY last_used_at DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def hash(self, configuration: bm.CodecConfiguration) -> str:
+        parameters = {
+            k: v
+            for k, v in configuration.to_dict().items()
+            if k not in ("id", "createdAt", "modifiedAt")
+        }
+        canonical = json.dumps(
+            [self.namespace, type(configuration).__name__, parameters],
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def stats(self) -> str:
+        return "{0} hits, {1} misses, {2} invalidations".format(
+            self.hits, self.misses, self.invalidations
+        )
+
+    def _exists(
+        self, get: Callable[[str], Configuration], configuration_id: str
+    ) -> Optional[bool]:
+        """Whether a configuration still exists, or None if that can't be told
+        (eg. rate limiting, server or network errors), in which case the cached
+        ID is kept and verified again next time"""
+        try:
+            get(configuration_id)
+            return True
+        except bm.BitmovinError as e:
+            if e.http_status_code == 404 or "not found" in str(e).lower():
+                return False
+            print(f"Could not verify cached configuration {configuration_id}: {e}")
+            return None
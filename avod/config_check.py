@@ -0,0 +1,57 @@
+from typing import List
+
+S3_OUTPUT_SETTINGS = [
+    "S3_OUTPUT_BUCKET_NAME",
+    "S3_OUTPUT_ACCESS_KEY",
+    "S3_OUTPUT_SECRET_KEY",
+]
+
+
+def check_config(cfg) -> List[str]:
+    """Problems with a config file, found without calling any API.
+
+    Returns an empty list if the config is complete enough to run the playbook.
+    """
+    problems = []
+
+    for name in ["BITMOVIN_API_KEY", "BPKIO_API_KEY"]:
+        if not getattr(cfg, name, None):
+            problems.append(f"{name} is not set (see the environment variables)")
+
+    if not hasattr(cfg, "TRANSCODING_PROFILE_ID"):
+        problems.append("TRANSCODING_PROFILE_ID is not set")
+
+    if not hasattr(cfg, "AD_SERVER_ID") and not getattr(cfg, "VAST_TAG", None):
+        problems.append("Either AD_SERVER_ID or VAST_TAG must be set")
+
+    if not hasattr(cfg, "S3_OUTPUT_ID"):
+        missing = [n for n in S3_OUTPUT_SETTINGS if not getattr(cfg, n, None)]
+        if missing:
+            problems.append(
+                "Either S3_OUTPUT_ID or {0} must be set".format(", ".join(missing))
+            )
+
+    for name in ["SOURCE_FILE_PATH", "SOURCE_FILE_PATH_VIDEO"]:
+        if not getattr(cfg, name, None):
+            problems.append(f"{name} is not set")
+
+    for name in ["VIDEO_LADDER", "AUDIO_LADDER"]:
+        if not getattr(cfg, name, None):
+            problems.append(f"{name} must have at least one rung")
+
+    for name in ["FRAME_RATE", "SEGMENT_DURATION"]:
+        if not isinstance(getattr(cfg, name, None), (int, float)):
+            problems.append(f"{name} must be a number")
+
+    splice_points = getattr(cfg, "SPLICE_POINTS", [])
+    if list(splice_points) != sorted(splice_points):
+        problems.append("SPLICE_POINTS must be in ascending order")
+
+    return problems
+
+
+def describe_problems(problems: List[str]) -> str:
+    if not problems:
+        return "The config file is complete"
+
+    return "The config file needs fixing:\n" + "\n".join(f"- {p}" for p in problems)
@@ -0,0 +1,134 @@
+import argparse
+import importlib
+import threading
+import uuid
+from time import perf_counter, sleep
+from types import SimpleNamespace
+
+import bitmovin_api_sdk as bm
+from bitmovin import BitmovinController
+
+
+class StubEndpoint:
+    """Stand-in for any endpoint of the Bitmovin SDK client.
+
+    `create` calls wait for `latency` seconds, like a remote API would, and
+    return the resource they are given with a new ID. Calls are counted.
+    """
+
+    def __init__(self, latency: float, counter: "CallCounter") -> None:
+        self._latency = latency
+        self._counter = counter
+
+    def __getattr__(self, name: str) -> "StubEndpoint":
+        if name.startswith("_"):
+            raise AttributeError(name)
+        endpoint = StubEndpoint(self._latency, self._counter)
+        setattr(self, name, endpoint)
+        return endpoint
+
+    def create(self, *args, **kwargs):
+        sleep(self._latency)
+        self._counter.increment()
+
+        resource = next(
+            value
+            for value in [*args, *kwargs.values()]
+            if hasattr(value, "attribute_map")
+        )
+        resource.id = str(uuid.uuid4())
+        return resource
+
+
+class CallCounter:
+    def __init__(self) -> None:
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def increment(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+
+def configure(cfg, latency: float, max_parallel_api_calls: int):
+    """Configure the encoding of the config file against a stub of the SDK
+    client, and return how long it took and the number of calls made"""
+    # No configuration cache, so that every run makes all the calls
+    settings = {
+        k: v
+        for (k, v) in vars(cfg).items()
+        if k not in ("CONFIGURATION_CACHE_PATH", "WEBHOOK_PUBLIC_URL")
+    }
+    stub_cfg = SimpleNamespace(
+        **dict(
+            settings,
+            BITMOVIN_API_KEY="stub",
+            MAX_PARALLEL_API_CALLS=max_parallel_api_calls,
+        )
+    )
+
+    counter = CallCounter()
+    controller = BitmovinController(config=stub_cfg)
+    controller.encoding_api = StubEndpoint(latency, counter)
+    controller.dash_api = controller.encoding_api.manifests.dash
+    controller.hls_api = controller.encoding_api.manifests.hls
+    controller._input = bm.HttpsInput(host="stub")
+    controller._input.id = "input"
+    controller._output = bm.S3Output(bucket_name="stub")
+    controller._output.id = "output"
+
+    start = perf_counter()
+    controller.configure_encoding(
+        name="benchmark",
+        source_path="/source",
+        source_video_file=cfg.SOURCE_FILE_PATH_VIDEO,
+        source_audio_files=cfg.SOURCE_FILE_PATHS_AUDIO,
+        source_subtitle_files=cfg.SOURCE_FILE_PATHS_SUBTITLES,
+        output_sub_path="benchmark",
+    )
+    return (perf_counter() - start, counter.calls)
+
+
+def main():
+    args = parse_arguments()
+
+    cfg = importlib.import_module(args.config)
+
+    (sequential, calls) = configure(cfg, args.latency, max_parallel_api_calls=1)
+    print(f"One call at a time: {sequential:.2f}s for {calls} calls")
+
+    parallel_calls = args.max_parallel_api_calls or getattr(
+        cfg, "MAX_PARALLEL_API_CALLS", 8
+    )
+    (parallel, calls) = configure(cfg, args.latency, parallel_calls)
+    print(
+        "{0} calls at a time: {1:.2f}s for {2} calls ({3:.1f}x faster)".format(
+            parallel_calls, parallel, calls, sequential / parallel
+        )
+    )
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Compare the configuration of an encoding with one API call "
+        "at a time and in parallel, against a stub of the Bitmovin API"
+    )
+    parser.add_argument("-c", "--config", help="path to config file", default="config")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.05,
+        help="simulated latency of an API call, in seconds",
+    )
+    parser.add_argument(
+        "--max-parallel-api-calls",
+        type=int,
+        help="number of calls in flight "
+        "(defaults to MAX_PARALLEL_API_CALLS in the config file)",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+from types import SimpleNamespace
+from typing import Callable
+
+import requests
+from broadpeak import AsyncBroadpeakIOController, BroadpeakIOController
+from http_session import DEFAULT_TIMEOUT, create_session
+
+
+def main():
+    args = parse_arguments()
+
+    server = StandInServer(throttle_every=args.throttle_every, latency=args.latency)
+    server.start()
+
+    if args.provision:
+        compare_provisioning(server, args.provision, args.concurrency)
+        server.stop()
+        return
+
+    url = f"http://127.0.0.1:{server.port}/v1/sources/asset-catalog"
+
+    def bare_request(method: str) -> requests.Response:
+        return requests.request(method, url, json={}, timeout=DEFAULT_TIMEOUT)
+
+    session = create_session(pool_size=args.concurrency, backoff_factor=0)
+
+    def pooled_request(method: str) -> requests.Response:
+        return session.request(method, url, json={}, timeout=DEFAULT_TIMEOUT)
+
+    for method in ["GET", "POST"]:
+        for name, send in [("bare", bare_request), ("pooled", pooled_request)]:
+            server.reset()
+            (rate, failed) = run(send, method, args.requests, args.concurrency)
+            print(
+                "{0:<4} {1:<6}: {2:>7.0f} requests/s, {3} failed, "
+                "{4} new connections, {5} resources created".format(
+                    method, name, rate, failed, server.connections, server.created
+                )
+            )
+
+    server.stop()
+
+
+def compare_provisioning(server, count: int, concurrency: int):
+    config = SimpleNamespace(
+        BPKIO_API_KEY="stand-in",
+        BPKIO_API_BASE_URL=f"http://127.0.0.1:{server.port}",
+        BPKIO_API_MAX_CONNECTIONS=concurrency,
+        TRANSCODING_PROFILE_ID=1,
+    )
+    controller = BroadpeakIOController(config)
+    names = [f"Service {i}" for i in range(count)]
+
+    # The sequential run is extrapolated from a sample, it takes too long
+    sample = min(count, 20)
+    server.reset()
+    start = perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name in names[:sample]:
+            controller._create_avod_service(
+                service_name=name,
+                ad_server_id=1,
+                asset_catalog_id=1,
+                transcoding_profile_id=config.TRANSCODING_PROFILE_ID,
+            )
+    sequential = (perf_counter() - start) * count / sample
+    print(f"sequential: {sequential:>7.1f}s for {count} services (extrapolated)")
+
+    server.reset()
+    async_controller = AsyncBroadpeakIOController(controller, concurrency)
+    start = perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(
+            async_controller.create_avod_services(
+                service_names=names, ad_server_id=1, asset_catalog_id=1
+            )
+        )
+    concurrent = perf_counter() - start
+    async_controller.close()
+    print(
+        f"async     : {concurrent:>7.1f}s for {count} services, "
+        f"{server.created} created, {server.connections} connections"
+    )
+
+
+def run(
+    send: Callable[[str], requests.Response],
+    method: str,
+    count: int,
+    concurrency: int,
+):
+    def call(_):
+        try:
+            return send(method).status_code < 400
+        except requests.RequestException:
+            return False
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(count)))
+
+    return (count / (perf_counter() - start), results.count(False))
+
+
+class StandInServer:
+    """Local stand-in for the broadpeak.io API.
+
+    Answers every GET with a resource and every POST with a created one, and
+    counts connections and created resources. With `throttle_every`, every Nth
+    request is rate limited with a 429 response and a Retry-After header.
+    Every response is delayed by `latency` seconds, like a remote API would.
+    """
+
+    def __init__(self, throttle_every: int = 0, latency: float = 0) -> None:
+        self.throttle_every = throttle_every
+        self.latency = latency
+        self._lock = threading.Lock()
+        self.reset()
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Responses are written in two parts (headers, body), which would
+            # otherwise be delayed on kept-alive connections
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+                with stand_in._lock:
+                    stand_in.connections += 1
+
+            def do_GET(self):
+                self._respond(200)
+
+            def do_POST(self):
+                self._respond(201)
+
+            def _respond(self, status: int):
+                self.rfile.read(int(self.headers.get("content-length", 0)))
+                if stand_in.latency:
+                    sleep(stand_in.latency)
+
+                with stand_in._lock:
+                    stand_in.requests += 1
+                    throttled = (
+                        stand_in.throttle_every
+                        and stand_in.requests % stand_in.throttle_every == 0
+                    )
+                    if status == 201 and not throttled:
+                        stand_in.created += 1
+
+                body = json.dumps({"id": stand_in.requests}).encode()
+                self.send_response(429 if throttled else status)
+                if throttled:
+                    self.send_header("retry-after", "0")
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+    def reset(self) -> None:
+        with self._lock:
+            self.connections = 0
+            self.requests = 0
+            self.created = 0
+
+    def start(self) -> None:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Compare bare and pooled HTTP calls, or sequential and async "
+        "provisioning, against a local stand-in for the broadpeak.io API"
+    )
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--throttle-every",
+        type=int,
+        default=0,
+        help="rate limit every Nth request, to exercise the retries",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0,
+        help="delay of each response of the stand-in API, in seconds",
+    )
+    parser.add_argument(
+        "--provision",
+        type=int,
+        default=0,
+        help="compare sequential and async creation of this number of services",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
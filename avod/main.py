@@ -2,11 +2,15 @@ import argparse
 import importlib
 import random
 import string
+import sys
 from os import path
-from urllib.parse import urlparse
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
 
-from bitmovin import BitmovinController
-from broadpeak import BroadpeakIOController
+from config_check import check_config, describe_problems
+from executor import Ref, ResourceGraph
+from journal import JobJournal, job_fingerprint
+from splice_detection import create_splice_detector
 
 
 def main():
@@ -14,63 +18,316 @@ def main():
 
     cfg = importlib.import_module(args.config)
 
-    # Initialising the broadpeak.io APIs
-    broadpeakio = BroadpeakIOController(config=cfg)
+    if args.transcoding_profile:
+        from broadpeak import BroadpeakIOController
 
-    # Initalising the Bitmovin SDK
-    bitmovin = BitmovinController(config=cfg)
+        BroadpeakIOController(config=cfg).build_transcoding_profile_config()
+        return
+
+    # Checking the config before creating anything
+    problems = check_config(cfg)
+    if args.check_config:
+        print(describe_problems(problems))
+        sys.exit(1 if problems else 0)
+    if problems and not args.offline:
+        print(describe_problems(problems))
+        if not hasattr(cfg, "TRANSCODING_PROFILE_ID"):
+            from broadpeak import BroadpeakIOController
+
+            BroadpeakIOController(config=cfg).build_transcoding_profile_config()
+        sys.exit(1)
 
-    # Defining some names for resources
-    asset_name = path.splitext(path.basename(cfg.SOURCE_FILE_PATH_VIDEO))[0]
     if hasattr(cfg, "JOB_ID"):
         uid = cfg.JOB_ID
     else:
         uid = generate_random_string()
 
+    # Resuming the job where a previous run left it, if any
+    journal = None
+    if hasattr(cfg, "JOURNAL_PATH") and not args.offline:
+        journal = JobJournal(
+            db_path=cfg.JOURNAL_PATH,
+            job_id=uid,
+            fingerprint=job_fingerprint(
+                cfg,
+                video=cfg.SOURCE_FILE_PATH_VIDEO,
+                audio=cfg.SOURCE_FILE_PATHS_AUDIO,
+                subtitles=cfg.SOURCE_FILE_PATHS_SUBTITLES,
+            ),
+        )
+        if not hasattr(cfg, "JOB_ID"):
+            print("Note: set a JOB_ID in the config file to be able to resume this job")
+
+    if args.offline:
+        from offline import OfflineBitmovinController, OfflineBroadpeakIOController
+
+        broadpeakio = OfflineBroadpeakIOController(
+            config=cfg, api_latency=args.offline_api_latency
+        )
+        bitmovin = OfflineBitmovinController(
+            config=cfg,
+            api_latency=args.offline_api_latency,
+            encoding_duration=args.offline_encoding_duration,
+        )
+    else:
+        from bitmovin import BitmovinController
+        from broadpeak import BroadpeakIOController
+
+        # Initialising the broadpeak.io APIs
+        broadpeakio = BroadpeakIOController(config=cfg)
+
+        # Initalising the Bitmovin SDK
+        bitmovin = BitmovinController(config=cfg, journal=journal)
+
+    # Defining some names for resources
+    asset_name = path.splitext(path.basename(cfg.SOURCE_FILE_PATH_VIDEO))[0]
+
     encoding_name = f"{asset_name} - {uid}"
     output_prefix = f"{asset_name}/{uid}"
     ssai_service_name = f"AVOD w/ Bitmovin encoding and Ad Proxy - {uid}"
 
-    # Encoding and packaging the asset with Bitmovin
-    print("Configuring and starting the Bitmovin encoder")
-    (_, manifests) = bitmovin.encode_and_package(
+    # The encoding and the broadpeak.io provisioning only share the manifest
+    # URLs, which are known as soon as the encoding is configured: the services
+    # are created while the asset is being encoded
+    graph = ResourceGraph(max_workers=4)
+    graph.add("splice_points", place_splice_points, cfg=cfg, journal=journal)
+
+    if journal and journal.phase_status("encode"):
+        # The encoding of a previous run writes to the same place
+        graph.add(
+            "configure",
+            lambda: (None, journal.phase_data("encode")["manifest_urls"]),
+        )
+    else:
+        graph.add(
+            "configure",
+            configure_encoding,
+            bitmovin=bitmovin,
+            cfg=cfg,
+            journal=journal,
+            name=encoding_name,
+            output_sub_path=output_prefix,
+            splice_points=Ref("splice_points"),
+        )
+
+    graph.add(
+        "encode",
+        encode,
+        bitmovin=bitmovin,
+        cfg=cfg,
+        journal=journal,
+        configured=Ref("configure"),
         name=encoding_name,
+        output_sub_path=output_prefix,
+        splice_points=Ref("splice_points"),
+    )
+    graph.add(
+        "provision",
+        provision,
+        broadpeakio=broadpeakio,
+        journal=journal,
+        configured=Ref("configure"),
+        service_name=ssai_service_name,
+        splice_points=Ref("splice_points"),
+    )
+    graph.run()
+
+    if bitmovin.configuration_cache:
+        print(f"Configuration cache: {bitmovin.configuration_cache.stats()}")
+
+    streaming_urls = graph.results["provision"]
+    print("broadpeak.io streaming URLs: ")
+    for url in streaming_urls:
+        print(f"- {url}")
+
+    print("Stages:")
+    print(graph.report())
+    (_, encoded_at) = graph.timings["encode"]
+    (_, provisioned_at) = graph.timings["provision"]
+    if provisioned_at <= encoded_at:
+        print(
+            "Streaming URLs ready {0:.1f}s before the end of the encoding".format(
+                encoded_at - provisioned_at
+            )
+        )
+    else:
+        print(
+            "Streaming URLs ready {0:.1f}s after the end of the encoding".format(
+                provisioned_at - encoded_at
+            )
+        )
+
+    print("All done!")
+    if journal:
+        journal.complete_phase("streaming_urls", streaming_urls=streaming_urls)
+        print(
+            f"Note: the resources of job {uid} are recorded in {cfg.JOURNAL_PATH}, "
+            "re-running this script with the same JOB_ID reuses them"
+        )
+    elif not args.offline:
+        print(
+            "Note: to be able to re-run this script with error, "
+            "plug the relevant Bitmovin and broadpeak.io resource IDs listed above "
+            "into the appropriate constants in the config.py file"
+        )
+
+
+def place_splice_points(cfg, journal: Optional[JobJournal]) -> List[float]:
+    """Ad breaks, as defined in the config file or by analysing the source"""
+    splice_points = getattr(cfg, "SPLICE_POINTS", [])
+    if getattr(cfg, "DETECT_SPLICE_POINTS", False):
+        if journal and journal.is_completed("detect_splice_points"):
+            splice_points = journal.phase_data("detect_splice_points")["splice_points"]
+        else:
+            print("Detecting splice points in the source")
+            detector = create_splice_detector(cfg)
+            splice_points = detector.detect(
+                urljoin(cfg.SOURCE_FILE_PATH, cfg.SOURCE_FILE_PATH_VIDEO)
+            )
+            detector.close()
+            if journal:
+                journal.complete_phase(
+                    "detect_splice_points", splice_points=splice_points
+                )
+    print(f"Splice points: {splice_points}")
+
+    return splice_points
+
+
+def configure_encoding(
+    bitmovin,
+    cfg,
+    journal: Optional[JobJournal],
+    name: str,
+    output_sub_path: str,
+    splice_points: List[float],
+) -> Tuple[Callable, List[str]]:
+    """Configure the encoding of the asset, without starting it.
+
+    Returns the function that starts the encoding and waits until it is
+    finished, and the manifest URLs it will write.
+    """
+    print("Configuring the Bitmovin encoder")
+    source = dict(
+        name=name,
         source_path=urlparse(cfg.SOURCE_FILE_PATH).path,
         source_video_file=cfg.SOURCE_FILE_PATH_VIDEO,
         source_audio_files=cfg.SOURCE_FILE_PATHS_AUDIO,
         source_subtitle_files=cfg.SOURCE_FILE_PATHS_SUBTITLES,
-        output_sub_path=output_prefix,
+        output_sub_path=output_sub_path,
+        splice_points=splice_points,
     )
 
+    if getattr(cfg, "USE_ENCODING_TEMPLATE", False):
+        (template, manifests) = bitmovin.compile_encoding_template(**source)
+
+        def execute():
+            bitmovin.execute_encoding_template(
+                name=name, template=template, manifests=manifests
+            )
+
+    else:
+        (encoding, start_encoding_request, manifests) = bitmovin.configure_encoding(
+            **source
+        )
+        if journal:
+            bitmovin.record_encoding(
+                journal=journal, encoding=encoding, manifests=manifests
+            )
+
+        def execute():
+            bitmovin.execute_encoding(
+                encoding=encoding, start_encoding_request=start_encoding_request
+            )
+
+    manifest_urls = [bitmovin.determine_origin_url(m) for m in manifests]
+
     # List the outputs
     print("Outputs:")
-    manifest_urls = []
-    for manifest in manifests:
-        manifest_url = bitmovin.determine_origin_url(manifest)
+    for manifest_url in manifest_urls:
         print("Manifest URL: " + manifest_url)
-        manifest_urls.append(manifest_url)
 
-    # Creating the broadpeak.io resources
-    print("broadpeak.io resources:")
-    (ad_server, asset_catalog, service) = broadpeakio.create_resources(
-        origin_urls=manifest_urls, service_name=ssai_service_name
-    )
+    return (execute, manifest_urls)
 
-    # Calculating the streaming URLs
-    streaming_urls = broadpeakio.calculate_streaming_urls(
-        service_id=service["id"], origin_manifest_urls=manifest_urls
-    )
 
-    print("broadpeak.io streaming URLs: ")
-    for url in streaming_urls:
-        print(f"- {url}")
+def encode(
+    bitmovin,
+    cfg,
+    journal: Optional[JobJournal],
+    configured: Tuple[Optional[Callable], List[str]],
+    name: str,
+    output_sub_path: str,
+    splice_points: List[float],
+) -> List[str]:
+    """Encode and package the asset with Bitmovin, and return its manifest URLs"""
+    (execute, manifest_urls) = configured
+    if execute is None:
+        resumed_urls = bitmovin.resume_encoding(journal)
+        if resumed_urls is not None:
+            return resumed_urls
 
-    print("All done!")
-    print(
-        "Note: to be able to re-run this script with error, "
-        "plug the relevant Bitmovin and broadpeak.io resource IDs listed above "
-        "into the appropriate constants in the config.py file"
-    )
+        # The encoding of the previous run failed, it is replaced by a new one
+        (execute, manifest_urls) = configure_encoding(
+            bitmovin=bitmovin,
+            cfg=cfg,
+            journal=journal,
+            name=name,
+            output_sub_path=output_sub_path,
+            splice_points=splice_points,
+        )
+
+    print("Starting the Bitmovin encoder")
+    execute()
+    if journal:
+        journal.complete_phase("encode")
+
+    return manifest_urls
+
+
+def provision(
+    broadpeakio,
+    journal: Optional[JobJournal],
+    configured: Tuple[Optional[Callable], List[str]],
+    service_name: str,
+    splice_points: List[float],
+) -> List[str]:
+    """Create the broadpeak.io resources, and return the streaming URLs.
+
+    A failure is reported straight away, although it is only raised once the
+    encoding running alongside is over.
+    """
+    (_, manifest_urls) = configured
+
+    print("Creating the broadpeak.io resources")
+    try:
+        if journal and journal.is_completed("provision"):
+            service_id = journal.phase_data("provision")["service_id"]
+            print(f"Reusing AVOD service {service_id}")
+        else:
+            (ad_server, asset_catalog, service) = broadpeakio.create_resources(
+                origin_urls=manifest_urls, service_name=service_name, journal=journal
+            )
+            service_id = service["id"]
+            if journal:
+                journal.complete_phase("provision", service_id=service_id)
+
+        # Calculating the streaming URLs
+        return broadpeakio.calculate_streaming_urls(
+            service_id=service_id,
+            origin_manifest_urls=manifest_urls,
+            splice_points=splice_points,
+        )
+    except Exception as e:
+        print(f"Creating the broadpeak.io resources failed: {e}")
+        if journal:
+            print(
+                "The encoding goes on and is recorded in the journal: once the "
+                "problem is fixed, re-running this script with the same JOB_ID "
+                "only creates the broadpeak.io resources"
+            )
+        else:
+            print("The encoding goes on, but no streaming URLs will be produced")
+        raise
 
 
 # get random string of letters and digits
@@ -84,6 +341,35 @@ def generate_random_string(length=8):
 def parse_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument("-c", "--config", help="path to config file", default="config")
+    parser.add_argument(
+        "--check-config",
+        action="store_true",
+        help="check the config file without calling any API, and exit",
+    )
+    parser.add_argument(
+        "--transcoding-profile",
+        action="store_true",
+        help="print the broadpeak.io transcoding profile matching the config file",
+    )
+    parser.add_argument(
+        "--offline",
+        "--dry-run",
+        action="store_true",
+        help="simulate the Bitmovin and broadpeak.io APIs instead of calling them, "
+        "to report the timing of each stage",
+    )
+    parser.add_argument(
+        "--offline-api-latency",
+        type=float,
+        default=0.1,
+        help="simulated latency of an API call, in seconds",
+    )
+    parser.add_argument(
+        "--offline-encoding-duration",
+        type=float,
+        default=5.0,
+        help="simulated duration of the encoding, in seconds",
+    )
     return parser.parse_args()
 
 
@@ -0,0 +1,185 @@
+import threading
+import uuid
+from collections import namedtuple
+from time import sleep
+from typing import Dict, List, Optional, Tuple
+
+from journal import JobJournal
+from streaming_urls import StreamingUrlGenerator
+
+# Minimal stand-ins for the Bitmovin resources used outside of the controllers
+Encoding = namedtuple("Encoding", "id name")
+EncodingOutput = namedtuple("EncodingOutput", "output_path")
+Manifest = namedtuple("Manifest", "id outputs manifest_name")
+
+# Depth of the resource graph built by BitmovinController.configure_encoding,
+# ie. the number of successive API round trips it takes to configure an encoding
+CONFIGURATION_ROUND_TRIPS = 6
+
+
+class OfflineBitmovinController:
+    """Stand-in for BitmovinController that makes no API call.
+
+    API calls and encodings are simulated with fixed latencies, which allows
+    the batch scheduler to be exercised with large numbers of synthetic jobs.
+    The peak number of simultaneously running encodings is recorded, to check
+    it against the account's limit.
+    """
+
+    def __init__(
+        self, config, api_latency: float = 0.1, encoding_duration: float = 5.0
+    ) -> None:
+        self.config = config
+        self.api_latency = api_latency
+        self.encoding_duration = encoding_duration
+        self.configuration_cache = None
+
+        self.running_encodings = 0
+        self.peak_running_encodings = 0
+        self._lock = threading.Lock()
+
+    def encode_and_package(
+        self,
+        name: str,
+        source_path: str,
+        source_video_file: str,
+        source_audio_files: Dict[str, str],
+        source_subtitle_files: Dict[str, str],
+        output_sub_path: str,
+        splice_points: Optional[List[float]] = None,
+    ) -> Tuple[Encoding, List[Manifest]]:
+        (encoding, start_encoding_request, manifests) = self.configure_encoding(
+            name=name,
+            source_path=source_path,
+            source_video_file=source_video_file,
+            source_audio_files=source_audio_files,
+            source_subtitle_files=source_subtitle_files,
+            output_sub_path=output_sub_path,
+            splice_points=splice_points,
+        )
+
+        self.execute_encoding(
+            encoding=encoding, start_encoding_request=start_encoding_request
+        )
+
+        return (encoding, manifests)
+
+    def configure_encoding(
+        self,
+        name: str,
+        source_path: str,
+        source_video_file: str,
+        source_audio_files: Dict[str, str],
+        source_subtitle_files: Dict[str, str],
+        output_sub_path: str,
+        splice_points: Optional[List[float]] = None,
+    ) -> Tuple[Encoding, None, List[Manifest]]:
+        sleep(self.api_latency * CONFIGURATION_ROUND_TRIPS)
+
+        output_path = f"{self.config.S3_OUTPUT_BASE_PATH}{output_sub_path}"
+        manifests = [
+            Manifest(
+                id=str(uuid.uuid4()),
+                outputs=[EncodingOutput(output_path=output_path)],
+                manifest_name=manifest_name,
+            )
+            for manifest_name in ["stream.m3u8", "stream.mpd"]
+        ]
+
+        return (Encoding(id=str(uuid.uuid4()), name=name), None, manifests)
+
+    def execute_encoding(self, encoding: Encoding, start_encoding_request) -> None:
+        with self._lock:
+            self.running_encodings += 1
+            self.peak_running_encodings = max(
+                self.peak_running_encodings, self.running_encodings
+            )
+
+        try:
+            sleep(self.api_latency + self.encoding_duration)
+        finally:
+            with self._lock:
+                self.running_encodings -= 1
+
+    def resume_encoding(self, journal: JobJournal) -> Optional[List[str]]:
+        # Simulated encodings don't outlive the process, only finished ones count
+        if journal.is_completed("encode"):
+            return journal.phase_data("encode")["manifest_urls"]
+
+        return None
+
+    def record_encoding(
+        self, journal: JobJournal, encoding: Encoding, manifests: List[Manifest]
+    ) -> None:
+        journal.record_resource("encoding", encoding.id)
+        journal.start_phase(
+            "encode",
+            encoding_id=encoding.id,
+            manifest_urls=[self.determine_origin_url(m) for m in manifests],
+        )
+
+    def determine_origin_url(self, resource: Manifest) -> str:
+        baseurl = "https://offline-bucket.s3.amazonaws.com/"
+
+        return "/".join(
+            p.strip("/")
+            for p in [baseurl, resource.outputs[0].output_path, resource.manifest_name]
+        )
+
+
+class OfflineBroadpeakIOController:
+    """Stand-in for BroadpeakIOController that makes no API call"""
+
+    def __init__(self, config, api_latency: float = 0.1) -> None:
+        self.config = config
+        self.api_latency = api_latency
+        self._streaming_url_generator = None
+
+    def create_resources(
+        self,
+        service_name: str,
+        origin_urls: List[str],
+        journal: Optional[JobJournal] = None,
+    ) -> Tuple[Dict, Dict, Dict]:
+        sleep(self.api_latency * 3)
+
+        url = origin_urls[0]
+        pos = url.find(self.config.S3_OUTPUT_BASE_PATH) + len(
+            self.config.S3_OUTPUT_BASE_PATH
+        )
+        ad_server = {"id": 1, "name": "AdProxy VMAP Generator"}
+        asset_catalog = {"id": 2, "name": "Bitmovin AVOD outputs", "url": url[:pos]}
+        avod_service = {
+            "id": 3,
+            "name": service_name,
+            "url": "https://stream.broadpeak.io/offline/",
+            "source": asset_catalog,
+        }
+
+        return (ad_server, asset_catalog, avod_service)
+
+    def calculate_streaming_urls(
+        self,
+        service_id: int,
+        origin_manifest_urls: List[str],
+        splice_points: Optional[List[float]] = None,
+    ) -> List[str]:
+        generator = self.streaming_url_generator(service_id)
+
+        return [generator.url(url, splice_points) for url in origin_manifest_urls]
+
+    def streaming_url_generator(self, service_id: int) -> StreamingUrlGenerator:
+        if self._streaming_url_generator is None:
+            sleep(self.api_latency)
+            self._streaming_url_generator = StreamingUrlGenerator(
+                service={
+                    "url": "https://stream.broadpeak.io/offline",
+                    "source": {
+                        "url": "https://offline-bucket.s3.amazonaws.com/"
+                        + self.config.S3_OUTPUT_BASE_PATH.strip("/")
+                    },
+                },
+                splice_points=getattr(self.config, "SPLICE_POINTS", []),
+            )
+
+        return self._streaming_url_generator
@@ -0,0 +1,177 @@
+import threading
+from time import time
+from typing import Callable, Dict, List, Optional
+
+import requests
+from http_session import DEFAULT_TIMEOUT
+
+# Endpoints listing each kind of resource
+ENDPOINTS = {
+    "ad_servers": "/v1/sources/ad-server",
+    "asset_catalogs": "/v1/sources/asset-catalog",
+    "live_sources": "/v1/sources/live",
+    "services": "/v1/services/ad-insertion",
+}
+
+# Fields resources can be looked up by in constant time
+INDEXED_FIELDS = ("id", "name", "url", "template")
+
+
+class ResourceIndex:
+    """Local index of the resources existing on the broadpeak.io account.
+
+    Each kind of resource is listed once, page by page, and indexed by ID, name,
+    URL and template, so that finding a resource to reuse makes no API call.
+    Listings are kept for `ttl` seconds, and then revalidated page by page with
+    the ETags of the previous listing, so that unchanged pages aren't downloaded
+    again. Resources created in the meantime are added with `add`.
+    """
+
+    def __init__(
+        self,
+        session: requests.Session,
+        headers: Dict[str, str],
+        api_base_url: str,
+        ttl: float = 300,
+        page_size: int = 200,
+    ) -> None:
+        self.session = session
+        self.headers = headers
+        self.api_base_url = api_base_url
+        self.ttl = ttl
+        self.page_size = page_size
+
+        self.requests = 0
+        self.not_modified = 0
+
+        self._lock = threading.Lock()
+        self._pages: Dict[str, List[Dict]] = {}
+        self._fetched_at: Dict[str, float] = {}
+        self._indexes: Dict[str, Dict] = {}
+
+    def find(
+        self,
+        kind: str,
+        where: Optional[Callable[[Dict], bool]] = None,
+        **fields,
+    ) -> Optional[Dict]:
+        """First resource with the given field values, eg. find("ad_servers",
+        name="My ad server", template="custom"), and for which `where` is true.
+        At least one of the fields must be indexed. Values that are dicts only
+        need to match the fields they list, eg. source={"id": 12}.
+        """
+        indexed = [f for f in fields if f in INDEXED_FIELDS]
+        if not indexed:
+            raise Exception(f"Resources can only be found by {INDEXED_FIELDS}")
+
+        with self._lock:
+            index = self._index(kind)
+            candidates = index.get((indexed[0], _key(fields[indexed[0]])), [])
+
+        for resource in candidates:
+            if all(_matches(resource.get(f), v) for (f, v) in fields.items()) and (
+                where is None or where(resource)
+            ):
+                return resource
+
+        return None
+
+    def get(self, kind: str, id) -> Optional[Dict]:
+        with self._lock:
+            resources = self._index(kind).get(("id", _key(id)), [])
+
+        return resources[0] if resources else None
+
+    def add(self, kind: str, resource: Dict) -> None:
+        """Add a resource created or retrieved since the listing, or update it"""
+        with self._lock:
+            if kind not in self._indexes:
+                return
+            index = self._indexes[kind]
+            for previous in index.pop(("id", _key(resource["id"])), []):
+                for field in INDEXED_FIELDS:
+                    if field != "id" and previous.get(field) is not None:
+                        bucket = index.get((field, _key(previous[field])), [])
+                        if previous in bucket:
+                            bucket.remove(previous)
+            _index_resource(index, resource)
+
+    def invalidate(self, kind: Optional[str] = None) -> None:
+        """Make the next lookups revalidate the listings"""
+        with self._lock:
+            for k in [kind] if kind else list(self._fetched_at):
+                self._fetched_at.pop(k, None)
+
+    def stats(self) -> str:
+        return f"{self.requests} requests, {self.not_modified} pages not modified"
+
+    def _index(self, kind: str) -> Dict:
+        if time() - self._fetched_at.get(kind, 0) >= self.ttl:
+            self._refresh(kind)
+
+        return self._indexes[kind]
+
+    def _refresh(self, kind: str) -> None:
+        endpoint_url = self.api_base_url + ENDPOINTS[kind]
+        previous_pages = self._pages.get(kind, [])
+        pages = []
+
+        while True:
+            number = len(pages)
+            previous = previous_pages[number] if number < len(previous_pages) else None
+            headers = dict(self.headers)
+            if previous and previous.get("etag"):
+                headers["if-none-match"] = previous["etag"]
+
+            response = self.session.get(
+                endpoint_url,
+                params={"offset": number * self.page_size, "limit": self.page_size},
+                headers=headers,
+                timeout=DEFAULT_TIMEOUT,
+            )
+            self.requests += 1
+            if response.status_code == 304:
+                self.not_modified += 1
+                page = previous
+            elif response.status_code == 200:
+                page = {
+                    "etag": response.headers.get("etag"),
+                    "resources": response.json(),
+                }
+            else:
+                raise Exception(f"Unable to list {endpoint_url}: " + response.text)
+
+            pages.append(page)
+            if len(page["resources"]) < self.page_size:
+                break
+
+        index = {}
+        for page in pages:
+            for resource in page["resources"]:
+                _index_resource(index, resource)
+
+        self._pages[kind] = pages
+        self._indexes[kind] = index
+        self._fetched_at[kind] = time()
+
+
+def _index_resource(index: Dict, resource: Dict) -> None:
+    for field in INDEXED_FIELDS:
+        if resource.get(field) is not None:
+            index.setdefault((field, _key(resource[field])), []).append(resource)
+
+
+def _matches(value, expected) -> bool:
+    if isinstance(expected, dict):
+        return isinstance(value, dict) and all(
+            _matches(value.get(f), v) for (f, v) in expected.items()
+        )
+    if isinstance(expected, (int, str)) and not isinstance(expected, bool):
+        return value is not None and _key(value) == _key(expected)
+
+    return value == expected
+
+
+def _key(value) -> str:
+    # IDs are recorded as strings in the journal, but returned as integers
+    return str(value)
@@ -0,0 +1,276 @@
+import json
+import math
+import os
+import re
+import subprocess
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+# Something that happens in the source, and makes a good place for an ad break
+Event = namedtuple("Event", "kind start end score")
+Candidate = namedtuple("Candidate", "time score kinds")
+
+# Weight of each kind of event in the ranking of the candidates. A fade to black
+# over silence is the ideal ad break, a scene change alone the least good one
+EVENT_WEIGHTS = {"black": 2.0, "silence": 1.0, "scene": 1.0}
+
+# Events closer than this (in seconds) are considered to be the same moment
+COINCIDENCE_WINDOW = 0.5
+
+scene_pattern = re.compile(r"pts_time:(?P<time>[\d.]+)")
+scene_score_pattern = re.compile(r"lavfi\.scene_score=(?P<score>[\d.]+)")
+black_pattern = re.compile(r"black_start:(?P<start>[\d.]+) black_end:(?P<end>[\d.]+)")
+silence_start_pattern = re.compile(r"silence_start: (?P<start>-?[\d.]+)")
+silence_end_pattern = re.compile(r"silence_end: (?P<end>[\d.]+)")
+
+
+class SpliceDetector:
+    """Detects splice points in source files, with FFmpeg.
+
+    Sources are analysed for scene changes, black frames and silences. Long
+    sources are split into chunks of `chunk_duration` seconds, which are
+    analysed in parallel by a pool of processes, each running a single-threaded
+    FFmpeg on a downscaled copy of the video. Candidates are then ranked (black
+    frames over silence first) and picked at least `min_spacing` seconds apart.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        chunk_duration: float = 300,
+        min_spacing: float = 120,
+        margin: float = 30,
+        max_count: Optional[int] = None,
+        scene_threshold: float = 0.4,
+        min_black_duration: float = 0.2,
+        silence_noise: str = "-50dB",
+        min_silence_duration: float = 0.3,
+        proxy_height: int = 180,
+    ) -> None:
+        self.workers = workers or os.cpu_count()
+        self.chunk_duration = chunk_duration
+        self.min_spacing = min_spacing
+        self.margin = margin
+        self.max_count = max_count
+        self.scene_threshold = scene_threshold
+        self.min_black_duration = min_black_duration
+        self.silence_noise = silence_noise
+        self.min_silence_duration = min_silence_duration
+        self.proxy_height = proxy_height
+
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def detect(self, source: str) -> List[float]:
+        """Splice points of a source file or URL, in seconds and in order"""
+        (duration, has_audio) = probe(source)
+        chunks = self._split(duration)
+
+        futures = [
+            self._executor.submit(
+                analyze_chunk,
+                source=source,
+                start=start,
+                duration=chunk_duration,
+                has_audio=has_audio,
+                filters=self._filters(),
+            )
+            for (start, chunk_duration) in chunks
+        ]
+        events = [event for future in futures for event in future.result()]
+
+        candidates = rank_candidates(events)
+        return pick_splice_points(
+            candidates,
+            duration=duration,
+            min_spacing=self.min_spacing,
+            margin=self.margin,
+            max_count=self.max_count,
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def _split(self, duration: float) -> List[Tuple[float, float]]:
+        # At least as many chunks as workers, so that short sources use them all
+        count = max(self.workers, math.ceil(duration / self.chunk_duration))
+        chunk_duration = duration / count
+
+        return [(i * chunk_duration, chunk_duration) for i in range(count)]
+
+    def _filters(self) -> Tuple[str, str]:
+        video_filter = (
+            f"[0:v:0]scale=-2:{self.proxy_height},split[s][b];"
+            f"[s]select='gt(scene,{self.scene_threshold})',"
+            "metadata=print:key=lavfi.scene_score[scenes];"
+            f"[b]blackdetect=d={self.min_black_duration}:pix_th=0.10[black]"
+        )
+        audio_filter = (
+            f"silencedetect=n={self.silence_noise}:d={self.min_silence_duration}"
+        )
+
+        return (video_filter, audio_filter)
+
+
+def probe(source: str) -> Tuple[float, bool]:
+    """Duration of a source, and whether it has an audio stream"""
+    output = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-show_entries",
+            "format=duration:stream=codec_type",
+            "-of",
+            "json",
+            source,
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+    info = json.loads(output)
+
+    return (
+        float(info["format"]["duration"]),
+        any(s.get("codec_type") == "audio" for s in info.get("streams", [])),
+    )
+
+
+def analyze_chunk(
+    source: str,
+    start: float,
+    duration: float,
+    has_audio: bool,
+    filters: Tuple[str, str],
+) -> List[Event]:
+    """Events found in a chunk of a source, timed from the start of the source"""
+    (video_filter, audio_filter) = filters
+    command = [
+        "ffmpeg",
+        "-hide_banner",
+        "-nostats",
+        "-threads",
+        "1",
+        "-ss",
+        str(start),
+        "-t",
+        str(duration),
+        "-i",
+        source,
+        "-filter_threads",
+        "1",
+        "-filter_complex",
+        video_filter,
+        "-map",
+        "[scenes]",
+        "-f",
+        "null",
+        "-",
+        "-map",
+        "[black]",
+        "-f",
+        "null",
+        "-",
+    ]
+    if has_audio:
+        command += ["-map", "0:a:0", "-af", audio_filter, "-f", "null", "-"]
+
+    proc = subprocess.run(command, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise Exception(
+            f"Analysis of {source} from {start}s failed: " + proc.stderr[-1000:]
+        )
+
+    return [
+        Event(kind=e.kind, start=e.start + start, end=e.end + start, score=e.score)
+        for e in parse_events(proc.stderr, duration=duration)
+    ]
+
+
+def parse_events(log: str, duration: float) -> List[Event]:
+    events = []
+    scene_time = None
+    silence_start = None
+
+    for line in log.splitlines():
+        if match := scene_pattern.search(line):
+            scene_time = float(match["time"])
+        elif (match := scene_score_pattern.search(line)) and scene_time is not None:
+            score = float(match["score"])
+            events.append(Event("scene", scene_time, scene_time, score))
+            scene_time = None
+        elif match := black_pattern.search(line):
+            events.append(Event("black", float(match["start"]), float(match["end"]), 1))
+        elif match := silence_start_pattern.search(line):
+            silence_start = max(0.0, float(match["start"]))
+        elif (match := silence_end_pattern.search(line)) and silence_start is not None:
+            events.append(Event("silence", silence_start, float(match["end"]), 1))
+            silence_start = None
+
+    # A silence still going on at the end of the chunk isn't closed in the log
+    if silence_start is not None:
+        events.append(Event("silence", silence_start, duration, 1))
+
+    return events
+
+
+def rank_candidates(events: List[Event]) -> List[Candidate]:
+    """Candidate splice points, best first.
+
+    Each black period and each scene change is a candidate: black periods are
+    split in their middle, so that the content fades out and back in around the
+    ad break. Candidates score the weights of all the events happening at the
+    same time, eg. a scene change during a silence scores for both.
+    """
+    candidates = []
+    anchors = [e for e in events if e.kind in ("black", "scene")]
+
+    for anchor in anchors:
+        time = (anchor.start + anchor.end) / 2
+        score = 0.0
+        kinds = set()
+        for event in events:
+            if (
+                event.start - COINCIDENCE_WINDOW
+                <= time
+                <= event.end + COINCIDENCE_WINDOW
+            ):
+                score += EVENT_WEIGHTS[event.kind] * event.score
+                kinds.add(event.kind)
+        candidates.append(Candidate(round(time, 3), score, sorted(kinds)))
+
+    return sorted(candidates, key=lambda c: (-c.score, c.time))
+
+
+def pick_splice_points(
+    candidates: List[Candidate],
+    duration: float,
+    min_spacing: float,
+    margin: float = 0,
+    max_count: Optional[int] = None,
+) -> List[float]:
+    """Pick the best candidates at least `min_spacing` seconds apart.
+
+    Candidates within `margin` seconds of the start or the end of the source
+    are ignored, pre-rolls and post-rolls are handled separately.
+    """
+    picked = []
+
+    for candidate in candidates:
+        if max_count is not None and len(picked) >= max_count:
+            break
+        if not margin <= candidate.time <= duration - margin:
+            continue
+        if all(abs(candidate.time - t) >= min_spacing for t in picked):
+            picked.append(candidate.time)
+
+    return sorted(picked)
+
+
+def create_splice_detector(config) -> SpliceDetector:
+    return SpliceDetector(
+        workers=getattr(config, "SPLICE_DETECTION_WORKERS", None),
+        min_spacing=getattr(config, "SPLICE_DETECTION_MIN_SPACING", 120),
+        max_count=getattr(config, "SPLICE_DETECTION_MAX_COUNT", None),
+    )
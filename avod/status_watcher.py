@@ -0,0 +1,199 @@
+import heapq
+import itertools
+import random
+import threading
+from concurrent.futures import Future
+from time import monotonic
+from typing import Callable, Iterable, List, Optional
+
+import bitmovin_api_sdk as bm
+
+TERMINAL_STATUSES = [
+    bm.Status.FINISHED,
+    bm.Status.ERROR,
+    bm.Status.CANCELED,
+    bm.Status.TRANSFER_ERROR,
+]
+
+
+class _Watch:
+    def __init__(
+        self,
+        encoding_id: str,
+        statuses: List[bm.Status],
+        deadline: Optional[float],
+        on_update: Optional[Callable[[bm.Task], None]],
+        interval: float,
+    ) -> None:
+        self.encoding_id = encoding_id
+        self.statuses = statuses
+        self.deadline = deadline
+        self.on_update = on_update
+        self.interval = interval
+        self.future = Future()
+        self.errors = 0
+        self.last_progress = None
+        self.last_polled_at = None
+
+
+class EncodingStatusWatcher:
+    """Tracks the status of any number of encodings from a single thread.
+
+    Each watched encoding is polled at its own interval, which shortens as the
+    encoding gets close to completion (based on the ETA and progress reported
+    by the API) and backs off exponentially when the status can't be fetched.
+    Callers get a future, resolved with the last `bm.Task` as soon as the
+    encoding reaches one of the expected statuses, or a terminal one.
+    """
+
+    def __init__(
+        self,
+        encoding_api,
+        min_interval: float = 2,
+        max_interval: float = 30,
+        max_error_backoff: float = 120,
+        max_consecutive_errors: int = 10,
+    ) -> None:
+        self.encoding_api = encoding_api
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_error_backoff = max_error_backoff
+        self.max_consecutive_errors = max_consecutive_errors
+
+        self._schedule = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(
+        self,
+        encoding_id: str,
+        statuses: Iterable[bm.Status] = (),
+        timeout: Optional[float] = None,
+        on_update: Optional[Callable[[bm.Task], None]] = None,
+    ) -> Future:
+        """Watch an encoding until it reaches one of `statuses` or a terminal status.
+
+        The returned future fails with a TimeoutError if that doesn't happen
+        within `timeout` seconds. `on_update` is called with every status fetched.
+        """
+        watch = _Watch(
+            encoding_id=encoding_id,
+            statuses=list(statuses),
+            deadline=monotonic() + timeout if timeout is not None else None,
+            on_update=on_update,
+            interval=self.min_interval,
+        )
+        self._schedule_poll(watch, delay=0)
+        self._ensure_started()
+        return watch.future
+
+    def poke(self, encoding_id: str) -> None:
+        """Poll an encoding right away, eg. when notified that its status changed"""
+        with self._condition:
+            self._schedule = [
+                (0 if w.encoding_id == encoding_id else due, seq, w)
+                for (due, seq, w) in self._schedule
+            ]
+            heapq.heapify(self._schedule)
+            self._condition.notify()
+
+    def _ensure_started(self) -> None:
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="encoding-status-watcher", daemon=True
+                )
+                self._thread.start()
+
+    def _schedule_poll(self, watch: _Watch, delay: float) -> None:
+        with self._condition:
+            heapq.heappush(
+                self._schedule, (monotonic() + delay, next(self._sequence), watch)
+            )
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._schedule or self._schedule[0][0] > monotonic():
+                    timeout = (
+                        self._schedule[0][0] - monotonic() if self._schedule else None
+                    )
+                    self._condition.wait(timeout=timeout)
+                (_, _, watch) = heapq.heappop(self._schedule)
+
+            self._poll(watch)
+
+    def _poll(self, watch: _Watch) -> None:
+        if watch.future.cancelled():
+            return
+
+        try:
+            task = self.encoding_api.encodings.status(encoding_id=watch.encoding_id)
+        except Exception as e:
+            watch.errors += 1
+            if watch.errors > self.max_consecutive_errors:
+                watch.future.set_exception(e)
+                return
+
+            backoff = min(self.max_error_backoff, self.min_interval * 2**watch.errors)
+            self._reschedule(watch, delay=backoff * random.uniform(0.5, 1))
+            return
+
+        watch.errors = 0
+        if watch.on_update:
+            try:
+                watch.on_update(task)
+            except Exception as e:
+                print(f"Status callback failed for encoding {watch.encoding_id}: {e}")
+
+        if task.status in watch.statuses or task.status in TERMINAL_STATUSES:
+            watch.future.set_result(task)
+            return
+
+        self._reschedule(watch, delay=self._next_interval(watch, task))
+
+    def _reschedule(self, watch: _Watch, delay: float) -> None:
+        if watch.deadline is not None:
+            remaining = watch.deadline - monotonic()
+            if remaining <= 0:
+                watch.future.set_exception(
+                    TimeoutError(
+                        "Encoding {0} did not reach status {1} in time".format(
+                            watch.encoding_id,
+                            "/".join(s.value for s in watch.statuses) or "FINISHED",
+                        )
+                    )
+                )
+                return
+            delay = min(delay, remaining)
+
+        self._schedule_poll(watch, delay=delay)
+
+    def _next_interval(self, watch: _Watch, task: bm.Task) -> float:
+        now = monotonic()
+        remaining = None
+
+        if task.eta:
+            remaining = task.eta
+        elif (
+            task.progress
+            and watch.last_progress is not None
+            and task.progress > watch.last_progress
+        ):
+            rate = (task.progress - watch.last_progress) / (now - watch.last_polled_at)
+            remaining = (100 - task.progress) / rate
+
+        watch.last_progress = task.progress
+        watch.last_polled_at = now
+
+        if remaining is not None:
+            # Poll a few times over the remaining time, more often near the end
+            watch.interval = remaining / 3
+        else:
+            # Nothing to go by (eg. encoding still queued), slowly back off
+            watch.interval = watch.interval * 1.5
+
+        watch.interval = max(self.min_interval, min(self.max_interval, watch.interval))
+        return watch.interval
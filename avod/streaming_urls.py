@@ -0,0 +1,188 @@
+import argparse
+import csv
+import importlib
+import json
+import os
+import tracemalloc
+from collections import namedtuple
+from time import perf_counter
+from typing import Dict, Iterable, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+
+# An origin manifest of an asset, and the splice points of the asset (None for
+# the default ones)
+Asset = namedtuple("Asset", "id origin_url splice_points")
+StreamingUrl = namedtuple("StreamingUrl", "id origin_url streaming_url")
+
+
+class StreamingUrlGenerator:
+    """Builds the streaming URLs of the assets of a broadpeak.io AVOD service.
+
+    Everything that only depends on the service (its URL rewritten for the CDN,
+    the path of its asset catalog, the default splice points) is computed once,
+    so that generating the URL of an asset is a few string operations.
+    """
+
+    def __init__(
+        self,
+        service: Dict,
+        cdn_fqdn: Optional[str] = None,
+        splice_points: Optional[List[float]] = None,
+    ) -> None:
+        self.service_url = service["url"]
+        if cdn_fqdn:
+            self.service_url = self.service_url.replace("stream.broadpeak.io", cdn_fqdn)
+        self.source_path = urlsplit(service["source"]["url"]).path
+        self.default_mids = _mids(splice_points or [])
+
+    def url(self, origin_url: str, splice_points: Optional[List[float]] = None) -> str:
+        return "{base}{asset}?bpkio_mids={mids}".format(
+            base=self.service_url,
+            asset=urlsplit(origin_url).path.replace(self.source_path, ""),
+            mids=self.default_mids if splice_points is None else _mids(splice_points),
+        )
+
+    def generate(self, assets: Iterable[Asset]) -> Iterator[StreamingUrl]:
+        for asset in assets:
+            yield StreamingUrl(
+                id=asset.id,
+                origin_url=asset.origin_url,
+                streaming_url=self.url(asset.origin_url, asset.splice_points),
+            )
+
+
+def read_assets(assets_path: str) -> Iterator[Asset]:
+    """Read an asset list, in JSONL or CSV format, one line at a time.
+
+    Lines have the fields `origin_url`, and optionally `id` and `splice_points`
+    (list of seconds, written as `69.9;257.9` in CSV files).
+    """
+    with open(assets_path, newline="") as f:
+        if assets_path.endswith(".csv"):
+            rows = (
+                dict(
+                    row,
+                    splice_points=(
+                        [float(p) for p in row["splice_points"].split(";") if p]
+                        if row.get("splice_points")
+                        else None
+                    ),
+                )
+                for row in csv.DictReader(f)
+            )
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for i, row in enumerate(rows):
+            yield Asset(
+                id=row.get("id") or str(i),
+                origin_url=row["origin_url"],
+                splice_points=row.get("splice_points"),
+            )
+
+
+def write_streaming_urls(urls: Iterable[StreamingUrl], output_path: str) -> int:
+    """Write streaming URLs as they are generated, in JSONL or CSV format.
+
+    Returns the number of URLs written.
+    """
+    count = 0
+    with open(output_path, "w", newline="") as f:
+        if output_path.endswith(".csv"):
+            writer = csv.writer(f)
+            writer.writerow(StreamingUrl._fields)
+            for url in urls:
+                writer.writerow(url)
+                count += 1
+        else:
+            for url in urls:
+                f.write(json.dumps(url._asdict()) + "\n")
+                count += 1
+
+    return count
+
+
+def _mids(splice_points: List[float]) -> str:
+    return ",".join([str(i) for i in splice_points])
+
+
+def main():
+    args = parse_arguments()
+
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+
+    if not args.assets or not args.output:
+        raise Exception("Provide an asset list with --assets and an --output path")
+
+    cfg = importlib.import_module(args.config)
+
+    from broadpeak import BroadpeakIOController
+
+    broadpeakio = BroadpeakIOController(config=cfg)
+    generator = broadpeakio.streaming_url_generator(args.service_id)
+
+    count = write_streaming_urls(
+        generator.generate(read_assets(args.assets)), args.output
+    )
+    print(f"{count} streaming URLs written to {args.output}")
+
+
+def benchmark(count: int):
+    """Generate the streaming URLs of synthetic assets, without keeping them"""
+    generator = StreamingUrlGenerator(
+        service={
+            "url": "https://stream.broadpeak.io/0123456789abcdef/avod/",
+            "source": {"url": "https://bucket.s3.amazonaws.com/output/"},
+        },
+        cdn_fqdn="cdn.example.com",
+        splice_points=[69.91, 257.91, 588.40],
+    )
+    assets = (
+        Asset(
+            id=str(i),
+            origin_url=f"https://bucket.s3.amazonaws.com/output/asset-{i}/hls/index.m3u8",
+            splice_points=[12.0, float(i % 600)] if i % 10 == 0 else None,
+        )
+        for i in range(count)
+    )
+
+    tracemalloc.start()
+    start = perf_counter()
+    written = write_streaming_urls(generator.generate(assets), os.devnull)
+    duration = perf_counter() - start
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(
+        f"{written} streaming URLs in {duration:.1f}s "
+        f"({written / duration:.0f} URLs/s), peak memory {peak / 1024:.0f} KiB"
+    )
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Generate the broadpeak.io streaming URLs of a list of assets"
+    )
+    parser.add_argument("-c", "--config", help="path to config file", default="config")
+    # The benchmark is the only thing the script can do without a service
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument("-s", "--service-id", help="broadpeak.io AVOD service ID")
+    mode.add_argument(
+        "--benchmark",
+        type=int,
+        help="generate the URLs of this number of synthetic assets and report "
+        "the throughput and peak memory",
+    )
+    parser.add_argument("-a", "--assets", help="path to a JSONL or CSV asset list")
+    parser.add_argument(
+        "-o", "--output", help="path to the JSONL or CSV file to write the URLs to"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
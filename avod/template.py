@@ -0,0 +1,391 @@
+import os
+from os import path
+from typing import Dict, List, Optional
+
+import bitmovin_api_sdk as bm
+import codec_configs
+
+ENCODING_KEY = "encoding"
+HLS_MANIFEST_KEY = "hls"
+DASH_MANIFEST_KEY = "dash"
+
+
+class EncodingTemplateCompiler:
+    """Compiles an AVOD job into a single Bitmovin encoding template.
+
+    The template declares the same configurations, streams, muxings, keyframes
+    and manifests as BitmovinController.configure_encoding, with the same output
+    layout, so that the encoding can be created and started with one request.
+    Resources declared in the template reference each other by their path in it,
+    followed by the field to read (eg. `$/configurations/video/h264/<key>/id`), as
+    in the examples of the Bitmovin encoding template documentation. The input
+    and output already exist, and are referenced by their ID.
+    No API call is made, the compiler only needs the configuration module.
+    """
+
+    def __init__(self, config, input_id: str, output_id: str) -> None:
+        self.config = config
+        self.input_id = input_id
+        self.output_id = output_id
+        self.use_cmaf = getattr(config, "USE_CMAF", False)
+
+    def compile(
+        self,
+        name: str,
+        source_path: str,
+        source_video_file: str,
+        source_audio_files: Dict[str, str],
+        source_subtitle_files: Dict[str, str],
+        output_sub_path: str,
+        splice_points: Optional[List[float]] = None,
+    ) -> Dict:
+        if splice_points is None:
+            splice_points = getattr(self.config, "SPLICE_POINTS", [])
+
+        configurations = {"video": {"h264": {}}, "audio": {"aac": {}}}
+        encoding = {
+            "properties": bm.Encoding(name=name, description="").to_dict(),
+            "input-streams": {"file": {}},
+            "streams": {},
+            "muxings": {"fmp4": {}, "chunked-text": {}},
+            "keyframes": {},
+        }
+        if not self.use_cmaf:
+            encoding["muxings"]["ts"] = {}
+        hls_manifest = {
+            "properties": self.hls_manifest(output_sub_path).to_dict(),
+            "streams": {},
+            "media": {"audio": {}, "subtitles": {}},
+        }
+        adaptation_sets = {"video": {}, "audio": {}, "subtitle": {}}
+        dash_manifest = {
+            "properties": self.dash_manifest(output_sub_path).to_dict(),
+            "periods": {
+                "period": {"properties": {}, "adaptationsets": adaptation_sets}
+            },
+        }
+
+        # ABR Ladder
+        video_config_keys = []
+        for r in self.config.VIDEO_LADDER:
+            key = f"h264_{r.height}p_{r.bitrate}"
+            configurations["video"]["h264"][key] = self._resource(
+                codec_configs.h264_video_configuration(
+                    height=r.height,
+                    bitrate=r.bitrate,
+                    profile=bm.ProfileH264(r.profile.upper()),
+                    level=bm.LevelH264(r.level),
+                    rate=self.config.FRAME_RATE,
+                )
+            )
+            video_config_keys.append(key)
+
+        audio_config_keys = []
+        for r in self.config.AUDIO_LADDER:
+            key = f"aac_{r.bitrate}"
+            configurations["audio"]["aac"][key] = self._resource(
+                codec_configs.aac_audio_configuration(bitrate=r.bitrate)
+            )
+            audio_config_keys.append(key)
+
+        if source_subtitle_files:
+            configurations["subtitles"] = {
+                "webvtt": {
+                    "webvtt": self._resource(codec_configs.webvtt_configuration())
+                }
+            }
+
+        # video streams, muxings, dash representations and hls variant playlists
+        video_representations = {}
+        adaptation_sets["video"]["video"] = {
+            "properties": {},
+            "representations": {"fmp4": video_representations},
+        }
+        for r, config_key in zip(self.config.VIDEO_LADDER, video_config_keys):
+            stream_key = f"video_{r.height}p_{r.bitrate}"
+            encoding["streams"][stream_key] = self._resource(
+                self._stream(
+                    input_path=os.path.join(source_path, source_video_file),
+                    codec_config_id=_ref("configurations", "video", "h264", config_key),
+                )
+            )
+
+            relative_path_fmp4 = f"video/{r.bitrate}/fmp4"
+            encoding["muxings"]["fmp4"][stream_key] = self._resource(
+                self._fmp4_muxing(
+                    output_path=f"{output_sub_path}/{relative_path_fmp4}",
+                    stream_key=stream_key,
+                )
+            )
+
+            if self.use_cmaf:
+                (hls_muxing_type, relative_path_hls) = ("fmp4", relative_path_fmp4)
+            else:
+                (hls_muxing_type, relative_path_hls) = ("ts", f"video/{r.bitrate}/ts")
+                encoding["muxings"]["ts"][stream_key] = self._resource(
+                    self._ts_muxing(
+                        output_path=f"{output_sub_path}/{relative_path_hls}",
+                        stream_key=stream_key,
+                    )
+                )
+
+            video_representations[stream_key] = self._resource(
+                bm.DashFmp4Representation(
+                    type_=bm.DashRepresentationType.TIMELINE,
+                    encoding_id=_ref("encodings", ENCODING_KEY),
+                    muxing_id=_muxing_ref("fmp4", stream_key),
+                    segment_path=relative_path_fmp4,
+                )
+            )
+
+            hls_manifest["streams"][stream_key] = self._resource(
+                bm.StreamInfo(
+                    audio="AUDIO",
+                    subtitles="SUBS",
+                    segment_path=relative_path_hls,
+                    uri=f"video_{r.height}p_{r.bitrate}.m3u8",
+                    encoding_id=_ref("encodings", ENCODING_KEY),
+                    stream_id=_stream_ref(stream_key),
+                    muxing_id=_muxing_ref(hls_muxing_type, stream_key),
+                    force_frame_rate_attribute=True,
+                    force_video_range_attribute=True,
+                )
+            )
+
+        # audio streams, muxings, dash representations and hls media playlists
+        for lang, source_audio_file in source_audio_files.items():
+            audio_representations = {}
+            adaptation_sets["audio"][f"audio_{lang}"] = {
+                "properties": bm.AudioAdaptationSet(
+                    lang=self._make_language_label(lang)
+                ).to_dict(),
+                "representations": {"fmp4": audio_representations},
+            }
+
+            for r, config_key in zip(self.config.AUDIO_LADDER, audio_config_keys):
+                stream_key = f"audio_{lang}_{r.bitrate}"
+                stream = self._stream(
+                    input_path=os.path.join(source_path, source_audio_file),
+                    codec_config_id=_ref("configurations", "audio", "aac", config_key),
+                )
+                stream.metadata = bm.StreamMetadata(language=lang)
+                encoding["streams"][stream_key] = self._resource(stream)
+
+                relative_path_fmp4 = f"audio_{lang}/{r.bitrate}/fmp4"
+                encoding["muxings"]["fmp4"][stream_key] = self._resource(
+                    self._fmp4_muxing(
+                        output_path=f"{output_sub_path}/{relative_path_fmp4}",
+                        stream_key=stream_key,
+                    )
+                )
+
+                if self.use_cmaf:
+                    (hls_muxing_type, relative_path_hls) = ("fmp4", relative_path_fmp4)
+                else:
+                    hls_muxing_type = "ts"
+                    relative_path_hls = f"audio_{lang}/{r.bitrate}/ts"
+                    encoding["muxings"]["ts"][stream_key] = self._resource(
+                        self._ts_muxing(
+                            output_path=f"{output_sub_path}/{relative_path_hls}",
+                            stream_key=stream_key,
+                        )
+                    )
+
+                audio_representations[stream_key] = self._resource(
+                    bm.DashFmp4Representation(
+                        type_=bm.DashRepresentationType.TIMELINE,
+                        encoding_id=_ref("encodings", ENCODING_KEY),
+                        muxing_id=_muxing_ref("fmp4", stream_key),
+                        segment_path=relative_path_fmp4,
+                    )
+                )
+
+                hls_manifest["media"]["audio"][stream_key] = self._resource(
+                    bm.AudioMediaInfo(
+                        name=self._make_language_label(lang),
+                        group_id="AUDIO",
+                        segment_path=relative_path_hls,
+                        uri=f"audio_{lang}_{r.bitrate}.m3u8",
+                        encoding_id=_ref("encodings", ENCODING_KEY),
+                        stream_id=_stream_ref(stream_key),
+                        muxing_id=_muxing_ref(hls_muxing_type, stream_key),
+                        language=lang,
+                    )
+                )
+
+        # subtitle streams and muxings
+        for lang, source_sub_file in source_subtitle_files.items():
+            stream_key = f"subtitles_{lang}"
+            input_path = os.path.join(source_path, source_sub_file)
+
+            input_stream = bm.FileInputStream(
+                input_id=self.input_id, input_path=input_path
+            )
+            if input_path.endswith(".srt"):
+                input_stream.file_type = bm.FileInputStreamType.SRT
+            if input_path.endswith(".vtt"):
+                input_stream.file_type = bm.FileInputStreamType.WEBVTT
+            encoding["input-streams"]["file"][stream_key] = self._resource(input_stream)
+
+            encoding["streams"][stream_key] = self._resource(
+                bm.Stream(
+                    input_streams=[
+                        bm.StreamInput(
+                            input_stream_id=_ref(
+                                "encodings",
+                                ENCODING_KEY,
+                                "input-streams",
+                                "file",
+                                stream_key,
+                            )
+                        )
+                    ],
+                    codec_config_id=_ref(
+                        "configurations", "subtitles", "webvtt", "webvtt"
+                    ),
+                )
+            )
+
+            relative_path_vtt = f"subtitles_{lang}/vtt"
+            encoding["muxings"]["chunked-text"][stream_key] = self._resource(
+                bm.ChunkedTextMuxing(
+                    outputs=[
+                        self._encoding_output(f"{output_sub_path}/{relative_path_vtt}")
+                    ],
+                    segment_length=self.config.SEGMENT_DURATION,
+                    streams=[bm.MuxingStream(stream_id=_stream_ref(stream_key))],
+                    segment_naming="segment_%number%.vtt",
+                    start_offset=10,
+                )
+            )
+
+            hls_manifest["media"]["subtitles"][stream_key] = self._resource(
+                bm.SubtitlesMediaInfo(
+                    name=self._make_language_label(lang),
+                    group_id="SUBS",
+                    segment_path=relative_path_vtt,
+                    uri=f"subtitles_{lang}.m3u8",
+                    encoding_id=_ref("encodings", ENCODING_KEY),
+                    stream_id=_stream_ref(stream_key),
+                    muxing_id=_muxing_ref("chunked-text", stream_key),
+                    language=lang,
+                )
+            )
+
+            adaptation_sets["subtitle"][stream_key] = {
+                "properties": bm.SubtitleAdaptationSet(
+                    lang=self._make_language_label(lang)
+                ).to_dict(),
+                "representations": {
+                    "chunked-text": {
+                        stream_key: self._resource(
+                            bm.DashChunkedTextRepresentation(
+                                type_=bm.DashRepresentationType.TIMELINE,
+                                encoding_id=_ref("encodings", ENCODING_KEY),
+                                muxing_id=_muxing_ref("chunked-text", stream_key),
+                                segment_path=relative_path_vtt,
+                            )
+                        )
+                    }
+                },
+            }
+
+        for i, splice_point in enumerate(splice_points):
+            encoding["keyframes"][f"splice_point_{i}"] = self._resource(
+                codec_configs.splice_point_keyframe(time=splice_point)
+            )
+
+        start_encoding_request = bm.StartEncodingRequest(
+            manifest_generator=bm.ManifestGenerator.V2,
+            vod_hls_manifests=[
+                bm.ManifestResource(
+                    manifest_id=_ref("manifests", "hls", HLS_MANIFEST_KEY)
+                )
+            ],
+            vod_dash_manifests=[
+                bm.ManifestResource(
+                    manifest_id=_ref("manifests", "dash", DASH_MANIFEST_KEY)
+                )
+            ],
+        )
+        encoding["start"] = self._resource(start_encoding_request)
+
+        return {
+            "metadata": {"type": "VOD", "name": name},
+            "configurations": configurations,
+            "encodings": {ENCODING_KEY: encoding},
+            "manifests": {
+                "hls": {HLS_MANIFEST_KEY: hls_manifest},
+                "dash": {DASH_MANIFEST_KEY: dash_manifest},
+            },
+        }
+
+    def hls_manifest(self, output_sub_path: str) -> bm.HlsManifest:
+        hls_version = bm.HlsVersion.HLS_V7 if self.use_cmaf else bm.HlsVersion.HLS_V6
+        return bm.HlsManifest(
+            outputs=[self._encoding_output(output_sub_path)],
+            name="HLS/fmp4 Manifest" if self.use_cmaf else "HLS/ts Manifest",
+            hls_master_playlist_version=hls_version,
+            hls_media_playlist_version=hls_version,
+            manifest_name="stream.m3u8",
+        )
+
+    def dash_manifest(self, output_sub_path: str) -> bm.DashManifest:
+        return bm.DashManifest(
+            name="Single-Period DASH Manifest",
+            manifest_name="stream.mpd",
+            outputs=[self._encoding_output(output_sub_path)],
+            profile=bm.DashProfile.LIVE,
+        )
+
+    def _stream(self, input_path: str, codec_config_id: str) -> bm.Stream:
+        stream_input = bm.StreamInput(
+            input_id=self.input_id,
+            input_path=input_path,
+            selection_mode=bm.StreamSelectionMode.AUTO,
+        )
+
+        return bm.Stream(input_streams=[stream_input], codec_config_id=codec_config_id)
+
+    def _ts_muxing(self, output_path: str, stream_key: str) -> bm.TsMuxing:
+        return bm.TsMuxing(
+            outputs=[self._encoding_output(output_path)],
+            segment_length=self.config.SEGMENT_DURATION,
+            streams=[bm.MuxingStream(stream_id=_stream_ref(stream_key))],
+            start_offset=10,
+        )
+
+    def _fmp4_muxing(self, output_path: str, stream_key: str) -> bm.Fmp4Muxing:
+        return bm.Fmp4Muxing(
+            outputs=[self._encoding_output(output_path)],
+            segment_length=self.config.SEGMENT_DURATION,
+            streams=[bm.MuxingStream(stream_id=_stream_ref(stream_key))],
+        )
+
+    def _encoding_output(self, output_path: str) -> bm.EncodingOutput:
+        acl_entry = bm.AclEntry(permission=bm.AclPermission.PUBLIC_READ)
+
+        return bm.EncodingOutput(
+            output_path=path.join(self.config.S3_OUTPUT_BASE_PATH, output_path),
+            output_id=self.output_id,
+            acl=[acl_entry],
+        )
+
+    def _resource(self, model) -> Dict:
+        return {"properties": model.to_dict()}
+
+    def _make_language_label(self, lang: str) -> str:
+        return self.config.LANGUAGE_LABELS.get(lang, lang)
+
+
+def _ref(*parts: str) -> str:
+    """Reference to the ID of the resource at this path of the template"""
+    return "$/" + "/".join(parts) + "/id"
+
+
+def _stream_ref(stream_key: str) -> str:
+    return _ref("encodings", ENCODING_KEY, "streams", stream_key)
+
+
+def _muxing_ref(muxing_type: str, stream_key: str) -> str:
+    return _ref("encodings", ENCODING_KEY, "muxings", muxing_type, stream_key)
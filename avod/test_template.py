@@ -0,0 +1,307 @@
+from types import SimpleNamespace
+
+import pytest
+
+import config
+from template import EncodingTemplateCompiler
+
+
+def compile_template(use_cmaf: bool):
+    cfg = SimpleNamespace(**dict(vars(config), USE_CMAF=use_cmaf))
+    compiler = EncodingTemplateCompiler(cfg, input_id="input", output_id="output")
+    return compiler.compile(
+        name="test",
+        source_path="/source",
+        source_video_file=cfg.SOURCE_FILE_PATH_VIDEO,
+        source_audio_files=cfg.SOURCE_FILE_PATHS_AUDIO,
+        source_subtitle_files=cfg.SOURCE_FILE_PATHS_SUBTITLES,
+        output_sub_path="test/job",
+        splice_points=cfg.SPLICE_POINTS,
+    )
+
+
+def references(value):
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from references(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from references(item)
+    elif isinstance(value, str) and value.startswith("$/"):
+        yield value
+
+
+@pytest.mark.parametrize("use_cmaf", [False, True])
+def test_references_resolve_to_resources_of_the_template(use_cmaf):
+    template = compile_template(use_cmaf)
+
+    refs = set(references(template))
+    assert refs
+    for ref in refs:
+        assert ref.endswith("/id"), ref
+        resource = template
+        for part in ref[len("$/") : -len("/id")].split("/"):
+            assert part in resource, ref
+            resource = resource[part]
+        assert "properties" in resource, ref
+
+
+@pytest.mark.parametrize("use_cmaf", [False, True])
+def test_every_rung_has_a_stream_and_muxings(use_cmaf):
+    encoding = compile_template(use_cmaf)["encodings"]["encoding"]
+
+    video_streams = [k for k in encoding["streams"] if k.startswith("video_")]
+    assert len(video_streams) == len(config.VIDEO_LADDER)
+    assert set(video_streams) <= set(encoding["muxings"]["fmp4"])
+    assert ("ts" in encoding["muxings"]) != use_cmaf
+    assert len(encoding["keyframes"]) == len(config.SPLICE_POINTS)
+
+
+def output(output_path: str):
+    return {
+        "outputId": "output",
+        "outputPath": output_path,
+        "acl": [{"permission": "PUBLIC_READ"}],
+    }
+
+
+# Written by hand from the Bitmovin encoding template documentation: resources
+# are declared under their type, with their API payload in `properties`, and
+# refer to each other with `$/` followed by the path of the other resource in
+# the template and the field to read, `/id`
+EXPECTED_ONE_RENDITION_TEMPLATE = {
+    "metadata": {"type": "VOD", "name": "test"},
+    "configurations": {
+        "video": {
+            "h264": {
+                "h264_720p_3200000": {
+                    "properties": {
+                        "name": "H.264 720 3.2 Mbit/s",
+                        "presetConfiguration": "VOD_STANDARD",
+                        "height": 720,
+                        "bitrate": 3200000,
+                        "rate": 24.0,
+                        "profile": "HIGH",
+                        "level": "3.2",
+                        "adaptiveSpatialTransform": True,
+                        "type": "H264",
+                    }
+                }
+            }
+        },
+        "audio": {
+            "aac": {
+                "aac_128000": {
+                    "properties": {
+                        "name": "AAC 128.0 kbit/s",
+                        "bitrate": 128000,
+                        "type": "AAC",
+                    }
+                }
+            }
+        },
+    },
+    "encodings": {
+        "encoding": {
+            "properties": {"name": "test", "description": ""},
+            "input-streams": {"file": {}},
+            "streams": {
+                "video_720p_3200000": {
+                    "properties": {
+                        "inputStreams": [
+                            {
+                                "inputId": "input",
+                                "inputPath": "/source/video.mp4",
+                                "selectionMode": "AUTO",
+                            }
+                        ],
+                        "codecConfigId": "$/configurations/video/h264/h264_720p_3200000/id",
+                    }
+                },
+                "audio_en_128000": {
+                    "properties": {
+                        "inputStreams": [
+                            {
+                                "inputId": "input",
+                                "inputPath": "/source/audio_en.mp4",
+                                "selectionMode": "AUTO",
+                            }
+                        ],
+                        "codecConfigId": "$/configurations/audio/aac/aac_128000/id",
+                        "metadata": {"language": "en"},
+                    }
+                },
+            },
+            "muxings": {
+                "fmp4": {
+                    "video_720p_3200000": {
+                        "properties": {
+                            "streams": [
+                                {
+                                    "streamId": "$/encodings/encoding/streams/video_720p_3200000/id"
+                                }
+                            ],
+                            "outputs": [output("outputs/asset/job/video/3200000/fmp4")],
+                            "segmentLength": 4.0,
+                            "type": "FMP4",
+                        }
+                    },
+                    "audio_en_128000": {
+                        "properties": {
+                            "streams": [
+                                {
+                                    "streamId": "$/encodings/encoding/streams/audio_en_128000/id"
+                                }
+                            ],
+                            "outputs": [
+                                output("outputs/asset/job/audio_en/128000/fmp4")
+                            ],
+                            "segmentLength": 4.0,
+                            "type": "FMP4",
+                        }
+                    },
+                },
+                "chunked-text": {},
+            },
+            "keyframes": {"splice_point_0": {"properties": {"time": 60.0}}},
+            "start": {
+                "properties": {
+                    "manifestGenerator": "V2",
+                    "vodHlsManifests": [{"manifestId": "$/manifests/hls/hls/id"}],
+                    "vodDashManifests": [{"manifestId": "$/manifests/dash/dash/id"}],
+                }
+            },
+        }
+    },
+    "manifests": {
+        "hls": {
+            "hls": {
+                "properties": {
+                    "name": "HLS/fmp4 Manifest",
+                    "outputs": [output("outputs/asset/job")],
+                    "manifestName": "stream.m3u8",
+                    "hlsMasterPlaylistVersion": "7",
+                    "hlsMediaPlaylistVersion": "7",
+                },
+                "streams": {
+                    "video_720p_3200000": {
+                        "properties": {
+                            "audio": "AUDIO",
+                            "subtitles": "SUBS",
+                            "segmentPath": "video/3200000/fmp4",
+                            "uri": "video_720p_3200000.m3u8",
+                            "encodingId": "$/encodings/encoding/id",
+                            "streamId": "$/encodings/encoding/streams/video_720p_3200000/id",
+                            "muxingId": "$/encodings/encoding/muxings/fmp4/video_720p_3200000/id",
+                            "forceFrameRateAttribute": True,
+                            "forceVideoRangeAttribute": True,
+                        }
+                    }
+                },
+                "media": {
+                    "audio": {
+                        "audio_en_128000": {
+                            "properties": {
+                                "name": "English",
+                                "groupId": "AUDIO",
+                                "language": "en",
+                                "segmentPath": "audio_en/128000/fmp4",
+                                "uri": "audio_en_128000.m3u8",
+                                "encodingId": "$/encodings/encoding/id",
+                                "streamId": "$/encodings/encoding/streams/audio_en_128000/id",
+                                "muxingId": "$/encodings/encoding/muxings/fmp4/audio_en_128000/id",
+                            }
+                        }
+                    },
+                    "subtitles": {},
+                },
+            }
+        },
+        "dash": {
+            "dash": {
+                "properties": {
+                    "name": "Single-Period DASH Manifest",
+                    "manifestName": "stream.mpd",
+                    "outputs": [output("outputs/asset/job")],
+                    "profile": "LIVE",
+                },
+                "periods": {
+                    "period": {
+                        "properties": {},
+                        "adaptationsets": {
+                            "video": {
+                                "video": {
+                                    "properties": {},
+                                    "representations": {
+                                        "fmp4": {
+                                            "video_720p_3200000": {
+                                                "properties": {
+                                                    "type": "TIMELINE",
+                                                    "typeDiscriminator": "FMP4",
+                                                    "encodingId": "$/encodings/encoding/id",
+                                                    "muxingId": "$/encodings/encoding/muxings/fmp4/video_720p_3200000/id",
+                                                    "segmentPath": "video/3200000/fmp4",
+                                                }
+                                            }
+                                        }
+                                    },
+                                }
+                            },
+                            "audio": {
+                                "audio_en": {
+                                    "properties": {"lang": "English", "type": "AUDIO"},
+                                    "representations": {
+                                        "fmp4": {
+                                            "audio_en_128000": {
+                                                "properties": {
+                                                    "type": "TIMELINE",
+                                                    "typeDiscriminator": "FMP4",
+                                                    "encodingId": "$/encodings/encoding/id",
+                                                    "muxingId": "$/encodings/encoding/muxings/fmp4/audio_en_128000/id",
+                                                    "segmentPath": "audio_en/128000/fmp4",
+                                                }
+                                            }
+                                        }
+                                    },
+                                }
+                            },
+                            "subtitle": {},
+                        },
+                    }
+                },
+            }
+        },
+    },
+}
+
+
+def test_one_rendition_template_matches_the_documented_syntax():
+    template = EncodingTemplateCompiler(
+        SimpleNamespace(
+            **dict(
+                vars(config),
+                USE_CMAF=True,
+                VIDEO_LADDER=[
+                    config.VideoRung(
+                        height=720, bitrate=3_200_000, profile="high", level="3.2"
+                    )
+                ],
+                AUDIO_LADDER=[config.AudioRung(bitrate=128_000)],
+                FRAME_RATE=24.0,
+                SEGMENT_DURATION=4.0,
+                S3_OUTPUT_BASE_PATH="outputs/",
+            )
+        ),
+        input_id="input",
+        output_id="output",
+    ).compile(
+        name="test",
+        source_path="/source",
+        source_video_file="video.mp4",
+        source_audio_files={"en": "audio_en.mp4"},
+        source_subtitle_files={},
+        output_sub_path="asset/job",
+        splice_points=[60.0],
+    )
+
+    assert template == EXPECTED_ONE_RENDITION_TEMPLATE
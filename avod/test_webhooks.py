@@ -0,0 +1,116 @@
+import http.client
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import bitmovin_api_sdk as bm
+import pytest
+
+from bitmovin import BitmovinController
+from status_watcher import EncodingStatusWatcher
+from webhooks import WebhookListener
+
+
+class StubBitmovinApi:
+    """Stand-in for the endpoints of the SDK used to start, watch and be
+    notified about an encoding, which records the calls made in order"""
+
+    def __init__(self, status: bm.Status) -> None:
+        self.status = status
+        self.calls = []
+
+        self.encodings = SimpleNamespace(status=self._status)
+        self.templates = SimpleNamespace(start=self._start_template)
+        webhooks = SimpleNamespace(create_by_encoding_id=self._create_webhook)
+        self.notifications = SimpleNamespace(
+            webhooks=SimpleNamespace(
+                encoding=SimpleNamespace(
+                    encodings=SimpleNamespace(
+                        finished=webhooks, error=webhooks, transfer_error=webhooks
+                    )
+                )
+            )
+        )
+
+    def _status(self, encoding_id: str) -> bm.Task:
+        self.calls.append("status")
+        return bm.Task(status=self.status, progress=100)
+
+    def _start_template(self, encoding_template_request):
+        self.calls.append("start")
+        return SimpleNamespace(encoding_id="encoding-1")
+
+    def _create_webhook(self, encoding_id: str, webhook: bm.Webhook):
+        self.calls.append("webhook")
+        return webhook
+
+
+def post(port: int, path: str) -> int:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request("POST", path, body=b"{}")
+        return connection.getresponse().status
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def listener():
+    api = StubBitmovinApi(status=bm.Status.RUNNING)
+    # Without notifications, the status would only be checked again in a minute
+    watcher = EncodingStatusWatcher(encoding_api=api, min_interval=60, max_interval=60)
+    listener = WebhookListener(watcher, public_url="http://127.0.0.1", port=0)
+    listener.start()
+    yield (api, watcher, listener)
+    listener.stop()
+
+
+def test_notification_resolves_the_waiting_caller(listener):
+    (api, watcher, listener) = listener
+
+    finished = watcher.watch(encoding_id="encoding-1")
+    with pytest.raises(futures.TimeoutError):
+        finished.result(timeout=0.5)
+    assert api.calls == ["status"]
+
+    api.status = bm.Status.FINISHED
+    assert post(listener.port, "/bitmovin/encodings/encoding-1") == 204
+    assert finished.result(timeout=5).status is bm.Status.FINISHED
+    assert api.calls == ["status", "status"]
+
+
+def test_other_routes_are_rejected(listener):
+    (api, _, listener) = listener
+
+    assert post(listener.port, "/bitmovin/encodings") == 404
+    assert post(listener.port, "/other/encodings/encoding-1") == 404
+    assert api.calls == []
+
+
+def test_template_encoding_finished_before_its_webhooks_is_not_waited_for():
+    config = SimpleNamespace(
+        BITMOVIN_API_KEY="stub",
+        WEBHOOK_PUBLIC_URL="http://127.0.0.1",
+        WEBHOOK_LISTEN_PORT=0,
+        WEBHOOK_FALLBACK_POLL_INTERVAL=60,
+    )
+    controller = BitmovinController(config=config)
+    # The encoding is over by the time the webhooks are registered
+    api = StubBitmovinApi(status=bm.Status.FINISHED)
+    controller.bitmovin_api = api
+    controller.encoding_api = api
+    controller.status_watcher.encoding_api = api
+
+    try:
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            encoding = executor.submit(
+                controller.execute_encoding_template,
+                name="test",
+                template={},
+                manifests=[],
+            ).result(timeout=5)
+    finally:
+        controller.webhook_listener.stop()
+
+    assert encoding.id == "encoding-1"
+    assert api.calls == ["start", "webhook", "webhook", "webhook", "status"]
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from typing import Optional
+
+from status_watcher import EncodingStatusWatcher
+
+max_request_size = 1024 * 1024
+
+ENCODINGS_ROUTE = ["bitmovin", "encodings"]
+
+
+class WebhookListener:
+    """Embedded HTTP server for Bitmovin webhook notifications.
+
+    Webhooks are registered with a URL that ends with the ID of the encoding
+    they relate to. When a notification arrives, the status watcher is asked to
+    check that encoding right away, so that waiting callers are resolved within
+    a single API call of the event, instead of at the next scheduled poll.
+    The payload itself isn't trusted: a forged notification only ever triggers
+    an extra status check.
+    """
+
+    def __init__(
+        self,
+        status_watcher: EncodingStatusWatcher,
+        public_url: str,
+        host: str = "0.0.0.0",
+        port: int = 8080,
+    ) -> None:
+        self.status_watcher = status_watcher
+        self.public_url = public_url.rstrip("/")
+        self.host = host
+        self.port = port
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._started = threading.Event()
+        self._error: Optional[Exception] = None
+
+    def url_for(self, encoding_id: str) -> str:
+        return f"{self.public_url}/bitmovin/encodings/{encoding_id}"
+
+    def start(self) -> None:
+        if self._loop is not None:
+            return
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._run, name="webhook-listener", daemon=True).start()
+        self._started.wait()
+        if self._error:
+            self._loop = None
+            raise self._error
+        print(f"Listening for Bitmovin webhooks on {self.host}:{self.port}")
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+    def _run(self) -> None:
+        loop = self._loop
+        asyncio.set_event_loop(loop)
+        try:
+            server = loop.run_until_complete(
+                asyncio.start_server(self._handle, host=self.host, port=self.port)
+            )
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            loop.close()
+            return
+
+        # The port the server is bound to, when asked for any free one
+        self.port = server.sockets[0].getsockname()[1]
+        self._started.set()
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+            (method, target, _) = request_line.decode("latin-1").split(" ", 2)
+
+            content_length = 0
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=10)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                (name, _, value) = line.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    content_length = int(value.strip())
+
+            if content_length > max_request_size:
+                await self._respond(writer, 413, "Payload Too Large")
+                return
+            await reader.readexactly(content_length)
+
+            route = target.split("?")[0].strip("/").split("/")
+            if method != "POST" or len(route) != 3 or route[:2] != ENCODINGS_ROUTE:
+                await self._respond(writer, 404, "Not Found")
+                return
+
+            self.status_watcher.poke(encoding_id=route[2])
+            await self._respond(writer, 204, "No Content")
+
+        except (ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            await self._respond(writer, 400, "Bad Request")
+        finally:
+            writer.close()
+
+    async def _respond(
+        self, writer: asyncio.StreamWriter, status: int, reason: str
+    ) -> None:
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\n"
+            "Content-Length: 0\r\nConnection: close\r\n\r\n".encode("latin-1")
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
@@ -0,0 +1,635 @@
+import argparse
+import importlib
+import json
+import os
+import signal
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import path
+from time import perf_counter, sleep, time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from batch import BatchScheduler, job_from_row
+from config_check import check_config, describe_problems
+from splice_detection import create_splice_detector
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+STATUSES = [QUEUED, RUNNING, DONE, FAILED]
+
+max_request_size = 1024 * 1024
+
+COLUMNS = "id, spec, status, result, submitted_at, started_at, finished_at"
+
+
+class JobQueue:
+    """Durable local queue of AVOD jobs, in SQLite.
+
+    Jobs are kept once finished, with their result, so that their status can
+    be checked at any time. A job is claimed by moving it from queued to
+    running in a single transaction, so that several workers can share the
+    same queue file. Claimed jobs are leased to their worker, which renews the
+    lease with `heartbeat` while it runs. Jobs whose lease expired, because
+    their worker stopped, are queued again by `requeue_expired`, and resume
+    from their journal.
+    """
+
+    def __init__(self, db_path: str, lease: float = 60.0) -> None:
+        self.lease = lease
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            db_path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " spec TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " submitted_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " owner TEXT,"
+            " heartbeat_at REAL)"
+        )
+        # Queues created before leases
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(jobs)")]
+        for column in ["owner TEXT", "heartbeat_at REAL"]:
+            if column.split()[0] not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column}")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_by_status"
+            " ON jobs (status, submitted_at)"
+        )
+
+    def submit(self, spec: Dict) -> Dict:
+        """Queue a job, unless a job with the same ID is queued, running or
+        done. Failed jobs are queued again."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT status FROM jobs WHERE id = ?", (spec["id"],)
+                ).fetchone()
+                if row is None:
+                    self._db.execute(
+                        "INSERT INTO jobs (id, spec, status, submitted_at)"
+                        " VALUES (?, ?, ?, ?)",
+                        (spec["id"], json.dumps(spec), QUEUED, time()),
+                    )
+                elif row[0] == FAILED:
+                    self._db.execute(
+                        "UPDATE jobs SET spec = ?, status = ?, result = NULL,"
+                        " submitted_at = ?, started_at = NULL, finished_at = NULL"
+                        " WHERE id = ?",
+                        (json.dumps(spec), QUEUED, time(), spec["id"]),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+        return self.get(spec["id"])
+
+    def claim(self) -> Optional[Tuple[str, Dict]]:
+        """The ID and spec of the oldest queued job, now marked as running"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT id, spec FROM jobs WHERE status = ?"
+                    " ORDER BY submitted_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, owner = ?,"
+                        " heartbeat_at = ? WHERE id = ?",
+                        (RUNNING, time(), self.worker_id, time(), row[0]),
+                    )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+        return (row[0], json.loads(row[1])) if row else None
+
+    def finish(self, job_id: str, result: Dict) -> None:
+        """Record the result of a job, unless another worker took it over"""
+        status = DONE if result.get("status") == DONE else FAILED
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ?,"
+                " owner = NULL WHERE id = ? AND status = ? AND owner = ?",
+                (status, json.dumps(result), time(), job_id, RUNNING, self.worker_id),
+            )
+
+    def heartbeat(self) -> None:
+        """Renew the lease of the jobs this worker is running"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND owner = ?",
+                (time(), RUNNING, self.worker_id),
+            )
+
+    def requeue_expired(self) -> int:
+        """Queue again the running jobs whose worker stopped renewing them"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, owner = NULL"
+                " WHERE status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (QUEUED, RUNNING, time() - self.lease),
+            )
+
+        return cursor.rowcount
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+
+        return _job_record(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        with self._lock:
+            if status:
+                rows = self._db.execute(
+                    f"SELECT {COLUMNS} FROM jobs WHERE status = ?"
+                    " ORDER BY submitted_at DESC LIMIT ?",
+                    (status, limit),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    f"SELECT {COLUMNS} FROM jobs ORDER BY submitted_at DESC LIMIT ?",
+                    (limit,),
+                ).fetchall()
+
+        return [_job_record(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+
+        return dict({status: 0 for status in STATUSES}, **dict(rows))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def _job_record(row) -> Dict:
+    (job_id, spec, status, result, submitted_at, started_at, finished_at) = row
+    return {
+        "id": job_id,
+        "status": status,
+        "spec": json.loads(spec),
+        "result": json.loads(result) if result else None,
+        "submitted_at": submitted_at,
+        "started_at": started_at,
+        "finished_at": finished_at,
+    }
+
+
+class JobWorker:
+    """Long-running worker that processes the jobs of a queue.
+
+    The Bitmovin and broadpeak.io controllers of the scheduler are created
+    once, along with their HTTP connections, inputs, outputs and configuration
+    cache, and shared by all jobs, so that a job costs no more than its own
+    API calls. Up to `concurrency` jobs are processed at once, and encodings
+    still wait for one of the scheduler's slots.
+    """
+
+    def __init__(
+        self,
+        scheduler: BatchScheduler,
+        job_queue: JobQueue,
+        concurrency: int,
+        poll_interval: float = 5.0,
+    ) -> None:
+        self.scheduler = scheduler
+        self.job_queue = job_queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+
+        self._stopping = False
+        self._wake_up = threading.Condition()
+        self._threads: List[threading.Thread] = []
+
+    def submit(self, spec: Dict) -> Dict:
+        """Queue a job from the fields of a line of a batch job list"""
+        spec = dict(spec, id=spec.get("id") or uuid.uuid4().hex)
+        # Rejects specs the scheduler couldn't process
+        job_from_row(self.scheduler.config, spec, default_id=spec["id"])
+
+        record = self.job_queue.submit(spec)
+        with self._wake_up:
+            self._wake_up.notify()
+        return record
+
+    def start(self) -> None:
+        self._requeue_expired()
+        threading.Thread(
+            target=self._renew_leases, name="job-leases", daemon=True
+        ).start()
+
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}")
+            # Jobs still running when the process exits are resumed on restart
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Stop claiming jobs. Jobs in progress are left running"""
+        with self._wake_up:
+            self._stopping = True
+            self._wake_up.notify_all()
+
+    def _renew_leases(self) -> None:
+        # Runs as long as the process, as jobs in progress keep running when
+        # the worker stops claiming new ones
+        while True:
+            sleep(self.job_queue.lease / 4)
+            self.job_queue.heartbeat()
+            self._requeue_expired()
+
+    def _requeue_expired(self) -> None:
+        requeued = self.job_queue.requeue_expired()
+        if requeued:
+            print(f"Resuming {requeued} jobs left running by a stopped worker")
+            with self._wake_up:
+                self._wake_up.notify_all()
+
+    def _work(self) -> None:
+        while True:
+            with self._wake_up:
+                if self._stopping:
+                    return
+            claimed = self.job_queue.claim()
+            if claimed is None:
+                # Jobs can also be queued by other processes sharing the queue
+                with self._wake_up:
+                    if not self._stopping:
+                        self._wake_up.wait(timeout=self.poll_interval)
+                continue
+
+            (job_id, spec) = claimed
+            try:
+                job = job_from_row(self.scheduler.config, spec, default_id=job_id)
+                result = self.scheduler.process(job)
+            except Exception as e:
+                result = {"id": job_id, "status": FAILED, "error": str(e)}
+            self.job_queue.finish(job_id, result)
+
+
+class JobAPIServer:
+    """Local HTTP API of a worker.
+
+    - `POST /jobs` queues a job (or a list of jobs), described like a line of
+      a batch job list, and returns its status
+    - `GET /jobs/<id>` returns the status and result of a job
+    - `GET /jobs?status=failed&limit=100` lists the latest jobs
+    - `GET /status` returns the number of jobs in each status
+
+    The API has no authentication: it only listens on the loopback interface,
+    unless told otherwise.
+    """
+
+    def __init__(self, worker: JobWorker, host: str = "127.0.0.1", port: int = 8090):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                route = url.path.strip("/").split("/")
+                query = parse_qs(url.query)
+
+                if route == ["status"]:
+                    return self._respond(200, worker.job_queue.counts())
+                if route == ["jobs"]:
+                    try:
+                        limit = int(query.get("limit", [100])[0])
+                    except ValueError:
+                        return self._respond(400, {"error": "invalid limit"})
+                    jobs = worker.job_queue.list(
+                        status=query.get("status", [None])[0], limit=limit
+                    )
+                    return self._respond(200, jobs)
+                if len(route) == 2 and route[0] == "jobs":
+                    record = worker.job_queue.get(route[1])
+                    if record:
+                        return self._respond(200, record)
+                self._respond(404, {"error": "not found"})
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("content-length", 0))
+                except ValueError:
+                    length = -1
+                # A negative length would read until the client hangs up. The
+                # body is left unread, so the connection can't be kept alive
+                if length < 0:
+                    self.close_connection = True
+                    return self._respond(400, {"error": "invalid content-length"})
+                if length > max_request_size:
+                    self.close_connection = True
+                    return self._respond(413, {"error": "payload too large"})
+                body = self.rfile.read(length)
+
+                if urlparse(self.path).path.strip("/") != "jobs":
+                    return self._respond(404, {"error": "not found"})
+                try:
+                    specs = json.loads(body)
+                    if isinstance(specs, list):
+                        records = [worker.submit(spec) for spec in specs]
+                    else:
+                        records = worker.submit(specs)
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    return self._respond(400, {"error": f"invalid job: {e!r}"})
+                self._respond(202, records)
+
+            def _respond(self, status: int, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+    def start(self) -> None:
+        threading.Thread(
+            target=self._server.serve_forever, name="job-api", daemon=True
+        ).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def create_worker(
+    cfg, args, queue_path: str, journal_path: Optional[str]
+) -> JobWorker:
+    if args.offline:
+        from offline import OfflineBitmovinController, OfflineBroadpeakIOController
+
+        broadpeakio = OfflineBroadpeakIOController(
+            config=cfg, api_latency=args.offline_api_latency
+        )
+        bitmovin = OfflineBitmovinController(
+            config=cfg,
+            api_latency=args.offline_api_latency,
+            encoding_duration=args.offline_encoding_duration,
+        )
+    else:
+        from bitmovin import BitmovinController
+        from broadpeak import BroadpeakIOController
+
+        broadpeakio = BroadpeakIOController(config=cfg)
+        bitmovin = BitmovinController(config=cfg)
+
+    # Jobs without splice points get them from an analysis of their source
+    splice_detector = None
+    if getattr(cfg, "DETECT_SPLICE_POINTS", False) and not args.offline:
+        splice_detector = create_splice_detector(cfg)
+
+    max_concurrent_encodings = args.max_concurrent_encodings or getattr(
+        cfg, "MAX_CONCURRENT_ENCODINGS", 10
+    )
+    scheduler = BatchScheduler(
+        bitmovin=bitmovin,
+        broadpeakio=broadpeakio,
+        config=cfg,
+        max_concurrent_encodings=max_concurrent_encodings,
+        max_configured_ahead=args.max_configured_ahead,
+        journal_path=journal_path,
+        splice_detector=splice_detector,
+    )
+    return JobWorker(
+        scheduler=scheduler,
+        job_queue=JobQueue(queue_path),
+        concurrency=max_concurrent_encodings + args.max_configured_ahead,
+    )
+
+
+def main():
+    args = parse_arguments()
+
+    cfg = importlib.import_module(args.config)
+
+    if args.benchmark:
+        benchmark(cfg, args)
+        return
+
+    problems = [] if args.offline else check_config(cfg)
+    if problems:
+        print(describe_problems(problems))
+        sys.exit(1)
+
+    worker = create_worker(
+        cfg,
+        args,
+        queue_path=args.queue or getattr(cfg, "WORKER_QUEUE_PATH", "jobs_queue.sqlite"),
+        journal_path=None if args.offline else getattr(cfg, "JOURNAL_PATH", None),
+    )
+    api = JobAPIServer(
+        worker,
+        host=args.host,
+        port=args.port if args.port is not None else getattr(cfg, "WORKER_PORT", 8090),
+    )
+
+    stopping = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stopping.set())
+
+    worker.start()
+    api.start()
+    print(f"Worker ready, accepting jobs on http://{args.host}:{api.port}/jobs")
+
+    while not stopping.wait(args.report_interval):
+        print(
+            worker.scheduler.metrics.report(
+                queue_depth=worker.job_queue.counts()[QUEUED]
+            )
+        )
+
+    print("Stopping, jobs in progress will be resumed once their lease expires")
+    api.stop()
+    worker.stop()
+    if worker.scheduler.splice_detector:
+        worker.scheduler.splice_detector.close()
+
+
+def benchmark(cfg, args) -> None:
+    """Compare the overhead of a job on a worker with that of a run of main.py,
+    with stand-ins of the APIs that answer immediately"""
+    import requests
+
+    args.offline = True
+    args.offline_api_latency = 0
+    args.offline_encoding_duration = 0
+
+    with tempfile.TemporaryDirectory() as tmp:
+        worker = create_worker(
+            cfg,
+            args,
+            queue_path=path.join(tmp, "queue.sqlite"),
+            journal_path=path.join(tmp, "journal.sqlite"),
+        )
+        api = JobAPIServer(worker, port=0)
+        worker.start()
+        api.start()
+
+        url = f"http://127.0.0.1:{api.port}/jobs"
+        spec = {"video": cfg.SOURCE_FILE_PATH_VIDEO}
+        latencies = []
+        with requests.Session() as session:
+            # One job at a time, so that jobs don't wait for each other
+            for i in range(args.benchmark):
+                start = perf_counter()
+                response = session.post(url, json=dict(spec, id=f"benchmark-{i}"))
+                job_id = response.json()["id"]
+                while session.get(f"{url}/{job_id}").json()["status"] != DONE:
+                    sleep(0.001)
+                latencies.append(perf_counter() - start)
+
+        api.stop()
+        worker.stop()
+        worker.job_queue.close()
+
+    print(
+        "Worker: p50 {0:.1f}ms per job, over {1} jobs".format(
+            statistics.median(latencies) * 1000, args.benchmark
+        )
+    )
+
+    durations = []
+    for _ in range(args.benchmark_runs):
+        start = perf_counter()
+        subprocess.run(
+            [
+                sys.executable,
+                "main.py",
+                "-c",
+                args.config,
+                "--offline",
+                "--offline-api-latency",
+                "0",
+                "--offline-encoding-duration",
+                "0",
+            ],
+            cwd=path.dirname(path.abspath(__file__)),
+            capture_output=True,
+            check=True,
+        )
+        durations.append(perf_counter() - start)
+    # Offline runs don't import the Bitmovin SDK, nor authenticate and look up
+    # the input and output: real runs of main.py take longer still
+    print(
+        "main.py: p50 {0:.0f}ms per job, over {1} runs, plus the Bitmovin SDK "
+        "import and set-up of real runs (see startup_benchmark.py)".format(
+            statistics.median(durations) * 1000, args.benchmark_runs
+        )
+    )
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Process AVOD jobs submitted to a local HTTP API, "
+        "from a persistent queue"
+    )
+    parser.add_argument("-c", "--config", help="path to config file", default="config")
+    parser.add_argument(
+        "-q",
+        "--queue",
+        help="path to the SQLite queue of jobs "
+        "(defaults to WORKER_QUEUE_PATH in the config file)",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="interface the HTTP API listens on",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help="port of the HTTP API (defaults to WORKER_PORT in the config file)",
+    )
+    parser.add_argument(
+        "--max-concurrent-encodings",
+        type=int,
+        help="number of encodings to run at once "
+        "(defaults to MAX_CONCURRENT_ENCODINGS in the config file)",
+    )
+    parser.add_argument(
+        "--max-configured-ahead",
+        type=int,
+        default=2,
+        help="number of encodings to configure ahead of a free encoding slot",
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=60,
+        help="interval in seconds between progress reports",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="simulate the Bitmovin and broadpeak.io APIs instead of calling them",
+    )
+    parser.add_argument(
+        "--offline-api-latency",
+        type=float,
+        default=0.1,
+        help="simulated latency of an API call, in seconds",
+    )
+    parser.add_argument(
+        "--offline-encoding-duration",
+        type=float,
+        default=5.0,
+        help="simulated duration of an encoding, in seconds",
+    )
+    parser.add_argument(
+        "--benchmark",
+        type=int,
+        help="measure the overhead of this number of jobs on a worker, "
+        "against runs of main.py, with stand-ins of the APIs",
+    )
+    parser.add_argument(
+        "--benchmark-runs",
+        type=int,
+        default=5,
+        help="number of runs of main.py to compare the worker with",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
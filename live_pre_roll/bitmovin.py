@@ -1,12 +1,21 @@
+import hashlib
+import threading
+from concurrent.futures import Future
 from os import path
 from time import sleep
-from typing import List, Tuple
+from typing import Callable, List, Optional, Tuple
 
 import bitmovin_api_sdk as bm
 import config as cfg
+from config_cache import ConfigurationCache
+from executor import ResourceGraph
+from journal import JobJournal
+from status_watcher import EncodingStatusWatcher
+from webhooks import WebhookListener
 
 max_minutes_to_wait_for_live_encoding_details = 5
 max_minutes_to_wait_for_encoding_status = 5
+max_seconds_between_encoding_status_checks = 15
 
 # Automatically shutdown the live stream
 # if there is no input anymore for a predefined number of seconds.
@@ -16,13 +25,25 @@ stream_timeout_minutes = 1 * 60
 # How far behind real time the live edge is. Longer for more stable streams,
 # lower for lower latency streams
 live_edge_offset = 30
+# Live edge offset in low latency mode (LOW_LATENCY in the config file), where
+# segments are written in chunks as they are encoded
+low_latency_live_edge_offset = 4
+# Duration of the CMAF chunks in low latency mode, in seconds
+low_latency_chunk_duration = 0.5
 # How long the timeshift window is, ie. how far back from the live edge
 # the user can rewind
 timeshift_window = 300
 
 
+# Video and audio codec configurations of the ladders
+CodecConfigurations = Tuple[
+    List[bm.H264VideoConfiguration], List[bm.AacAudioConfiguration]
+]
+
+
 class BitmovinController:
-    def __init__(self) -> None:
+    def __init__(self, journal: Optional[JobJournal] = None) -> None:
+        self.journal = journal
         self.bitmovin_api = bm.BitmovinApi(
             api_key=cfg.BITMOVIN_API_KEY,
             tenant_org_id=getattr(cfg, "BITMOVIN_TENANT_ORG_ID", ""),
@@ -31,80 +52,216 @@ class BitmovinController:
 
         self.encoding_api = self.bitmovin_api.encoding
         self.hls_api = self.bitmovin_api.encoding.manifests.hls
-
-        if hasattr(cfg, "S3_OUTPUT_ID"):
-            self.output = self._get_s3_output(output_id=cfg.S3_OUTPUT_ID)
+        self.dash_api = self.bitmovin_api.encoding.manifests.dash
+
+        self.webhook_listener = None
+        if hasattr(cfg, "WEBHOOK_PUBLIC_URL"):
+            # Notifications tell when the encoding changes status, polling is
+            # only a fallback in case one of them gets lost
+            fallback_interval = getattr(cfg, "WEBHOOK_FALLBACK_POLL_INTERVAL", 60)
+            self.status_watcher = EncodingStatusWatcher(
+                encoding_api=self.encoding_api,
+                min_interval=fallback_interval,
+                max_interval=fallback_interval,
+            )
+            self.webhook_listener = WebhookListener(
+                status_watcher=self.status_watcher,
+                public_url=cfg.WEBHOOK_PUBLIC_URL,
+                port=getattr(cfg, "WEBHOOK_LISTEN_PORT", 8080),
+            )
+            self.webhook_listener.start()
         else:
-            self.output = self._create_s3_output(
-                bucket_name=getattr(cfg, "S3_OUTPUT_BUCKET_NAME"),
-                access_key=getattr(cfg, "S3_OUTPUT_ACCESS_KEY"),
-                secret_key=getattr(cfg, "S3_OUTPUT_SECRET_KEY"),
+            self.status_watcher = EncodingStatusWatcher(
+                encoding_api=self.encoding_api,
+                max_interval=max_seconds_between_encoding_status_checks,
+            )
+
+        self.configuration_cache = None
+        if hasattr(cfg, "CONFIGURATION_CACHE_PATH"):
+            self.configuration_cache = ConfigurationCache(
+                db_path=cfg.CONFIGURATION_CACHE_PATH,
+                namespace=self._account_namespace(),
             )
-            print(f"Created S3 output with id {self.output.id}")
+
+        # The output is only looked up (or created) when first used
+        self._output = None
+        self._resources_lock = threading.Lock()
+
+    @property
+    def output(self) -> bm.S3Output:
+        return self.resolve_output()
+
+    def resolve_output(self) -> bm.S3Output:
+        """S3 output of the config file, looked up or created on the first call"""
+        with self._resources_lock:
+            if self._output is None:
+                self._output = self._get_or_create_s3_output()
+
+        return self._output
+
+    def _get_or_create_s3_output(self) -> bm.S3Output:
+        if hasattr(cfg, "S3_OUTPUT_ID"):
+            return self._get_s3_output(output_id=cfg.S3_OUTPUT_ID)
+        if self._recorded_id("s3_output"):
+            return self._get_s3_output(output_id=self._recorded_id("s3_output"))
+
+        s3_output = self._create_s3_output(
+            bucket_name=getattr(cfg, "S3_OUTPUT_BUCKET_NAME"),
+            access_key=getattr(cfg, "S3_OUTPUT_ACCESS_KEY"),
+            secret_key=getattr(cfg, "S3_OUTPUT_SECRET_KEY"),
+        )
+        self._record_resource("s3_output", s3_output.id)
+        print(f"Using S3 output with id {s3_output.id}")
+        return s3_output
 
     def encode_and_package(
         self,
         name: str,
         output_sub_path: str,
+        stream_key: Optional[str] = None,
+        rtmp_input: Optional[bm.RtmpInput] = None,
+        journal: Optional[JobJournal] = None,
     ) -> Tuple[bm.Encoding, bm.LiveEncoding, List[bm.HlsManifest | bm.DashManifest]]:
-        rtmp_input = self._get_rtmp_input()
+        """Start a live encoding and wait until it is ready for ingest.
+
+        The stream key and RTMP input default to the ones of the config file,
+        and the journal to the controller's one.
+        """
+        journal = journal or self.journal
+        (encoding, request, manifests) = self.configure_live_encoding(
+            name=name,
+            output_sub_path=output_sub_path,
+            stream_key=stream_key,
+            rtmp_input=rtmp_input,
+            journal=journal,
+        )
+
+        if journal:
+            journal.start_phase(
+                "encode",
+                encoding_id=encoding.id,
+                manifest_urls=self.determine_origin_urls(manifests),
+            )
+
+        live_encoding = self.start_live_encoding(encoding=encoding, request=request)
+        if journal:
+            journal.complete_phase("encode")
 
-        encoding = self._create_encoding(name=name, description="")
+        return (encoding, live_encoding, manifests)
+
+    def configure_live_encoding(
+        self,
+        name: str,
+        output_sub_path: str,
+        stream_key: Optional[str] = None,
+        rtmp_input: Optional[bm.RtmpInput] = None,
+        journal: Optional[JobJournal] = None,
+        codec_configurations: Optional[CodecConfigurations] = None,
+    ) -> Tuple[
+        bm.Encoding,
+        bm.StartLiveEncodingRequest,
+        List[bm.HlsManifest | bm.DashManifest],
+    ]:
+        """Create a live encoding and its resources, and the request to start it.
+
+        The codec configurations of the ladders can be created beforehand
+        with `create_codec_configurations`.
+        """
+        # All resources are declared in a graph, and created in parallel
+        # as soon as the resources they depend on are available
+        graph = ResourceGraph(max_workers=getattr(cfg, "MAX_PARALLEL_API_CALLS", 8))
+
+        if rtmp_input is None:
+            rtmp_input = graph.add("rtmp_input", self.get_rtmp_input)
+
+        def create_encoding() -> bm.Encoding:
+            encoding = self._create_encoding(name=name, description="")
+            if journal:
+                journal.record_resource("encoding", encoding.id)
+            return encoding
+
+        encoding = graph.add("encoding", create_encoding)
 
         # ABR Ladder
-        video_configurations = [
-            self._create_h264_video_configuration(
-                height=r.height,
-                bitrate=r.bitrate,
-                profile=bm.ProfileH264(r.profile.upper()),
-                level=bm.LevelH264(r.level),
-                rate=cfg.FRAME_RATE,
-            )
-            for r in cfg.VIDEO_LADDER
-        ]
+        if codec_configurations is None:
+            codec_configurations = self._add_codec_configurations(graph)
+        (video_configurations, audio_configurations) = codec_configurations
 
-        audio_configurations = [
-            self._create_aac_audio_configuration(bitrate=r.bitrate)
-            for r in cfg.AUDIO_LADDER
-        ]
+        # In low latency mode, HLS and DASH share chunked CMAF segments, which
+        # are written chunk by chunk while being encoded, instead of TS segments
+        low_latency = getattr(cfg, "LOW_LATENCY", False)
+        create_muxing = self._create_cmaf_muxing if low_latency else self._create_ts_muxing
+        muxing_type = "cmaf" if low_latency else "ts"
 
         # create video streams and muxings
-        for i, video_config in enumerate(video_configurations):
-            h264_video_stream = self._create_stream(
+        for i, (rung, video_config) in enumerate(
+            zip(cfg.VIDEO_LADDER, video_configurations)
+        ):
+            h264_video_stream = graph.add(
+                f"video_stream_{i}",
+                self._create_stream,
                 encoding=encoding,
                 input=rtmp_input,
                 input_path="live",
                 codec_configuration=video_config,
             )
 
-            relative_path_ts = f"video/{video_config.bitrate}/ts"
-            self._create_ts_muxing(
+            relative_path = f"video/{rung.bitrate}/{muxing_type}"
+            graph.add(
+                f"video_muxing_{i}",
+                create_muxing,
                 encoding=encoding,
                 output=self.output,
-                output_path=f"{output_sub_path}/{relative_path_ts}",
+                output_path=f"{output_sub_path}/{relative_path}",
                 stream=h264_video_stream,
             )
 
         # create audio streams and muxings
-        for i, audio_config in enumerate(audio_configurations):
-            audio_stream = self._create_stream(
+        for i, (rung, audio_config) in enumerate(
+            zip(cfg.AUDIO_LADDER, audio_configurations)
+        ):
+            audio_stream = graph.add(
+                f"audio_stream_{i}",
+                self._create_stream,
                 encoding=encoding,
                 input=rtmp_input,
                 input_path="live",
                 codec_configuration=audio_config,
             )
 
-            relative_path_ts = f"audio/{audio_config.bitrate}/ts"
-            self._create_ts_muxing(
+            relative_path = f"audio/{rung.bitrate}/{muxing_type}"
+            graph.add(
+                f"audio_muxing_{i}",
+                create_muxing,
                 encoding=encoding,
                 output=self.output,
-                output_path=f"{output_sub_path}/{relative_path_ts}",
+                output_path=f"{output_sub_path}/{relative_path}",
                 stream=audio_stream,
             )
 
-        hls_manifest = self._generate_hls_manifest_default(
-            encoding=encoding, output=self.output, output_path=output_sub_path
+        graph.add(
+            "hls_manifest",
+            self._generate_hls_manifest_default,
+            encoding=encoding,
+            output=self.output,
+            output_path=output_sub_path,
+            use_cmaf=low_latency,
         )
+        if low_latency:
+            graph.add(
+                "dash_manifest",
+                self._generate_dash_manifest_default,
+                encoding=encoding,
+                output=self.output,
+                output_path=output_sub_path,
+            )
+
+        resources = graph.run()
+        encoding = resources["encoding"]
+        hls_manifest = resources["hls_manifest"]
+        manifests = [hls_manifest]
+        if low_latency:
+            manifests.append(resources["dash_manifest"])
 
         # Setting the auto_shutdown_configuration is optional;
         # if omitted the live encoding will not shut down automatically.
@@ -114,27 +271,117 @@ class BitmovinController:
         )
 
         start_live_encoding_request = bm.StartLiveEncodingRequest(
-            stream_key=cfg.RTMP_STREAM_KEY,
+            stream_key=stream_key or cfg.RTMP_STREAM_KEY,
             auto_shutdown_configuration=auto_shutdown_configuration,
         )
 
+        edge_offset = low_latency_live_edge_offset if low_latency else live_edge_offset
         start_live_encoding_request.hls_manifests = [
             bm.LiveHlsManifest(
                 manifest_id=hls_manifest.id,
                 timeshift=timeshift_window,
-                live_edge_offset=live_edge_offset,
+                live_edge_offset=edge_offset,
                 insert_program_date_time=True,
             )
         ]
+        if low_latency:
+            start_live_encoding_request.dash_manifests = [
+                bm.LiveDashManifest(
+                    manifest_id=manifests[1].id,
+                    timeshift=timeshift_window,
+                    live_edge_offset=edge_offset,
+                    suggested_presentation_delay=edge_offset,
+                    minimum_update_period=cfg.SEGMENT_DURATION,
+                    availability_start_time_mode=(
+                        bm.AvailabilityStartTimeMode.ON_FIRST_SEGMENT
+                    ),
+                )
+            ]
+
+        return (encoding, start_live_encoding_request, manifests)
+
+    def create_codec_configurations(self) -> CodecConfigurations:
+        """Video and audio codec configurations of the ladders of the config file,
+        created in parallel"""
+        graph = ResourceGraph(max_workers=getattr(cfg, "MAX_PARALLEL_API_CALLS", 8))
+        (video_refs, audio_refs) = self._add_codec_configurations(graph)
+        resources = graph.run()
+
+        return (
+            [resources[r.key] for r in video_refs],
+            [resources[r.key] for r in audio_refs],
+        )
+
+    def _add_codec_configurations(self, graph: ResourceGraph) -> Tuple[List, List]:
+        video_configurations = [
+            graph.add(
+                f"video_config_{i}",
+                self._create_h264_video_configuration,
+                height=r.height,
+                bitrate=r.bitrate,
+                profile=bm.ProfileH264(r.profile.upper()),
+                level=bm.LevelH264(r.level),
+                rate=cfg.FRAME_RATE,
+            )
+            for i, r in enumerate(cfg.VIDEO_LADDER)
+        ]
+
+        audio_configurations = [
+            graph.add(
+                f"audio_config_{i}",
+                self._create_aac_audio_configuration,
+                bitrate=r.bitrate,
+            )
+            for i, r in enumerate(cfg.AUDIO_LADDER)
+        ]
+
+        return (video_configurations, audio_configurations)
 
+    def start_live_encoding(
+        self, encoding: bm.Encoding, request: bm.StartLiveEncodingRequest
+    ) -> bm.LiveEncoding:
+        """Start a configured live encoding, and wait until it is ready for ingest"""
         self._start_live_encoding_and_wait_until_running(
-            encoding=encoding, request=start_live_encoding_request
+            encoding=encoding, request=request
         )
 
+        return self._wait_for_live_encoding_details(encoding=encoding)
+
+    def resume_encoding(
+        self, journal: JobJournal
+    ) -> Optional[Tuple[bm.Encoding, bm.LiveEncoding, List[str]]]:
+        """Live encoding of the job recorded in the journal, if it is still up.
+
+        Returns the encoding, its live details and its manifest URLs, after
+        waiting for it to be running if it was still starting. None is returned
+        if there is no live encoding to resume, ie. if the job needs a new one.
+        """
+        if journal.phase_status("encode") is None:
+            return None
+
+        data = journal.phase_data("encode")
+        encoding = bm.Encoding(name=journal.job_id)
+        encoding.id = data["encoding_id"]
+
+        # Encodings recorded before being started never got past CREATED,
+        # and may not have been fully configured: they are not reused
+        task = self.encoding_api.encodings.status(encoding_id=encoding.id)
+        if task.status is bm.Status.QUEUED:
+            self._wait_until_encoding_is_in_state(
+                encoding=encoding, expected_status=bm.Status.RUNNING
+            )
+        elif task.status is not bm.Status.RUNNING:
+            return None
+
+        print(f"Reattaching to live encoding {encoding.id}")
         live_encoding = self._wait_for_live_encoding_details(encoding=encoding)
-        return (encoding, live_encoding, [hls_manifest])
+        journal.complete_phase("encode")
+
+        return (encoding, live_encoding, data["manifest_urls"])
 
-    def determine_origin_urls(self, manifests: List[bm.HlsManifest]):
+    def determine_origin_urls(
+        self, manifests: List[bm.HlsManifest | bm.DashManifest]
+    ) -> List[str]:
         baseurl = f"https://{self.output.bucket_name}.s3.amazonaws.com/"
         manifest_urls = []
 
@@ -147,6 +394,10 @@ class BitmovinController:
 
         return manifest_urls
 
+    def watch_encoding(self, encoding: bm.Encoding) -> Future:
+        """Future resolved with the last status of the encoding once it has ended"""
+        return self.status_watcher.watch(encoding_id=encoding.id)
+
     def stop_encoding(self, encoding: bm.Encoding):
         self.encoding_api.encodings.live.stop(encoding_id=encoding.id)
         self._wait_until_encoding_is_in_state(
@@ -156,35 +407,34 @@ class BitmovinController:
     def _wait_until_encoding_is_in_state(
         self, encoding: bm.Encoding, expected_status: bm.Status
     ):
-        check_interval_in_seconds = 15
-        max_attempts = int(
-            max_minutes_to_wait_for_encoding_status * (60 / check_interval_in_seconds)
-        )
-        attempt = 0
-
-        while attempt < max_attempts:
-            task = self.encoding_api.encodings.status(encoding_id=encoding.id)
-            if task.status is expected_status:
-                return
-            if task.status is bm.Status.ERROR:
-                self._log_task_errors(task=task)
-                raise Exception("Encoding failed")
-
+        def print_status(task: bm.Task):
             print(
-                "Encoding status is {0}. Waiting for status {1} ({2} / {3})".format(
-                    task.status.value, expected_status.value, attempt, max_attempts
+                "Encoding status is {0}. Waiting for status {1}".format(
+                    task.status.value, expected_status.value
                 )
             )
 
-            sleep(check_interval_in_seconds)
-
-            attempt += 1
-
-        raise Exception(
-            "Encoding did not switch to state {0} within {1} minutes. Aborting.".format(
-                expected_status.value, max_minutes_to_wait_for_encoding_status
+        try:
+            task = self.status_watcher.watch(
+                encoding_id=encoding.id,
+                statuses=[expected_status],
+                timeout=max_minutes_to_wait_for_encoding_status * 60,
+                on_update=print_status,
+            ).result()
+        except TimeoutError:
+            task = None
+
+        if task is not None and task.status is bm.Status.ERROR:
+            self._log_task_errors(task=task)
+            raise Exception("Encoding failed")
+
+        if task is None or task.status is not expected_status:
+            raise Exception(
+                "Encoding did not switch to state {0} within {1} minutes. "
+                "Aborting.".format(
+                    expected_status.value, max_minutes_to_wait_for_encoding_status
+                )
             )
-        )
 
     def _wait_for_live_encoding_details(self, encoding: bm.Encoding):
         timeout_interval_seconds = 5
@@ -214,6 +464,9 @@ class BitmovinController:
     def _start_live_encoding_and_wait_until_running(
         self, encoding: bm.Encoding, request: bm.StartLiveEncodingRequest
     ):
+        if self.webhook_listener:
+            self._register_webhooks(encoding=encoding)
+
         self.encoding_api.encodings.live.start(
             encoding_id=encoding.id, start_live_encoding_request=request
         )
@@ -221,14 +474,46 @@ class BitmovinController:
             encoding=encoding, expected_status=bm.Status.RUNNING
         )
 
+    def _register_webhooks(self, encoding: bm.Encoding) -> None:
+        webhooks_api = self.bitmovin_api.notifications.webhooks.encoding.encodings
+        url = self.webhook_listener.url_for(encoding.id)
+
+        webhooks_api.encoding_status_changed.create_by_encoding_id(
+            encoding_id=encoding.id,
+            webhook_notification_with_stream_conditions_request=(
+                bm.WebhookNotificationWithStreamConditionsRequest(
+                    url=url, method=bm.WebhookHttpMethod.POST
+                )
+            ),
+        )
+        webhooks_api.error.create_by_encoding_id(
+            encoding_id=encoding.id,
+            webhook=bm.Webhook(url=url, method=bm.WebhookHttpMethod.POST),
+        )
+
     def _create_encoding(self, name: str, description: str) -> bm.Encoding:
         encoding = bm.Encoding(name=name, description=description)
 
         return self.encoding_api.encodings.create(encoding=encoding)
 
-    def _get_rtmp_input(self) -> bm.RtmpInput:
-        rtmp_inputs = self.encoding_api.inputs.rtmp.list()
-        return rtmp_inputs.items[0]
+    def get_rtmp_input(self, input_id: Optional[str] = None) -> bm.RtmpInput:
+        """RTMP input with the given ID, or RTMP_INPUT_ID from the config file.
+
+        Without either, the account must have a single RTMP input.
+        """
+        input_id = input_id or getattr(cfg, "RTMP_INPUT_ID", None)
+        if input_id:
+            return self.encoding_api.inputs.rtmp.get(input_id=input_id)
+
+        rtmp_inputs = self.encoding_api.inputs.rtmp.list().items
+        if len(rtmp_inputs) != 1:
+            raise Exception(
+                "Set RTMP_INPUT_ID in the config file to choose the RTMP input, "
+                "the account has {0}: {1}".format(
+                    len(rtmp_inputs), ", ".join(i.id for i in rtmp_inputs)
+                )
+            )
+        return rtmp_inputs[0]
 
     def _get_s3_output(self, output_id: str) -> bm.S3Output:
         return self.encoding_api.outputs.s3.get(output_id=output_id)
@@ -243,7 +528,14 @@ class BitmovinController:
             bucket_name=bucket_name,
         )
 
-        return self.encoding_api.outputs.s3.create(s3_output=s3_output)
+        # Outputs are cached like codec configurations, so that the one created
+        # by a previous run is reused
+        s3_api = self.encoding_api.outputs.s3
+        return self._create_or_reuse_configuration(
+            configuration=s3_output,
+            create=lambda o: s3_api.create(s3_output=o),
+            get=lambda id: s3_api.get(output_id=id),
+        )
 
     def _create_h264_video_configuration(
         self,
@@ -280,8 +572,11 @@ class BitmovinController:
         if profile is bm.ProfileH264.HIGH:
             config.adaptive_spatial_transform = True
 
-        return self.encoding_api.configurations.video.h264.create(
-            h264_video_configuration=config
+        h264_api = self.encoding_api.configurations.video.h264
+        return self._create_or_reuse_configuration(
+            configuration=config,
+            create=lambda c: h264_api.create(h264_video_configuration=c),
+            get=lambda id: h264_api.get(configuration_id=id),
         )
 
     def _create_stream(
@@ -324,28 +619,104 @@ class BitmovinController:
             encoding_id=encoding.id, ts_muxing=muxing
         )
 
+    def _create_cmaf_muxing(
+        self,
+        encoding: bm.Encoding,
+        output: bm.Output,
+        output_path: str,
+        stream: bm.Stream,
+    ) -> bm.CmafMuxing:
+        muxing = bm.CmafMuxing(
+            outputs=[
+                self._build_encoding_output(output=output, output_path=output_path)
+            ],
+            segment_length=cfg.SEGMENT_DURATION,
+            # Chunks are uploaded as soon as they are encoded, so that players
+            # can fetch the segment being written
+            frames_per_cmaf_chunk=max(
+                1, round(cfg.FRAME_RATE * low_latency_chunk_duration)
+            ),
+            streams=[bm.MuxingStream(stream_id=stream.id)],
+        )
+
+        return self.encoding_api.encodings.muxings.cmaf.create(
+            encoding_id=encoding.id, cmaf_muxing=muxing
+        )
+
     def _create_aac_audio_configuration(self, bitrate: int) -> bm.AacAudioConfiguration:
         config = bm.AacAudioConfiguration(
             name="AAC {0} kbit/s".format(bitrate / 1000), bitrate=bitrate
         )
 
-        return self.encoding_api.configurations.audio.aac.create(
-            aac_audio_configuration=config
+        aac_api = self.encoding_api.configurations.audio.aac
+        return self._create_or_reuse_configuration(
+            configuration=config,
+            create=lambda c: aac_api.create(aac_audio_configuration=c),
+            get=lambda id: aac_api.get(configuration_id=id),
+        )
+
+    def _create_or_reuse_configuration(
+        self,
+        configuration: bm.CodecConfiguration,
+        create: Callable[[bm.CodecConfiguration], bm.CodecConfiguration],
+        get: Callable[[str], bm.CodecConfiguration],
+    ) -> bm.CodecConfiguration:
+        if self.configuration_cache is None:
+            return create(configuration)
+
+        return self.configuration_cache.get_or_create(
+            configuration=configuration, create=create, get=get
+        )
+
+    def _recorded_id(self, key: str) -> Optional[str]:
+        return self.journal.resource_id(key) if self.journal else None
+
+    def _record_resource(self, key: str, resource_id: str) -> None:
+        if self.journal:
+            self.journal.record_resource(key, resource_id)
+
+    def _account_namespace(self) -> str:
+        # Configuration IDs are only valid on the account they were created on
+        account = "{0}/{1}".format(
+            cfg.BITMOVIN_API_KEY, getattr(cfg, "BITMOVIN_TENANT_ORG_ID", "")
         )
+        return hashlib.sha256(account.encode("utf-8")).hexdigest()[:16]
 
     def _generate_hls_manifest_default(
-        self, encoding: bm.Encoding, output: bm.Output, output_path: str
+        self,
+        encoding: bm.Encoding,
+        output: bm.Output,
+        output_path: str,
+        use_cmaf: bool = False,
     ) -> bm.HlsManifestDefault:
         hls_manifest = bm.HlsManifestDefault(
             encoding_id=encoding.id,
             outputs=[self._build_encoding_output(output, output_path)],
-            name="HLS/ts Manifest",
+            name="HLS/cmaf Manifest" if use_cmaf else "HLS/ts Manifest",
             manifest_name="stream.m3u8",
             version=bm.HlsManifestDefaultVersion.V1,
         )
+        if use_cmaf:
+            # fMP4 segments in HLS need EXT-X-MAP, ie. version 7 of the playlists
+            hls_manifest.hls_master_playlist_version = bm.HlsVersion.HLS_V7
+            hls_manifest.hls_media_playlist_version = bm.HlsVersion.HLS_V7
 
         return self.hls_api.default.create(hls_manifest_default=hls_manifest)
 
+    def _generate_dash_manifest_default(
+        self, encoding: bm.Encoding, output: bm.Output, output_path: str
+    ) -> bm.DashManifestDefault:
+        dash_manifest = bm.DashManifestDefault(
+            encoding_id=encoding.id,
+            outputs=[self._build_encoding_output(output, output_path)],
+            name="DASH/cmaf Manifest",
+            manifest_name="stream.mpd",
+            profile=bm.DashProfile.LIVE,
+            version=bm.DashManifestDefaultVersion.V2,
+        )
+
+        return self.dash_api.default.create(dash_manifest_default=dash_manifest)
+
     def _build_encoding_output(
         self, output: bm.Output, output_path: str
     ) -> bm.EncodingOutput:
@@ -1,52 +1,77 @@
+import asyncio
+import functools
 import json
-import sys
-from typing import Dict
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from urllib.parse import urljoin, urlparse
 
 import config as cfg
-import requests
+from http_session import DEFAULT_TIMEOUT, create_session
+from journal import JobJournal
+from resource_index import ResourceIndex
+
+API_BASE_URL = "https://api.broadpeak.io"
+
+# Live source and pre-roll service to create for a channel (or rendition)
+PrerollServiceSpec = namedtuple("PrerollServiceSpec", "source_name service_name url")
 
 
 class BroadpeakIOController:
     def __init__(self) -> None:
+        self.api_base_url = getattr(cfg, "BPKIO_API_BASE_URL", API_BASE_URL)
         self.headers = {
             "accept": "application/json",
             "content-type": "application/json",
             "authorization": f"Bearer {cfg.BPKIO_API_KEY}",
         }
+        self.session = create_session(
+            pool_size=getattr(cfg, "BPKIO_API_MAX_CONNECTIONS", 10)
+        )
+        self.index = ResourceIndex(
+            session=self.session,
+            headers=self.headers,
+            api_base_url=self.api_base_url,
+            ttl=getattr(cfg, "BPKIO_RESOURCE_INDEX_TTL", 300),
+        )
 
-        if not hasattr(cfg, "TRANSCODING_PROFILE_ID"):
-            print("You need to provide a Transcoding Profile ID in the config file")
-            self.build_transcoding_profile_config()
-            sys.exit(1)
-
-    def create_or_retrieve_ad_server(self) -> Dict:
+    def create_or_retrieve_ad_server(
+        self, journal: Optional[JobJournal] = None
+    ) -> Dict:
         if hasattr(cfg, "AD_SERVER_ID"):
             ad_server = self._get_ad_server(getattr(cfg, "AD_SERVER_ID"))
+        elif _recorded_id(journal, "ad_server"):
+            ad_server = self._get_ad_server(_recorded_id(journal, "ad_server"))
         else:
-            ad_server = self._create_ad_server(vast_tag=cfg.VAST_TAG)
+            payload = self._ad_server_payload(vast_tag=cfg.VAST_TAG)
+            ad_server = self.index.find("ad_servers", **payload)
+            if ad_server is None:
+                ad_server = self._create_ad_server(vast_tag=cfg.VAST_TAG)
+                self.index.add("ad_servers", ad_server)
+            _record_resource(journal, "ad_server", ad_server["id"])
 
         return ad_server
 
     def _create_ad_server(self, vast_tag: str) -> Dict:
+        return self._post_wrapper(
+            endpoint_url=f"{self.api_base_url}/v1/sources/ad-server",
+            payload=self._ad_server_payload(vast_tag=vast_tag),
+        )
+
+    def _ad_server_payload(self, vast_tag: str) -> Dict:
         url = urlparse(vast_tag)
         base_url = urljoin(vast_tag, url.path)
 
-        ad_proxy_payload = {
+        return {
             "name": "VAST Ad Server",
             "template": "custom",
             "url": base_url,
             "queries": url.query,
         }
 
-        return self._post_wrapper(
-            endpoint_url="https://api.broadpeak.io/v1/sources/ad-server",
-            payload=ad_proxy_payload,
-        )
-
     def _get_ad_server(self, id: int) -> Dict:
         return self._get_wrapper(
-            endpoint_url=f"https://api.broadpeak.io/v1/sources/ad-server/{id}"
+            endpoint_url=f"{self.api_base_url}/v1/sources/ad-server/{id}"
         )
 
     def create_preroll_service(
@@ -55,7 +80,12 @@ class BroadpeakIOController:
         live_source_id: int,
         ad_server_id: int,
         transcoding_profile_id: int,
+        journal: Optional[JobJournal] = None,
+        journal_key: str = "preroll_service",
     ) -> Dict:
+        if _recorded_id(journal, journal_key):
+            return self._get_preroll_service(_recorded_id(journal, journal_key))
+
         adinsertion_service_payload = {
             "name": name,
             "source": {"id": live_source_id},
@@ -64,27 +94,92 @@ class BroadpeakIOController:
             "enableAdTranscoding": True,
         }
 
-        return self._post_wrapper(
-            endpoint_url="https://api.broadpeak.io/v1/services/ad-insertion",
+        # Only a service with the same ad server and transcoding profile is reused
+        service = self.index.find("services", **adinsertion_service_payload)
+        if service:
+            _record_resource(journal, journal_key, service["id"])
+            return service
+
+        service = self._post_wrapper(
+            endpoint_url=f"{self.api_base_url}/v1/services/ad-insertion",
             payload=adinsertion_service_payload,
         )
+        self.index.add("services", service)
+        _record_resource(journal, journal_key, service["id"])
+        return service
+
+    def create_live_source(
+        self,
+        name: str,
+        url: str,
+        journal: Optional[JobJournal] = None,
+        journal_key: str = "live_source",
+    ) -> Dict:
+        if _recorded_id(journal, journal_key):
+            return self._get_live_source(_recorded_id(journal, journal_key))
+
+        live_source = self.index.find("live_sources", url=url)
+        if live_source:
+            _record_resource(journal, journal_key, live_source["id"])
+            return live_source
 
-    def create_live_source(self, name: str, url: str) -> Dict:
         source_payload = {"name": name, "url": url}
-        return self._post_wrapper(
-            endpoint_url="https://api.broadpeak.io/v1/sources/live",
+        live_source = self._post_wrapper(
+            endpoint_url=f"{self.api_base_url}/v1/sources/live",
             payload=source_payload,
         )
+        self.index.add("live_sources", live_source)
+        _record_resource(journal, journal_key, live_source["id"])
+        return live_source
+
+    def create_preroll_services(
+        self,
+        specs: List[PrerollServiceSpec],
+        ad_server_id: int,
+        transcoding_profile_id: int,
+        journal: Optional[JobJournal] = None,
+    ) -> List[Dict]:
+        """Create the live sources and pre-roll services of many channels at once.
+
+        The resources of the i-th spec are recorded in the journal under the
+        `live_source_{i}` and `preroll_service_{i}` keys.
+        """
+        async_controller = AsyncBroadpeakIOController(self)
+        try:
+            return asyncio.run(
+                async_controller.create_preroll_services(
+                    specs=specs,
+                    ad_server_id=ad_server_id,
+                    transcoding_profile_id=transcoding_profile_id,
+                    journal=journal,
+                )
+            )
+        finally:
+            async_controller.close()
+
+    def _get_preroll_service(self, id: int) -> Dict:
+        return self._get_wrapper(
+            endpoint_url=f"{self.api_base_url}/v1/services/ad-insertion/{id}"
+        )
+
+    def _get_live_source(self, id: int) -> Dict:
+        return self._get_wrapper(
+            endpoint_url=f"{self.api_base_url}/v1/sources/live/{id}"
+        )
 
     def _get_wrapper(self, endpoint_url: str):
-        response = requests.get(endpoint_url, headers=self.headers)
+        response = self.session.get(
+            endpoint_url, headers=self.headers, timeout=DEFAULT_TIMEOUT
+        )
         if response.status_code != 200:
             raise Exception(f"Unable to retrieve {endpoint_url}: " + response.text)
 
         return response.json()
 
     def _post_wrapper(self, endpoint_url: str, payload: Dict):
-        response = requests.post(endpoint_url, json=payload, headers=self.headers)
+        response = self.session.post(
+            endpoint_url, json=payload, headers=self.headers, timeout=DEFAULT_TIMEOUT
+        )
         if response.status_code != 201:
             raise Exception(f"Unable to create {endpoint_url}: " + response.text)
         else:
@@ -95,7 +190,10 @@ class BroadpeakIOController:
     def build_transcoding_profile_config(self):
         config = {
             "packaging": {
-                "--hls.client_manifest_version=": "4",
+                # fMP4 segments in HLS need version 7 of the playlists
+                "--hls.client_manifest_version=": (
+                    "7" if getattr(cfg, "LOW_LATENCY", False) else "4"
+                ),
                 "--hls.minimum_fragment_length=": "4",
             },
             "servicetype": "offline_transcoding",
@@ -125,3 +223,111 @@ class BroadpeakIOController:
             "to add the following profile to your account"
         )
         print(json.dumps(config, indent=4))
+
+
+class AsyncBroadpeakIOController:
+    """Asyncio front of BroadpeakIOController, to provision in bulk.
+
+    This is not an asyncio HTTP client: each call is made by the blocking
+    controller, on one of `max_concurrency` threads, so every call in flight
+    holds an OS thread. The pool caps the number of calls in flight, so that
+    any number of resources can be requested at once. The cap defaults to
+    BPKIO_API_MAX_CONNECTIONS, the size of the controller's connection pool,
+    so that each thread has a kept-alive connection to use.
+    """
+
+    def __init__(
+        self, controller: BroadpeakIOController, max_concurrency: Optional[int] = None
+    ) -> None:
+        self.controller = controller
+        self.max_concurrency = max_concurrency or getattr(
+            cfg, "BPKIO_API_MAX_CONNECTIONS", 10
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="bpkio-api"
+        )
+
+    async def create_or_retrieve_ad_server(
+        self, journal: Optional[JobJournal] = None
+    ) -> Dict:
+        return await self._call(
+            self.controller.create_or_retrieve_ad_server, journal=journal
+        )
+
+    async def create_live_source(
+        self,
+        name: str,
+        url: str,
+        journal: Optional[JobJournal] = None,
+        journal_key: str = "live_source",
+    ) -> Dict:
+        return await self._call(
+            self.controller.create_live_source,
+            name=name,
+            url=url,
+            journal=journal,
+            journal_key=journal_key,
+        )
+
+    async def create_preroll_service(
+        self,
+        name: str,
+        live_source_id: int,
+        ad_server_id: int,
+        transcoding_profile_id: int,
+        journal: Optional[JobJournal] = None,
+        journal_key: str = "preroll_service",
+    ) -> Dict:
+        return await self._call(
+            self.controller.create_preroll_service,
+            name=name,
+            live_source_id=live_source_id,
+            ad_server_id=ad_server_id,
+            transcoding_profile_id=transcoding_profile_id,
+            journal=journal,
+            journal_key=journal_key,
+        )
+
+    async def create_preroll_services(
+        self,
+        specs: List[PrerollServiceSpec],
+        ad_server_id: int,
+        transcoding_profile_id: int,
+        journal: Optional[JobJournal] = None,
+    ) -> List[Dict]:
+        async def create(i: int, spec: PrerollServiceSpec) -> Dict:
+            live_source = await self.create_live_source(
+                name=spec.source_name,
+                url=spec.url,
+                journal=journal,
+                journal_key=f"live_source_{i}",
+            )
+            return await self.create_preroll_service(
+                name=spec.service_name,
+                live_source_id=live_source["id"],
+                ad_server_id=ad_server_id,
+                transcoding_profile_id=transcoding_profile_id,
+                journal=journal,
+                journal_key=f"preroll_service_{i}",
+            )
+
+        return await asyncio.gather(
+            *[create(i, spec) for (i, spec) in enumerate(specs)]
+        )
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    async def _call(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+
+def _recorded_id(journal: Optional[JobJournal], key: str) -> Optional[str]:
+    return journal.resource_id(key) if journal else None
+
+
+def _record_resource(journal: Optional[JobJournal], key: str, resource_id) -> None:
+    if journal:
+        journal.record_resource(key, resource_id)
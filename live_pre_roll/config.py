@@ -6,10 +6,25 @@ VideoRung = namedtuple("VideoRung", "height bitrate profile level")
 AudioRung = namedtuple("AudioRung", "bitrate")
 
 
+# Unique identifier for the job, needed to resume it after a failure (see
+# JOURNAL_PATH). Leave commented out to use a random one on each run
+# JOB_ID = "live-pre-roll"
+
+
 # === broadpeak.io ===
 # broadpeak.io API key
 BPKIO_API_KEY = os.getenv("BPKIO_API_KEY")
 
+# Maximum number of connections kept open to the broadpeak.io API, which is
+# also the number of calls in flight when provisioning many services at once.
+# Raise it when provisioning many assets in parallel
+# BPKIO_API_MAX_CONNECTIONS = 10
+
+# Existing broadpeak.io resources identical to the ones the script needs are
+# reused instead of creating duplicates. They are listed once, and the listing
+# is kept for this number of seconds before being revalidated
+# BPKIO_RESOURCE_INDEX_TTL = 300
+
 # ID of the transcoding profile to use.
 # Talk to your account manager if you don't have a suitable one, and make sure
 # that it matches the profile defined below in this file.
@@ -29,15 +44,43 @@ VAST_TAG = "https://bpkiovast.s3.eu-west-1.amazonaws.com/vastbpkio"
 BITMOVIN_API_KEY = os.getenv("BITMOVIN_API_KEY")
 BITMOVIN_TENANT_ORG_ID = os.getenv("BITMOVIN_TENANT_ORG_ID")
 
+# Local cache of the codec configurations created on the Bitmovin account, used to
+# reuse identical configurations across runs instead of creating new ones.
+# Comment out to always create new configurations
+CONFIGURATION_CACHE_PATH = "bitmovin_configurations.sqlite"
+
+# Local journal of the resources created and the phases completed by each job,
+# used to resume a job that failed halfway when it is re-run with the same JOB_ID.
+# Only used when JOB_ID is set. Comment out to disable
+JOURNAL_PATH = "jobs_journal.sqlite"
+
+# Optional: receive Bitmovin webhook notifications on an embedded HTTP server
+# to know about encoding status changes immediately, instead of polling for them.
+# The server must be reachable by Bitmovin at the public URL.
+# WEBHOOK_PUBLIC_URL = "https://my-host.example.com:8080"
+# WEBHOOK_LISTEN_PORT = 8080
+# Interval (in seconds) of the status checks that remain as a fallback
+# WEBHOOK_FALLBACK_POLL_INTERVAL = 60
+
 
 # === Source Stream ===
 # Stream Key for the Bitmovin RTMP ingest endpoint
 RTMP_STREAM_KEY = "myStreamKey"
 
+# Bitmovin ID of the RTMP input to ingest from.
+# Can be left commented out if the account has a single RTMP input
+# RTMP_INPUT_ID = "a3b5c1d2-0000-0000-0000-000000000000"
+
 # Set this to true to automatically create a dummy stream with ffmpeg
 # This is useful for debugging, but not recommended for production
 MAKE_DUMMY_FEED_WITH_FFMPEG = True
 
+# The dummy stream is pushed from a short test loop, rendered once and cached in
+# this folder, which only takes a fraction of a CPU core per stream.
+# Set to False to render it in real time instead, with the wall clock burnt in
+DUMMY_FEED_PRERENDERED = True
+DUMMY_FEED_CACHE_DIR = "dummy_feed_cache"
+
 
 # === Origin ===
 # Bitmovin ID of the S3 output bucket where the transcoded files will be stored.
@@ -51,6 +94,16 @@ S3_OUTPUT_SECRET_KEY = os.getenv("S3_OUTPUT_SECRET_KEY")
 S3_OUTPUT_BASE_PATH = "outputs/live/"
 
 
+# Number of segments that every variant playlist of the manifests must list on
+# the origin before the channel is considered playable
+# MANIFEST_READY_MIN_SEGMENTS = 3
+
+# Optional: once the channel is up, follow its media playlists on the origin and
+# serve their health metrics (latency, jitter, missing segments, variant drift)
+# in the Prometheus format on this port
+# HEALTH_METRICS_PORT = 9100
+
+
 # === CDN ===
 # If a CDN is used to stream the content, provide its domain name
 CDN_FQDN = "mydistribution.cloudfront.net"
@@ -99,3 +152,13 @@ AUDIO_LADDER = [
 ]
 
 SEGMENT_DURATION = 2.0
+
+# Set to True for low latency: segments are written as chunked CMAF, shared by
+# the HLS (version 7) and DASH manifests, and the live edge is only a few seconds
+# behind the ingest instead of 30. Requires players that support HLS with fMP4,
+# and a transcoding profile that packages the ads the same way
+LOW_LATENCY = False
+
+# Maximum number of Bitmovin API calls made in parallel
+# when configuring the live encoding and its manifests
+MAX_PARALLEL_API_CALLS = 8
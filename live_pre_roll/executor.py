@@ -0,0 +1,122 @@
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Placeholder for the result of another node, resolved when the node runs
+Ref = namedtuple("Ref", "key")
+
+
+class ResourceGraph:
+    """Runs a set of dependent API calls on a bounded thread pool.
+
+    Nodes are callables invoked with keyword arguments. Any argument given as a
+    `Ref` is replaced by the result of the node it points to, and the node is
+    only submitted once all of those have completed, so worker threads never
+    block waiting on each other.
+    The start and end of each node, relative to the start of the run, are
+    kept in `timings`, to report which chain of nodes took the longest.
+    """
+
+    def __init__(self, max_workers: int = 8) -> None:
+        self.max_workers = max_workers
+        self.nodes: Dict[str, Tuple[Callable, Dict[str, Any], List[str]]] = {}
+        self.results: Dict[str, Any] = {}
+        self.durations: Dict[str, float] = {}
+        self.timings: Dict[str, Tuple[float, float]] = {}
+        self._started_at = None
+
+    def add(
+        self, key: str, fn: Callable, after: Optional[List[str]] = None, **kwargs
+    ) -> Ref:
+        if key in self.nodes:
+            raise Exception(f"Duplicate node in resource graph: {key}")
+
+        deps = [v.key for v in kwargs.values() if isinstance(v, Ref)]
+        deps += list(after or [])
+        for dep in deps:
+            if dep not in self.nodes:
+                raise Exception(f"Node {key} depends on unknown node {dep}")
+
+        self.nodes[key] = (fn, kwargs, deps)
+        return Ref(key)
+
+    def run(self) -> Dict[str, Any]:
+        pending = dict(self.nodes)
+        running: Dict[Future, str] = {}
+        self._started_at = perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for key in [k for k, n in pending.items() if self._ready(n[2])]:
+                    (fn, kwargs, _) = pending.pop(key)
+                    kwargs = {
+                        k: self.results[v.key] if isinstance(v, Ref) else v
+                        for k, v in kwargs.items()
+                    }
+                    running[executor.submit(self._timed, key, fn, kwargs)] = key
+
+                if not running:
+                    raise Exception(
+                        "Resource graph has unresolvable nodes: "
+                        + ", ".join(pending.keys())
+                    )
+
+                (done, _) = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    try:
+                        self.results[key] = future.result()
+                    except Exception:
+                        for f in running:
+                            f.cancel()
+                        raise
+
+        return self.results
+
+    def _ready(self, deps: List[str]) -> bool:
+        return all(d in self.results for d in deps)
+
+    def _timed(self, key: str, fn: Callable, kwargs: Dict[str, Any]) -> Any:
+        start = perf_counter()
+        try:
+            return fn(**kwargs)
+        finally:
+            end = perf_counter()
+            self.durations[key] = end - start
+            self.timings[key] = (start - self._started_at, end - self._started_at)
+
+    def critical_path(self) -> List[str]:
+        """Chain of nodes that ended last, each waiting on the one before it"""
+        if not self.timings:
+            return []
+
+        path = [max(self.timings, key=lambda k: self.timings[k][1])]
+        while True:
+            deps = [d for d in self.nodes[path[0]][2] if d in self.timings]
+            if not deps:
+                return path
+            path.insert(0, max(deps, key=lambda k: self.timings[k][1]))
+
+    def report(self) -> str:
+        """Start, end and duration of each node, and the critical path"""
+        if not self.timings:
+            return "Nothing ran"
+
+        width = max(len(k) for k in self.timings)
+        lines = [
+            "  {0:<{1}} {2:7.1f}s -> {3:7.1f}s  ({4:.1f}s)".format(
+                key, width, start, end, end - start
+            )
+            for key, (start, end) in sorted(
+                self.timings.items(), key=lambda item: item[1]
+            )
+        ]
+        lines.append(
+            "Total {0:.1f}s, sum of the nodes {1:.1f}s, critical path: {2}".format(
+                max(end for (_, end) in self.timings.values()),
+                sum(self.durations.values()),
+                " -> ".join(self.critical_path()),
+            )
+        )
+        return "\n".join(lines)
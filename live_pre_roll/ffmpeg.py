@@ -1,46 +1,223 @@
-import multiprocessing
+import os
 import subprocess
+import threading
+from typing import Dict, Iterator, List, Optional
+
+# Duration of the pre-rendered loop, in seconds. 32 s is a whole number of
+# frames at the usual frame rates (24, 25, 30, 50, 60) and of AAC frames at
+# 48 kHz (1024 samples each), so that audio and video stay aligned across loops
+loop_duration = 32
+# Interval between keyframes of the pre-rendered loop, in seconds
+loop_keyframe_interval = 2
+audio_sample_rate = 48000
+
+TEST_AUDIO_SOURCE = (
+    "aevalsrc='0.1*sin(2*PI*(360-2.5/2)*t) | 0.1*cos(2*PI*(440+2.5/2)*t)'"
+    f":s={audio_sample_rate}"
+)
+DRAWTEXT_STYLE = (
+    "fontsize=40: fontcolor=white: box=1: boxborderw=6: boxcolor=black@0.75"
+)
+
+_render_locks: Dict[str, threading.Lock] = {}
+_render_locks_lock = threading.Lock()
 
 
 def generate_dummy_feed(
-    rtmp_endpoint: str, stream_key: str, rate: str | float, stream_id: str
-) -> multiprocessing.Process:
-    out_file_path = f"ffmpeg_output_{stream_id}.txt"
-    p = multiprocessing.Process(
-        target=_start_ffmpeg_process,
-        args=(rtmp_endpoint, stream_key, rate, out_file_path),
+    rtmp_endpoint: str,
+    stream_key: str,
+    rate: str | float,
+    stream_id: str,
+    size: str = "1920x1080",
+    prerendered: bool = True,
+    cache_dir: str = "dummy_feed_cache",
+    video_bitrate: Optional[int] = None,
+    progress: bool = False,
+) -> subprocess.Popen:
+    """Push a test pattern to an RTMP endpoint with FFmpeg, until killed.
+
+    By default, a loop of the test pattern is rendered once and cached in
+    `cache_dir`, then pushed over and over without re-encoding, which takes a
+    fraction of a core. With `prerendered=False`, the test pattern is rendered
+    and encoded in real time, with the wall clock burnt in, which takes
+    several cores.
+    With `progress`, FFmpeg writes its progress stats (see `read_progress`) to
+    the stdout pipe of the process, and only its errors to the log file.
+    """
+    rtmp_url = f"rtmp://{rtmp_endpoint}/live/{stream_key}"
+    bitrate_options = _bitrate_options(video_bitrate)
+
+    if prerendered:
+        loop_path = prerender_loop(
+            rate=rate, size=size, cache_dir=cache_dir, video_bitrate=video_bitrate
+        )
+        command = [
+            "ffmpeg",
+            "-re",
+            # Timestamps keep increasing from one loop to the next
+            "-stream_loop",
+            "-1",
+            "-i",
+            loop_path,
+            "-c",
+            "copy",
+            "-f",
+            "flv",
+            rtmp_url,
+        ]
+    else:
+        command = [
+            "ffmpeg",
+            "-re",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc2=size={size}:rate={rate}",
+            "-f",
+            "lavfi",
+            "-i",
+            TEST_AUDIO_SOURCE,
+            "-vf",
+            f"drawtext=text='time %{{localtime\\:%X}}': {DRAWTEXT_STYLE}: x=40: y=main_h-(2*line_h), "
+            + f"drawtext=text='pts %{{pts \\: hms}}': {DRAWTEXT_STYLE}: x=(w-text_w)/2: y=main_h-(2*line_h), "
+            + f"drawtext=text='frame %{{n}}': {DRAWTEXT_STYLE}: x=w-text_w-40: y=main_h-(2*line_h)",
+            "-c:v",
+            "libx264",
+            *bitrate_options,
+            "-c:a",
+            "aac",
+            "-f",
+            "flv",
+            rtmp_url,
+        ]
+
+    return _start_ffmpeg_process(
+        command, out_file_path=f"ffmpeg_output_{stream_id}.txt", progress=progress
     )
-    p.start()
-    return p
 
 
-def _start_ffmpeg_process(
-    rtmp_endpoint: str, stream_key: str, rate: str | float, out_file_path: str
-):
-    command = [
-        "ffmpeg",
-        "-re",
-        "-f",
-        "lavfi",
-        "-i",
-        f"testsrc2=size=1920x1080:rate={rate}",
-        "-f",
-        "lavfi",
-        "-i",
-        "aevalsrc='0.1*sin(2*PI*(360-2.5/2)*t) | 0.1*cos(2*PI*(440+2.5/2)*t)'",
-        "-vf",
-        "drawtext=text='time %{localtime\:%X}': fontsize=40: fontcolor=white: box=1: boxborderw=6: boxcolor=black@0.75: x=40: y=main_h-(2*line_h), "
-        + "drawtext=text='pts %{pts \: hms}': fontsize=40: fontcolor=white: box=1: boxborderw=6: boxcolor=black@0.75: x=(w-text_w)/2: y=main_h-(2*line_h), "
-        + "drawtext=text='frame %{n}': fontsize=40: fontcolor=white: box=1: boxborderw=6: boxcolor=black@0.75: x=w-text_w-40: y=main_h-(2*line_h)",
-        "-c:v",
-        "libx264",
-        "-c:a",
-        "aac",
-        "-f",
-        "flv",
-        f"rtmp://{rtmp_endpoint}/live/{stream_key}",
+def prerender_loop(
+    rate: str | float,
+    size: str = "1920x1080",
+    cache_dir: str = "dummy_feed_cache",
+    video_bitrate: Optional[int] = None,
+) -> str:
+    """Path of the test pattern loop for a frame rate, size and video bitrate
+    (left to the encoder if None), rendered if needed.
+
+    Keyframes are placed every `loop_keyframe_interval` seconds, starting on
+    the first frame, so that each loop starts with a full GOP.
+    """
+    name = f"dummy_feed_{size}_{rate}fps"
+    if video_bitrate:
+        name += f"_{video_bitrate}bps"
+    loop_path = os.path.join(cache_dir, f"{name}.mp4")
+
+    with _render_locks_lock:
+        lock = _render_locks.setdefault(loop_path, threading.Lock())
+
+    with lock:
+        if os.path.exists(loop_path):
+            return loop_path
+
+        os.makedirs(cache_dir, exist_ok=True)
+        print(f"Rendering a {loop_duration}s {size} test loop at {rate} fps")
+        keyframe_interval = round(float(rate) * loop_keyframe_interval)
+        # Renamed once complete, so that an interrupted render is never used
+        partial_path = f"{loop_path}.{os.getpid()}.partial.mp4"
+        command = [
+            "ffmpeg",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc2=size={size}:rate={rate}",
+            "-f",
+            "lavfi",
+            "-i",
+            TEST_AUDIO_SOURCE,
+            "-t",
+            str(loop_duration),
+            "-vf",
+            f"drawtext=text='pts %{{pts \\: hms}}': {DRAWTEXT_STYLE}: x=(w-text_w)/2: y=main_h-(2*line_h), "
+            + f"drawtext=text='frame %{{n}}': {DRAWTEXT_STYLE}: x=w-text_w-40: y=main_h-(2*line_h)",
+            "-c:v",
+            "libx264",
+            "-preset",
+            "veryfast",
+            "-pix_fmt",
+            "yuv420p",
+            "-g",
+            str(keyframe_interval),
+            "-keyint_min",
+            str(keyframe_interval),
+            "-sc_threshold",
+            "0",
+            *_bitrate_options(video_bitrate),
+            "-c:a",
+            "aac",
+            "-ar",
+            str(audio_sample_rate),
+            "-movflags",
+            "+faststart",
+            partial_path,
+        ]
+        proc = subprocess.run(command, capture_output=True, text=True)
+        if proc.returncode != 0:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise Exception(f"Rendering the test loop failed: {proc.stderr[-2000:]}")
+
+        os.replace(partial_path, loop_path)
+        return loop_path
+
+
+def read_progress(process: subprocess.Popen) -> Iterator[Dict[str, str]]:
+    """Progress stats of an FFmpeg process started with `progress=True`.
+
+    Yields a dict of the stats (eg. `fps`, `speed`, `drop_frames`, `bitrate`,
+    `out_time_us`) every time FFmpeg reports them, until it exits.
+    """
+    stats = {}
+    for line in process.stdout:
+        (key, _, value) = line.strip().partition("=")
+        stats[key] = value.strip()
+        # Each report ends with its status, "continue" or "end"
+        if key == "progress":
+            yield stats
+            stats = {}
+
+
+def _bitrate_options(video_bitrate: Optional[int]) -> List[str]:
+    if not video_bitrate:
+        return []
+
+    return [
+        "-b:v",
+        str(video_bitrate),
+        "-maxrate",
+        str(video_bitrate),
+        "-bufsize",
+        str(2 * video_bitrate),
     ]
 
+
+def _start_ffmpeg_process(
+    command: List[str], out_file_path: str, progress: bool = False
+) -> subprocess.Popen:
+    if progress:
+        command = [
+            command[0],
+            *["-nostats", "-loglevel", "warning", "-progress", "pipe:1"],
+            *command[1:],
+        ]
+
     with open(out_file_path, "w") as f:
-        proc = subprocess.Popen(command, stdout=f, stderr=subprocess.STDOUT)
-        proc.communicate()
+        # The child keeps its own handle on the log file
+        return subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE if progress else f,
+            stderr=f if progress else subprocess.STDOUT,
+            text=progress,
+        )
@@ -0,0 +1,485 @@
+import argparse
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, time
+from typing import Dict, List, Optional
+
+import requests
+from http_session import create_session
+from readiness import PROBE_TIMEOUT, parse_playlist
+
+# Interval between refreshes of a playlist that couldn't be fetched, in seconds
+error_refresh_interval = 2
+
+
+class _Variant:
+    """What is kept of a media playlist between two refreshes"""
+
+    __slots__ = (
+        "url",
+        "etag",
+        "target_duration",
+        "last_sequence",
+        "last_published_at",
+        "live_edge",
+        "latency",
+        "jitter",
+        "missing_segments",
+        "fetch_errors",
+        "refreshes",
+    )
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.etag: Optional[str] = None
+        self.target_duration = 2.0
+        # Media sequence number of the last segment seen, and when it was seen
+        self.last_sequence: Optional[int] = None
+        self.last_published_at: Optional[float] = None
+        # Program date time of the end of the last segment, as a timestamp
+        self.live_edge: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.jitter = 0.0
+        self.missing_segments = 0
+        self.fetch_errors = 0
+        self.refreshes = 0
+
+
+class PlaylistHealthMonitor:
+    """Follows the media playlists of live HLS channels on the origin.
+
+    Every media playlist listed in the master playlist of a channel is
+    refreshed every half target duration, from asyncio tasks sharing a pool of
+    kept-alive connections, with conditional requests. Only a few numbers are
+    kept per playlist, so that a single process can follow dozens of channels.
+    For each playlist, it measures:
+    - the latency of the live edge (program date time of the end of the last
+      segment) behind the wall clock,
+    - the jitter of segment publication: how far apart new segments appear,
+      compared to their duration,
+    - the media sequence numbers skipped between two refreshes,
+    and for each channel, the drift between the live edges of its variants.
+    Metrics are exposed in the Prometheus text format.
+    """
+
+    def __init__(self, max_connections: int = 20) -> None:
+        self.max_connections = max_connections
+        self.session = create_session(
+            pool_size=max_connections, max_retries=0, backoff_factor=0
+        )
+        self.channels: Dict[str, List[_Variant]] = {}
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_connections, thread_name_prefix="playlist-monitor"
+        )
+        self._tasks: List[asyncio.Task] = []
+
+    async def follow(self, channel: str, manifest_url: str) -> None:
+        """Start following the media playlists of a channel's master playlist"""
+        while True:
+            response = await self._get(manifest_url)
+            if response is not None and response.status_code == 200:
+                playlists = parse_playlist(response.text, base_url=manifest_url)
+                break
+            await asyncio.sleep(error_refresh_interval)
+
+        variants = [_Variant(url) for url in playlists["playlists"] or [manifest_url]]
+        self.channels[channel] = variants
+        for variant in variants:
+            self._tasks.append(asyncio.ensure_future(self._follow_variant(variant)))
+
+    async def serve_metrics(self, host: str = "0.0.0.0", port: int = 9100):
+        """Serve the metrics over HTTP, on any path"""
+
+        async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+            try:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                body = self.render_metrics().encode("utf-8")
+                writer.write(
+                    "HTTP/1.1 200 OK\r\n"
+                    "Content-Type: text/plain; version=0.0.4\r\n"
+                    f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode(
+                        "latin-1"
+                    )
+                    + body
+                )
+                await writer.drain()
+            except ConnectionError:
+                pass
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host=host, port=port)
+
+    def render_metrics(self) -> str:
+        lines = []
+
+        def metric(name: str, kind: str, help: str, samples):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is not None:
+                    labels = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{labels}}} {value:g}")
+
+        variants = [
+            ({"channel": channel, "playlist": v.url}, v)
+            for channel, vs in self.channels.items()
+            for v in vs
+        ]
+        metric(
+            "live_playlist_latency_seconds",
+            "gauge",
+            "Time between the live edge of the playlist and the wall clock",
+            [(labels, v.latency) for labels, v in variants],
+        )
+        metric(
+            "live_playlist_publish_jitter_seconds",
+            "gauge",
+            "Difference between the interval of the last segment publications "
+            "and the duration of the segments",
+            [(labels, v.jitter) for labels, v in variants],
+        )
+        metric(
+            "live_playlist_media_sequence",
+            "gauge",
+            "Media sequence number of the last segment of the playlist",
+            [(labels, v.last_sequence) for labels, v in variants],
+        )
+        metric(
+            "live_playlist_missing_segments_total",
+            "counter",
+            "Media sequence numbers skipped between two refreshes of the playlist",
+            [(labels, v.missing_segments) for labels, v in variants],
+        )
+        metric(
+            "live_playlist_fetch_errors_total",
+            "counter",
+            "Refreshes of the playlist that failed",
+            [(labels, v.fetch_errors) for labels, v in variants],
+        )
+        metric(
+            "live_playlist_refreshes_total",
+            "counter",
+            "Refreshes of the playlist that returned a new version",
+            [(labels, v.refreshes) for labels, v in variants],
+        )
+        metric(
+            "live_channel_variant_drift_seconds",
+            "gauge",
+            "Difference between the live edges of the most and least advanced "
+            "playlists of the channel",
+            [
+                ({"channel": channel}, self.variant_drift(channel))
+                for channel in self.channels
+            ],
+        )
+
+        return "\n".join(lines) + "\n"
+
+    def start_in_background(self, channels: Dict[str, str], metrics_port: int) -> None:
+        """Follow channels (name: manifest URL) and serve the metrics from an
+        event loop in a daemon thread, for the rest of the process"""
+        loop = asyncio.new_event_loop()
+
+        async def start():
+            await self.serve_metrics(port=metrics_port)
+            for channel, url in channels.items():
+                await self.follow(channel, url)
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(start())
+            loop.run_forever()
+
+        threading.Thread(target=run, name="playlist-monitor-loop", daemon=True).start()
+        print(f"Serving live playlist metrics on port {metrics_port}")
+
+    def variant_drift(self, channel: str) -> Optional[float]:
+        edges = [v.live_edge for v in self.channels[channel] if v.live_edge]
+        return max(edges) - min(edges) if edges else None
+
+    def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    async def _follow_variant(self, variant: _Variant) -> None:
+        while True:
+            headers = {"if-none-match": variant.etag} if variant.etag else {}
+            response = await self._get(variant.url, headers=headers)
+
+            if response is None or response.status_code not in (200, 304):
+                variant.fetch_errors += 1
+                await asyncio.sleep(error_refresh_interval)
+                continue
+
+            if response.status_code == 200:
+                variant.etag = response.headers.get("etag")
+                self._update(variant, response.text, received_at=monotonic())
+            elif variant.live_edge is not None:
+                variant.latency = time() - variant.live_edge
+
+            # As recommended for clients of live playlists (RFC 8216, 6.3.4)
+            await asyncio.sleep(variant.target_duration / 2)
+
+    def _update(self, variant: _Variant, text: str, received_at: float) -> None:
+        variant.refreshes += 1
+
+        media_sequence = 0
+        segments = 0
+        program_date_time = None
+        duration = 0.0
+
+        # Only the last segment matters: the program date time is carried over
+        # from the last tag, and advanced by the duration of each segment
+        for line in text.splitlines():
+            if line.startswith("#EXT-X-TARGETDURATION:"):
+                variant.target_duration = float(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+                media_sequence = int(line.split(":", 1)[1])
+            elif line.startswith("#EXT-X-PROGRAM-DATE-TIME:"):
+                program_date_time = _parse_date_time(line.split(":", 1)[1])
+            elif line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:") :].split(",", 1)[0])
+            elif line and not line.startswith("#"):
+                if program_date_time is not None:
+                    program_date_time += duration
+                segments += 1
+
+        if not segments:
+            return
+
+        last_sequence = media_sequence + segments - 1
+        if variant.last_sequence is not None and last_sequence > variant.last_sequence:
+            # Segments that came and went between two refreshes were never seen
+            variant.missing_segments += max(0, media_sequence - variant.last_sequence - 1)
+
+            new_segments = last_sequence - variant.last_sequence
+            interval = (received_at - variant.last_published_at) / new_segments
+            variant.jitter = abs(interval - duration)
+
+        if variant.last_sequence is None or last_sequence > variant.last_sequence:
+            variant.last_sequence = last_sequence
+            variant.last_published_at = received_at
+
+        if program_date_time is not None:
+            variant.live_edge = program_date_time
+            variant.latency = time() - program_date_time
+
+    async def _get(
+        self, url: str, headers: Optional[Dict] = None
+    ) -> Optional[requests.Response]:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(
+                self._executor,
+                lambda: self.session.get(url, headers=headers, timeout=PROBE_TIMEOUT),
+            )
+        except requests.RequestException:
+            return None
+
+
+def measure_latency(manifest_url: str, duration: float) -> Optional[float]:
+    """Average live edge latency of the media playlists of an HLS manifest,
+    measured over `duration` seconds"""
+
+    async def measure():
+        monitor = PlaylistHealthMonitor(max_connections=10)
+        try:
+            await monitor.follow("channel", manifest_url)
+            samples = []
+            end = monotonic() + duration
+            while monotonic() < end:
+                await asyncio.sleep(0.5)
+                samples += [
+                    v.latency
+                    for v in monitor.channels["channel"]
+                    if v.latency is not None
+                ]
+            return sum(samples) / len(samples) if samples else None
+        finally:
+            monitor.close()
+
+    return asyncio.run(measure())
+
+
+def _parse_date_time(value: str) -> float:
+    return datetime.fromisoformat(value.strip().replace("Z", "+00:00")).timestamp()
+
+
+class SyntheticPlaylistServer:
+    """Local HTTP server of rolling live HLS playlists, to exercise the monitor.
+
+    Serves `/<channel>/stream.m3u8` master playlists, each with `variants`
+    media playlists of `window` segments of `segment_duration` seconds, which
+    roll as time passes and carry program date times. The playlists of the
+    last variant of each channel are published `lag` seconds late, and every
+    `skip_every` segments, the media sequence numbers jump ahead as if
+    segments had been lost.
+    """
+
+    def __init__(
+        self,
+        variants: int = 3,
+        segment_duration: float = 2.0,
+        window: int = 5,
+        lag: float = 0,
+        skip_every: int = 0,
+    ) -> None:
+        self.variants = variants
+        self.segment_duration = segment_duration
+        self.window = window
+        self.lag = lag
+        self.skip_every = skip_every
+        self.started_at = time()
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if len(parts) != 2:
+                    return self._respond(404, "")
+                if parts[1] == "stream.m3u8":
+                    return self._respond(200, server.master_playlist())
+
+                variant = int(parts[1].split(".")[0])
+                lag = server.lag if variant == server.variants - 1 else 0
+                (body, etag) = server.media_playlist(time() - lag)
+                if self.headers.get("if-none-match") == etag:
+                    return self._respond(304, "")
+                self._respond(200, body, etag)
+
+            def _respond(self, status: int, body: str, etag: Optional[str] = None):
+                body = body.encode("utf-8")
+                self.send_response(status)
+                if etag:
+                    self.send_header("etag", etag)
+                self.send_header("content-length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+
+    def url(self, channel: str) -> str:
+        return f"http://127.0.0.1:{self.port}/{channel}/stream.m3u8"
+
+    def master_playlist(self) -> str:
+        lines = ["#EXTM3U"]
+        for i in range(self.variants):
+            lines += [f"#EXT-X-STREAM-INF:BANDWIDTH={(i + 1) * 1000000}", f"{i}.m3u8"]
+        return "\n".join(lines) + "\n"
+
+    def media_playlist(self, now: float):
+        published = int((now - self.started_at) / self.segment_duration)
+        first = max(0, published - self.window)
+        skipped = first // self.skip_every * self.window if self.skip_every else 0
+
+        lines = [
+            "#EXTM3U",
+            f"#EXT-X-TARGETDURATION:{self.segment_duration:g}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first + skipped}",
+        ]
+        for sequence in range(first, published):
+            if sequence == first:
+                start = self.started_at + sequence * self.segment_duration
+                lines.append(
+                    "#EXT-X-PROGRAM-DATE-TIME:"
+                    + datetime.utcfromtimestamp(start).isoformat(timespec="milliseconds")
+                    + "Z"
+                )
+            lines += [f"#EXTINF:{self.segment_duration:.3f},", f"{sequence + skipped}.ts"]
+
+        return ("\n".join(lines) + "\n", str(published))
+
+    def start(self) -> None:
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+
+
+async def run(args) -> None:
+    monitor = PlaylistHealthMonitor(max_connections=args.max_connections)
+
+    urls = {url: url for url in args.manifest_urls}
+    if args.synthetic:
+        server = SyntheticPlaylistServer(
+            segment_duration=args.synthetic_segment_duration,
+            lag=args.synthetic_lag,
+            skip_every=args.synthetic_skip_every,
+        )
+        server.start()
+        urls = {f"channel-{i}": server.url(f"channel-{i}") for i in range(args.synthetic)}
+
+    for channel, url in urls.items():
+        await monitor.follow(channel, url)
+
+    if args.metrics_port:
+        await monitor.serve_metrics(port=args.metrics_port)
+        print(f"Serving metrics on port {args.metrics_port}")
+
+    try:
+        while True:
+            await asyncio.sleep(args.report_interval)
+            print(monitor.render_metrics())
+    finally:
+        monitor.close()
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Follow the media playlists of live HLS channels and report "
+        "their latency, publication jitter, missing segments and variant drift"
+    )
+    parser.add_argument("manifest_urls", nargs="*", help="master playlist URLs")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics")
+    parser.add_argument("--max-connections", type=int, default=20)
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=10,
+        help="interval in seconds between printed reports",
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="follow this number of channels served by a local synthetic server",
+    )
+    parser.add_argument("--synthetic-segment-duration", type=float, default=2.0)
+    parser.add_argument(
+        "--synthetic-lag",
+        type=float,
+        default=0,
+        help="delay of the last variant of each synthetic channel, in seconds",
+    )
+    parser.add_argument(
+        "--synthetic-skip-every",
+        type=int,
+        default=0,
+        help="skip every Nth segment of the synthetic channels",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_arguments()))
+    except KeyboardInterrupt:
+        pass
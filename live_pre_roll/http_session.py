@@ -0,0 +1,54 @@
+import random
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (connect, read) timeouts of the API calls, in seconds
+DEFAULT_TIMEOUT = (5, 30)
+
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class _Retry(Retry):
+    """Retry policy that can't duplicate the resources created by a POST.
+
+    Idempotent requests are retried on connection errors, read errors and
+    error statuses. Non-idempotent ones only when they can't have been
+    processed: on connection errors (the request was never sent), and when
+    rate limited (429 responses are returned before processing the request).
+    Waits follow the Retry-After header if any, or an exponential backoff
+    with full jitter, so that parallel clients don't retry in lockstep.
+    """
+
+    def is_retry(
+        self, method: str, status_code: int, has_retry_after: bool = False
+    ) -> bool:
+        if status_code == 429 and self.total:
+            return True
+
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_backoff_time(self) -> float:
+        return random.uniform(0, super().get_backoff_time())
+
+
+def create_session(
+    pool_size: int = 10, max_retries: int = 5, backoff_factor: float = 0.5
+) -> requests.Session:
+    """HTTP session that keeps up to `pool_size` connections alive per host"""
+    retry = _Retry(
+        total=max_retries,
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=backoff_factor,
+        # Once retries are exhausted, the last response is returned as is
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
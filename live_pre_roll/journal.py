@@ -0,0 +1,182 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from time import time
+from typing import Dict, Optional
+
+STARTED = "started"
+COMPLETED = "completed"
+
+# Settings of the config file that the resources of a job depend on
+JOB_SETTINGS = [
+    "S3_OUTPUT_ID",
+    "S3_OUTPUT_BUCKET_NAME",
+    "S3_OUTPUT_BASE_PATH",
+    "RTMP_INPUT_ID",
+    "RTMP_STREAM_KEY",
+    "VIDEO_LADDER",
+    "AUDIO_LADDER",
+    "FRAME_RATE",
+    "SEGMENT_DURATION",
+    "LOW_LATENCY",
+    "CDN_FQDN",
+    "AD_SERVER_ID",
+    "VAST_TAG",
+    "TRANSCODING_PROFILE_ID",
+]
+
+
+def job_fingerprint(cfg, **inputs) -> str:
+    """Hash of the settings of the config file that a job depends on, and of
+    its own inputs (eg. the stream key of a channel)"""
+    settings = {name: getattr(cfg, name, None) for name in JOB_SETTINGS}
+    return hashlib.sha256(
+        json.dumps([settings, inputs], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class JobJournal:
+    """Local record of the progress of a job, to resume it after a failure.
+
+    Every resource created for the job is recorded with its ID as soon as the
+    API returns it, and so is every phase transition, along with the data the
+    next phases need (eg. the manifest URLs of an encoding). A job re-run with
+    the same JOB_ID reuses the recorded resources and skips completed phases,
+    instead of creating everything again.
+    Each write is committed straight away, so that a crash loses nothing that
+    was already created.
+    With a `fingerprint` of the inputs of the job (see `job_fingerprint`), the
+    record of a previous run with other inputs is discarded, so that a channel
+    whose ladder, output or latency mode changed starts over instead of
+    reattaching to its previous encoding.
+    """
+
+    def __init__(
+        self, db_path: str, job_id: str, fingerprint: Optional[str] = None
+    ) -> None:
+        self.job_id = job_id
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS resources ("
+            " job_id TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " resource_id TEXT NOT NULL,"
+            " recorded_at REAL NOT NULL,"
+            " PRIMARY KEY (job_id, key))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS phases ("
+            " job_id TEXT NOT NULL,"
+            " phase TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " data TEXT NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (job_id, phase))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " job_id TEXT PRIMARY KEY,"
+            " fingerprint TEXT NOT NULL)"
+        )
+        self._db.commit()
+
+        if fingerprint:
+            self._check_fingerprint(fingerprint)
+
+    def resource_id(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT resource_id FROM resources WHERE job_id = ? AND key = ?",
+                (self.job_id, key),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def record_resource(self, key: str, resource_id) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO resources VALUES (?, ?, ?, ?)",
+                (self.job_id, key, str(resource_id), time()),
+            )
+            self._db.commit()
+
+    def phase_status(self, phase: str) -> Optional[str]:
+        """Status of a phase: None if never started, STARTED or COMPLETED"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status FROM phases WHERE job_id = ? AND phase = ?",
+                (self.job_id, phase),
+            ).fetchone()
+
+        return row[0] if row else None
+
+    def is_completed(self, phase: str) -> bool:
+        return self.phase_status(phase) == COMPLETED
+
+    def phase_data(self, phase: str) -> Dict:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM phases WHERE job_id = ? AND phase = ?",
+                (self.job_id, phase),
+            ).fetchone()
+
+        return json.loads(row[0]) if row else {}
+
+    def start_phase(self, phase: str, **data) -> None:
+        self._set_phase(phase, STARTED, data)
+
+    def complete_phase(self, phase: str, **data) -> None:
+        self._set_phase(phase, COMPLETED, dict(self.phase_data(phase), **data))
+
+    def resources(self) -> Dict[str, str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, resource_id FROM resources WHERE job_id = ? "
+                "ORDER BY recorded_at",
+                (self.job_id,),
+            ).fetchall()
+
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _check_fingerprint(self, fingerprint: str) -> None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT fingerprint FROM fingerprints WHERE job_id = ?",
+                (self.job_id,),
+            ).fetchone()
+            if row and row[0] == fingerprint:
+                return
+
+            # Records without a fingerprint can't be trusted either
+            discarded = self._db.execute(
+                "DELETE FROM phases WHERE job_id = ?", (self.job_id,)
+            ).rowcount
+            discarded += self._db.execute(
+                "DELETE FROM resources WHERE job_id = ?", (self.job_id,)
+            ).rowcount
+            self._db.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?)",
+                (self.job_id, fingerprint),
+            )
+            self._db.commit()
+
+        if discarded:
+            print(
+                f"The settings of job {self.job_id} changed since its previous run, "
+                "starting it over"
+            )
+
+    def _set_phase(self, phase: str, status: str, data: Dict) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO phases VALUES (?, ?, ?, ?, ?)",
+                (self.job_id, phase, status, json.dumps(data), time()),
+            )
+            self._db.commit()
@@ -0,0 +1,313 @@
+import argparse
+import json
+import os
+import subprocess
+import threading
+from collections import namedtuple
+from time import monotonic, sleep
+from typing import Dict, List, Optional
+
+from ffmpeg import generate_dummy_feed, read_progress
+
+# Where a feed is pushed, and what it is made of
+FeedSpec = namedtuple("FeedSpec", "id rtmp_endpoint stream_key size rate video_bitrate")
+
+# Feeds running slower than this are not keeping up with real time
+min_realtime_speed = 0.98
+
+
+class _Feed:
+    def __init__(self, spec: FeedSpec, process: subprocess.Popen) -> None:
+        self.spec = spec
+        self.process = process
+        self.started_at = monotonic()
+        self.stats: Dict[str, str] = {}
+        self.cpu_time = 0.0
+
+        self._reader = threading.Thread(
+            target=self._read_progress, name=f"progress-{spec.id}", daemon=True
+        )
+        self._reader.start()
+
+    def _read_progress(self) -> None:
+        for stats in read_progress(self.process):
+            self.stats = stats
+
+    def speed(self) -> Optional[float]:
+        speed = self.stats.get("speed", "").rstrip("x")
+        try:
+            return float(speed)
+        except ValueError:
+            return None
+
+
+class LoadGenerator:
+    """Pushes many dummy RTMP feeds at once, to test the capacity of encoders.
+
+    Feeds are started one every `ramp_interval` seconds, and their progress
+    (fps, speed, dropped and duplicated frames, bitrate) is read from the
+    `-progress` pipe of their FFmpeg. The ramp holds as long as the FFmpeg
+    processes use more than `cpu_budget` cores, so that a feed that lags
+    behind real time is a sign of a slow ingest, rather than of an overloaded
+    test host. CPU usage is read from /proc, ie. only on Linux.
+    """
+
+    def __init__(
+        self,
+        cpu_budget: float,
+        ramp_interval: float = 1.0,
+        prerendered: bool = True,
+        cache_dir: str = "dummy_feed_cache",
+    ) -> None:
+        self.cpu_budget = cpu_budget
+        self.ramp_interval = ramp_interval
+        self.prerendered = prerendered
+        self.cache_dir = cache_dir
+
+        self.feeds: List[_Feed] = []
+        self.cpu_usage = 0.0
+        self._last_sampled_at = None
+        self._stopped = threading.Event()
+
+    def run(self, specs: List[FeedSpec], duration: float, report_interval: float):
+        """Ramp up the feeds, and keep them running for `duration` seconds"""
+        pending = list(specs)
+        start = monotonic()
+        last_report = start
+        next_start = start
+
+        while not self._stopped.is_set() and monotonic() - start < duration:
+            self._sample_cpu_usage()
+
+            if pending and monotonic() >= next_start:
+                if self.cpu_usage < self.cpu_budget:
+                    self._start(pending.pop(0))
+                next_start = monotonic() + self.ramp_interval
+
+            if monotonic() - last_report >= report_interval:
+                print(self.report())
+                last_report = monotonic()
+
+            self._stopped.wait(min(self.ramp_interval, report_interval, 1.0))
+
+        print(self.report())
+        self.stop_feeds()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def stop_feeds(self) -> None:
+        for feed in self.feeds:
+            feed.process.kill()
+        for feed in self.feeds:
+            feed.process.wait()
+
+    def report(self) -> str:
+        running = [f for f in self.feeds if f.process.poll() is None]
+        speeds = [s for s in (f.speed() for f in running) if s is not None]
+        lagging = [s for s in speeds if s < min_realtime_speed]
+
+        lines = [
+            "{0} feeds running, {1} exited, CPU {2:.1f}/{3:g} cores, "
+            "{4} lagging behind real time".format(
+                len(running),
+                len(self.feeds) - len(running),
+                self.cpu_usage,
+                self.cpu_budget,
+                len(lagging),
+            )
+        ]
+        for feed in self.feeds:
+            lines.append(
+                "  {0}: fps {1}, speed {2}, dropped {3}, duplicated {4}, {5}{6}".format(
+                    feed.spec.id,
+                    feed.stats.get("fps", "-"),
+                    feed.stats.get("speed", "-"),
+                    feed.stats.get("drop_frames", "-"),
+                    feed.stats.get("dup_frames", "-"),
+                    feed.stats.get("bitrate", "-"),
+                    "" if feed.process.poll() is None else " (exited)",
+                )
+            )
+        return "\n".join(lines)
+
+    def _start(self, spec: FeedSpec) -> None:
+        process = generate_dummy_feed(
+            rtmp_endpoint=spec.rtmp_endpoint,
+            stream_key=spec.stream_key,
+            rate=spec.rate,
+            stream_id=spec.id,
+            size=spec.size,
+            prerendered=self.prerendered,
+            cache_dir=self.cache_dir,
+            video_bitrate=spec.video_bitrate,
+            progress=True,
+        )
+        self.feeds.append(_Feed(spec, process))
+
+    def _sample_cpu_usage(self) -> None:
+        now = monotonic()
+        used = 0.0
+        for feed in self.feeds:
+            cpu_time = _process_cpu_time(feed.process.pid)
+            if cpu_time is not None:
+                used += cpu_time - feed.cpu_time
+                feed.cpu_time = cpu_time
+
+        if self._last_sampled_at is not None and now > self._last_sampled_at:
+            self.cpu_usage = used / (now - self._last_sampled_at)
+        self._last_sampled_at = now
+
+
+class LocalRtmpSink:
+    """FFmpeg processes listening for RTMP feeds on local ports, and discarding
+    them, to test the load generator without a live encoder"""
+
+    def __init__(self, base_port: int = 19350) -> None:
+        self.base_port = base_port
+        self.processes: List[subprocess.Popen] = []
+
+    def endpoint(self, i: int) -> str:
+        """Endpoint of the i-th feed, which is listened for from then on"""
+        port = self.base_port + i
+        self.processes.append(
+            subprocess.Popen(
+                [
+                    *["ffmpeg", "-nostats", "-loglevel", "error"],
+                    *["-listen", "1", "-i", f"rtmp://127.0.0.1:{port}/live/sink"],
+                    *["-f", "null", "-"],
+                ],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+            )
+        )
+        return f"127.0.0.1:{port}"
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.kill()
+
+
+def _process_cpu_time(pid: int) -> Optional[float]:
+    """User and system CPU time used by a process so far, in seconds"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The fields after the command name, which may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+
+    (utime, stime) = (int(fields[11]), int(fields[12]))
+    return (utime + stime) / os.sysconf("SC_CLK_TCK")
+
+
+def main():
+    args = parse_arguments()
+
+    sink = None
+    specs = []
+    if args.targets:
+        # eg. the channel details written by orchestrator.py
+        with open(args.targets) as f:
+            targets = [json.loads(line) for line in f if line.strip()]
+        targets = [t for t in targets if t.get("encoder_ip")][: args.feeds]
+        endpoints = [(t["encoder_ip"], t["stream_key"]) for t in targets]
+    elif args.local_sink:
+        sink = LocalRtmpSink()
+        endpoints = [(sink.endpoint(i), "sink") for i in range(args.feeds)]
+        # Leave time for the sinks to listen
+        sleep(1)
+    else:
+        endpoints = [
+            (args.rtmp_endpoint, f"{args.stream_key_prefix}{i:03d}")
+            for i in range(args.feeds)
+        ]
+
+    for i, (endpoint, stream_key) in enumerate(endpoints):
+        specs.append(
+            FeedSpec(
+                id=f"feed-{i:03d}",
+                rtmp_endpoint=endpoint,
+                stream_key=stream_key,
+                size=args.size,
+                rate=args.rate,
+                video_bitrate=args.video_bitrate,
+            )
+        )
+
+    generator = LoadGenerator(
+        cpu_budget=args.cpu_budget or os.cpu_count() * 0.8,
+        ramp_interval=args.ramp_interval,
+        prerendered=not args.realtime,
+    )
+    print(f"Ramping up {len(specs)} feeds")
+    try:
+        generator.run(
+            specs, duration=args.duration, report_interval=args.report_interval
+        )
+    except KeyboardInterrupt:
+        generator.stop_feeds()
+    finally:
+        if sink:
+            sink.stop()
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Push many dummy RTMP feeds at once, and report how they keep up"
+    )
+    parser.add_argument("-n", "--feeds", type=int, default=10)
+    parser.add_argument(
+        "--stream-key-prefix",
+        default="loadtest",
+        help="stream keys of the feeds, followed by their number",
+    )
+    # The feeds need somewhere to go, so one destination has to be given
+    destination = parser.add_mutually_exclusive_group(required=True)
+    destination.add_argument(
+        "--rtmp-endpoint", help="host (and port) to push the feeds to"
+    )
+    destination.add_argument(
+        "--targets",
+        help="JSONL file with the encoder_ip and stream_key of each feed, "
+        "eg. the output of orchestrator.py",
+    )
+    destination.add_argument(
+        "--local-sink",
+        action="store_true",
+        help="push the feeds to local FFmpeg listeners instead of an encoder",
+    )
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--rate", type=float, default=25.0)
+    parser.add_argument("--video-bitrate", type=int, default=3_000_000)
+    parser.add_argument(
+        "--realtime",
+        action="store_true",
+        help="render the feeds in real time instead of looping a pre-rendered one",
+    )
+    parser.add_argument(
+        "--cpu-budget",
+        type=float,
+        help="number of cores the feeds may use (defaults to 80%% of the cores)",
+    )
+    parser.add_argument(
+        "--ramp-interval",
+        type=float,
+        default=2.0,
+        help="interval in seconds between the start of two feeds",
+    )
+    parser.add_argument(
+        "--duration", type=float, default=300, help="duration of the test, in seconds"
+    )
+    parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=10,
+        help="interval in seconds between progress reports",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
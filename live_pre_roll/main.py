@@ -1,131 +1,403 @@
+import argparse
 import random
 import string
-from time import sleep
+import subprocess
+import sys
+from typing import TYPE_CHECKING, Optional, Tuple
 
 import config as cfg
-import requests
-from bitmovin import BitmovinController
-from broadpeak import BroadpeakIOController
-from ffmpeg import generate_dummy_feed
+from broadpeak import BroadpeakIOController, PrerollServiceSpec
+from config_check import check_config, describe_problems
+from executor import Ref, ResourceGraph
+from ffmpeg import generate_dummy_feed, prerender_loop
+from health_monitor import PlaylistHealthMonitor, measure_latency
+from journal import JobJournal, job_fingerprint
+from readiness import ManifestReadinessProbe, manifest_format
+from supervisor import LiveSessionSupervisor
+
+if TYPE_CHECKING:
+    from bitmovin import BitmovinController
 
 max_minutes_to_wait_for_manifest_files = 2
 
 
 def main():
-    # Initialising the broadpeak.io APIs
-    broadpeakio = BroadpeakIOController()
-    ad_server_source = broadpeakio.create_or_retrieve_ad_server()
+    args = parse_arguments()
+
+    if args.transcoding_profile:
+        BroadpeakIOController().build_transcoding_profile_config()
+        return
 
-    # Initalising the Bitmovin SDK
-    bitmovin = BitmovinController()
+    # Checking the config before creating anything
+    problems = check_config(cfg)
+    if args.check_config or problems:
+        print(describe_problems(problems))
+        if not hasattr(cfg, "TRANSCODING_PROFILE_ID"):
+            BroadpeakIOController().build_transcoding_profile_config()
+        sys.exit(1 if problems else 0)
+
+    # The Bitmovin SDK takes a while to import, and is only needed from here on
+    from bitmovin import BitmovinController
 
     # Defining some names for resources
-    stream_id = generate_random_string()
+    if hasattr(cfg, "JOB_ID"):
+        stream_id = cfg.JOB_ID
+    else:
+        stream_id = generate_random_string()
     encoding_name = f"Live RTMP - test {stream_id}"
     output_prefix = f"{stream_id}"
 
-    print("Starting the Bitmovin encoder")
-    (encoding, live_encoding, manifests) = bitmovin.encode_and_package(
-        name=encoding_name, output_sub_path=output_prefix
+    # Resuming the job where a previous run left it, if any. A random ID can't
+    # be given again, so there is nothing to resume without a JOB_ID
+    journal = None
+    if hasattr(cfg, "JOURNAL_PATH") and hasattr(cfg, "JOB_ID"):
+        journal = JobJournal(
+            db_path=cfg.JOURNAL_PATH,
+            job_id=stream_id,
+            fingerprint=job_fingerprint(cfg),
+        )
+
+    # Initialising the broadpeak.io APIs and the Bitmovin SDK. The lookups and
+    # creations below are start-up stages, run in parallel
+    broadpeakio = BroadpeakIOController()
+    bitmovin = BitmovinController(journal=journal)
+
+    resumed = bitmovin.resume_encoding(journal) if journal else None
+    (stages, ffmpeg_process) = start_up(
+        bitmovin=bitmovin,
+        broadpeakio=broadpeakio,
+        journal=journal,
+        stream_id=stream_id,
+        encoding_name=encoding_name,
+        output_prefix=output_prefix,
+        resumed=resumed,
     )
+    (encoding, live_encoding, manifest_urls) = stages.results["encoder"]
+    streaming_urls = stages.results["air"]
 
-    print("Live encoder is up and ready for ingest.")
+    print("Start-up stages:")
+    print(stages.report())
 
-    manifest_urls = bitmovin.determine_origin_urls(manifests)
-    print("Manifest URLs on the Origin: ")
-    for url in manifest_urls:
+    if bitmovin.configuration_cache:
+        print(f"Configuration cache: {bitmovin.configuration_cache.stats()}")
+
+    print("broadpeak.io streaming URLs:")
+    for url in streaming_urls:
         print(f"- {url}")
 
-    ffmpeg_process = None
-    if cfg.MAKE_DUMMY_FEED_WITH_FFMPEG:
-        print("Starting FFmpeg to push a dummy RTMP stream to the live encoder")
-        ffmpeg_process = generate_dummy_feed(
-            rtmp_endpoint=live_encoding.encoder_ip,
-            stream_key=live_encoding.stream_key,
-            stream_id=stream_id,
-            rate=cfg.FRAME_RATE,
+    if getattr(cfg, "LOW_LATENCY", False):
+        hls_url = next(u for u in manifest_urls if manifest_format(u) == "HLS")
+        latency = measure_latency(hls_url, duration=5 * cfg.SEGMENT_DURATION)
+        if latency is not None:
+            print(f"Live edge latency on the origin: {latency:.1f}s")
+
+    if hasattr(cfg, "HEALTH_METRICS_PORT"):
+        PlaylistHealthMonitor().start_in_background(
+            channels={
+                f"{stream_id}-{i}": url
+                for i, url in enumerate(manifest_urls)
+                if manifest_format(url) == "HLS"
+            },
+            metrics_port=cfg.HEALTH_METRICS_PORT,
+        )
+
+    supervisor = LiveSessionSupervisor()
+    if ffmpeg_process:
+        supervisor.watch_process(ffmpeg_process.wait, name="FFmpeg dummy feed")
+        supervisor.on_shutdown(lambda reason: ffmpeg_process.kill())
+
+    encoding_ended = bitmovin.watch_encoding(encoding)
+    supervisor.watch_future(
+        encoding_ended,
+        describe=lambda task: f"live encoding ended with status {task.status.value}",
+    )
+
+    def stop_encoding(reason: str):
+        if not encoding_ended.done():
+            bitmovin.stop_encoding(encoding)
+        if journal:
+            journal.complete_phase("shutdown")
+
+    supervisor.on_shutdown(stop_encoding)
+
+    print("Press Ctrl+C to shutdown the live encoding...")
+    supervisor.run()
+
+    print("All done!")
+    if journal:
+        print(
+            f"Note: the resources of job {stream_id} are recorded in "
+            f"{cfg.JOURNAL_PATH}, re-running this script with the same JOB_ID "
+            "reuses them"
         )
     else:
         print(
-            "Send an RTMP stream to rtmp://{ip}/live with stream key {key}"
-            "and frame rate {rate}".format(
-                ip=live_encoding.encoder_ip,
-                key=live_encoding.stream_key,
-                rate=cfg.FRAME_RATE,
-            )
+            "Note: to be able to re-run this script with error, "
+            "plug the relevant Bitmovin and broadpeak.io resource IDs listed above "
+            "into the appropriate constants in the config.py file"
         )
 
-    print("Waiting for manifests to be ready on the Origin")
-    wait_until_manifest_files_are_ready(manifest_urls)
 
-    print("Creating the broadpeak.io SSAI service")
-    streaming_urls = []
-    for url in manifest_urls:
-        format = "HLS"
-        
-        live_source = broadpeakio.create_live_source(
-            name=f"Bitmovin Live - {stream_id} - {format}", url=url
+def start_up(
+    bitmovin: "BitmovinController",
+    broadpeakio: BroadpeakIOController,
+    journal: Optional[JobJournal],
+    stream_id: str,
+    encoding_name: str,
+    output_prefix: str,
+    resumed=None,
+) -> Tuple[ResourceGraph, Optional[subprocess.Popen]]:
+    """Bring the channel up, as a graph of stages run as soon as their inputs
+    are available, so that the time to air is that of the slowest chain of
+    stages rather than the sum of all of them.
+
+    The ad server, S3 output, RTMP input and codec configurations are looked
+    up or created at the same time. The broadpeak.io live sources and pre-roll
+    services are created as soon as the manifest URLs are known, while the
+    encoder starts, and created again once the manifests are on the origin if
+    that fails (eg. if broadpeak.io rejects a source it cannot fetch yet).
+    Returns the graph of the stages, with their results and timings, and the
+    FFmpeg dummy feed if any.
+    """
+    graph = ResourceGraph(max_workers=10)
+    ffmpeg_processes = []
+
+    graph.add("ad_server", broadpeakio.create_or_retrieve_ad_server, journal=journal)
+    graph.add("output", bitmovin.resolve_output)
+
+    if resumed:
+        graph.add("encoder", lambda: resumed)
+    else:
+        graph.add("rtmp_input", bitmovin.get_rtmp_input)
+        graph.add("codec_configurations", bitmovin.create_codec_configurations)
+        graph.add(
+            "configure",
+            configure_encoder,
+            bitmovin=bitmovin,
+            name=encoding_name,
+            output_sub_path=output_prefix,
+            rtmp_input=Ref("rtmp_input"),
+            codec_configurations=Ref("codec_configurations"),
+            journal=journal,
+            after=["output"],
+        )
+        graph.add(
+            "encoder",
+            start_encoder,
+            bitmovin=bitmovin,
+            configured=Ref("configure"),
+            journal=journal,
         )
 
-        preroll_service = broadpeakio.create_preroll_service(
-            name=f"Bitmovin Live w/ PreRoll - {stream_id} - {format}",
-            ad_server_id=ad_server_source["id"],
-            live_source_id=live_source["id"],
-            transcoding_profile_id=cfg.TRANSCODING_PROFILE_ID,
+    def manifest_urls_of(stage):
+        # Both the configured encoding and the started one end with them
+        return stage[-1]
+
+    if cfg.MAKE_DUMMY_FEED_WITH_FFMPEG:
+        prerendered = getattr(cfg, "DUMMY_FEED_PRERENDERED", True)
+        cache_dir = getattr(cfg, "DUMMY_FEED_CACHE_DIR", "dummy_feed_cache")
+        if prerendered:
+            # The test loop is rendered while the encoder starts
+            graph.add(
+                "prerender",
+                prerender_loop,
+                rate=cfg.FRAME_RATE,
+                cache_dir=cache_dir,
+            )
+
+        def start_feed(encoder):
+            (_, live_encoding, _) = encoder
+            print("Starting FFmpeg to push a dummy RTMP stream to the live encoder")
+            process = generate_dummy_feed(
+                rtmp_endpoint=live_encoding.encoder_ip,
+                stream_key=live_encoding.stream_key,
+                stream_id=stream_id,
+                rate=cfg.FRAME_RATE,
+                prerendered=prerendered,
+                cache_dir=cache_dir,
+            )
+            ffmpeg_processes.append(process)
+            return process
+
+        graph.add(
+            "feed",
+            start_feed,
+            encoder=Ref("encoder"),
+            after=["prerender"] if prerendered else [],
         )
+        ingest = "feed"
+    else:
 
-        streaming_url = preroll_service["url"]
-        if hasattr(cfg, "CDN_FQDN"):
-            streaming_url = streaming_url.replace("stream.broadpeak.io", cfg.CDN_FQDN)
-        streaming_urls.append(streaming_url)
+        def print_ingest_details(encoder):
+            (_, live_encoding, _) = encoder
+            print(
+                "Send an RTMP stream to rtmp://{ip}/live with stream key {key}"
+                "and frame rate {rate}".format(
+                    ip=live_encoding.encoder_ip,
+                    key=live_encoding.stream_key,
+                    rate=cfg.FRAME_RATE,
+                )
+            )
 
-    print("broadpeak.io streaming URLs:")
-    for url in streaming_urls:
-        print(f"- {url}")
+        graph.add("ingest", print_ingest_details, encoder=Ref("encoder"))
+        ingest = "ingest"
+
+    graph.add(
+        "manifests",
+        lambda encoder: wait_until_manifest_files_are_ready(manifest_urls_of(encoder)),
+        encoder=Ref("encoder"),
+        after=[ingest],
+    )
+
+    def provision(urls_from, ad_server, retry_failure: bool = False):
+        specs = [
+            PrerollServiceSpec(
+                source_name=f"Bitmovin Live - {stream_id} - {manifest_format(url)}",
+                service_name="Bitmovin Live w/ PreRoll - {0} - {1}".format(
+                    stream_id, manifest_format(url)
+                ),
+                url=url,
+            )
+            for url in manifest_urls_of(urls_from)
+        ]
+        print("Creating the broadpeak.io SSAI services")
+        try:
+            return broadpeakio.create_preroll_services(
+                specs=specs,
+                ad_server_id=ad_server["id"],
+                transcoding_profile_id=cfg.TRANSCODING_PROFILE_ID,
+                journal=journal,
+            )
+        except Exception as e:
+            if not retry_failure:
+                raise
+            print(f"Creating the broadpeak.io services early failed, retrying later: {e}")
+            return None
+
+    graph.add(
+        "provision",
+        provision,
+        urls_from=Ref("encoder" if resumed else "configure"),
+        ad_server=Ref("ad_server"),
+        retry_failure=True,
+    )
+
+    def go_on_air(preroll_services, encoder, ad_server):
+        if preroll_services is None:
+            preroll_services = provision(urls_from=encoder, ad_server=ad_server)
+
+        streaming_urls = []
+        for preroll_service in preroll_services:
+            streaming_url = preroll_service["url"]
+            if hasattr(cfg, "CDN_FQDN"):
+                streaming_url = streaming_url.replace(
+                    "stream.broadpeak.io", cfg.CDN_FQDN
+                )
+            streaming_urls.append(streaming_url)
+
+        if journal:
+            journal.complete_phase("provision", streaming_urls=streaming_urls)
+        return streaming_urls
+
+    graph.add(
+        "air",
+        go_on_air,
+        preroll_services=Ref("provision"),
+        encoder=Ref("encoder"),
+        ad_server=Ref("ad_server"),
+        after=["manifests"],
+    )
 
     try:
-        print("Press Ctrl+C to shutdown the live encoding...")
-        while True:
-            pass  # Keep script running
+        graph.run()
+    except BaseException:
+        # Including Ctrl+C: the supervisor only takes over once the channel is
+        # on air, so an encoding already started must not be left running
+        for process in ffmpeg_processes:
+            process.kill()
+        started = _started_encoding(graph)
+        if started:
+            print(f"Start-up failed, stopping live encoding {started.id}")
+            try:
+                bitmovin.stop_encoding(started)
+            except Exception as e:
+                print(f"Unable to stop live encoding {started.id}: {e}")
+        raise
 
-    except KeyboardInterrupt:
-        print("Shutting down live encoding.")
-        if ffmpeg_process:
-            ffmpeg_process.kill()
+    return (graph, ffmpeg_processes[0] if ffmpeg_processes else None)
 
-        bitmovin.stop_encoding(encoding)
 
-        print("All done!")
-        print(
-            "Note: to be able to re-run this script with error, "
-            "plug the relevant Bitmovin and broadpeak.io resource IDs listed above "
-            "into the appropriate constants in the config.py file"
-        )
+def _started_encoding(graph: ResourceGraph):
+    """Encoding started by the `encoder` stage of a graph whose run failed"""
+    if "encoder" in graph.results:
+        return graph.results["encoder"][0]
+    # The stage ran, but another one failed before its result was collected
+    if "encoder" in graph.timings and "configure" in graph.results:
+        return graph.results["configure"][0]
+    return None
 
 
-def wait_until_manifest_files_are_ready(manifest_urls):
-    check_interval_in_seconds = 5
-    max_attempts = max_minutes_to_wait_for_manifest_files * (
-        60 / check_interval_in_seconds
+def configure_encoder(
+    bitmovin: "BitmovinController",
+    name: str,
+    output_sub_path: str,
+    rtmp_input,
+    codec_configurations,
+    journal: Optional[JobJournal],
+):
+    print("Configuring the Bitmovin encoder")
+    (encoding, request, manifests) = bitmovin.configure_live_encoding(
+        name=name,
+        output_sub_path=output_sub_path,
+        rtmp_input=rtmp_input,
+        journal=journal,
+        codec_configurations=codec_configurations,
     )
-    attempt = 0
+    manifest_urls = bitmovin.determine_origin_urls(manifests)
+    if journal:
+        journal.start_phase(
+            "encode", encoding_id=encoding.id, manifest_urls=manifest_urls
+        )
 
-    while attempt < max_attempts:
-        response_codes = []
-        for url in manifest_urls:
-            response = requests.get(url)
-            response_codes.append(response.status_code)
+    print("Manifest URLs on the Origin: ")
+    for url in manifest_urls:
+        print(f"- {url}")
+    return (encoding, request, manifest_urls)
+
+
+def start_encoder(
+    bitmovin: "BitmovinController", configured, journal: Optional[JobJournal]
+):
+    (encoding, request, manifest_urls) = configured
+    print("Starting the Bitmovin encoder")
+    live_encoding = bitmovin.start_live_encoding(encoding=encoding, request=request)
+    if journal:
+        journal.complete_phase("encode")
 
-        if all(code == 200 for code in response_codes):
-            return
+    print("Live encoder is up and ready for ingest.")
+    return (encoding, live_encoding, manifest_urls)
 
-        sleep(check_interval_in_seconds)
-        attempt += 1
 
-    raise Exception(
-        "Manifest files did not become ready after {0} minutes. Aborting.".format(
-            max_minutes_to_wait_for_manifest_files
+def wait_until_manifest_files_are_ready(manifest_urls):
+    probe = ManifestReadinessProbe(
+        min_segments=getattr(cfg, "MANIFEST_READY_MIN_SEGMENTS", 3),
+        max_connections=getattr(cfg, "BPKIO_API_MAX_CONNECTIONS", 10),
+    )
+    try:
+        duration = probe.wait_until_ready(
+            manifest_urls, timeout=max_minutes_to_wait_for_manifest_files * 60
         )
+    except TimeoutError as e:
+        raise Exception(
+            "Manifest files did not become ready after {0} minutes. Aborting.".format(
+                max_minutes_to_wait_for_manifest_files
+            )
+        ) from e
+    finally:
+        probe.close()
+
+    print(
+        f"Manifests ready after {duration:.1f}s ({probe.requests} requests to the origin)"
     )
 
 
@@ -135,5 +407,23 @@ def generate_random_string(length=8):
     return result_str
 
 
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Bring up a live channel with a broadpeak.io pre-roll service"
+    )
+    parser.add_argument(
+        "--check-config",
+        action="store_true",
+        help="check the config file without calling any API, and exit",
+    )
+    parser.add_argument(
+        "--transcoding-profile",
+        action="store_true",
+        help="print the broadpeak.io transcoding profile matching the config file",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
     main()
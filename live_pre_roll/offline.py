@@ -0,0 +1,116 @@
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import Future
+from time import sleep
+from typing import List, Optional, Tuple
+
+from journal import JobJournal
+
+# Minimal stand-ins for the Bitmovin resources used outside of the controller
+Encoding = namedtuple("Encoding", "id name")
+LiveEncoding = namedtuple("LiveEncoding", "encoder_ip stream_key")
+EncodingOutput = namedtuple("EncodingOutput", "output_path")
+Manifest = namedtuple("Manifest", "id outputs manifest_name")
+
+# Number of API calls BitmovinController.configure_live_encoding makes one after
+# the other: encoding, configurations, streams, muxings, manifest
+CONFIGURATION_ROUND_TRIPS = 5
+
+
+class OfflineBitmovinController:
+    """Stand-in for the live BitmovinController that makes no API call.
+
+    API calls are simulated with a fixed latency, and live encodings take
+    `startup_duration` seconds to be ready for ingest once started, which
+    allows start-up strategies to be measured without an account.
+    """
+
+    def __init__(
+        self, config, api_latency: float = 0.1, startup_duration: float = 60.0
+    ) -> None:
+        self.config = config
+        self.api_latency = api_latency
+        self.startup_duration = startup_duration
+        self.configuration_cache = None
+
+        self.running_encodings = 0
+        self._lock = threading.Lock()
+
+    def encode_and_package(
+        self,
+        name: str,
+        output_sub_path: str,
+        stream_key: Optional[str] = None,
+        rtmp_input=None,
+        journal: Optional[JobJournal] = None,
+    ) -> Tuple[Encoding, LiveEncoding, List[Manifest]]:
+        (encoding, request, manifests) = self.configure_live_encoding(
+            name=name,
+            output_sub_path=output_sub_path,
+            stream_key=stream_key,
+            rtmp_input=rtmp_input,
+        )
+        if journal:
+            journal.record_resource("encoding", encoding.id)
+            journal.start_phase(
+                "encode",
+                encoding_id=encoding.id,
+                manifest_urls=self.determine_origin_urls(manifests),
+            )
+
+        live_encoding = self.start_live_encoding(encoding=encoding, request=request)
+        if journal:
+            journal.complete_phase("encode")
+
+        return (encoding, live_encoding, manifests)
+
+    def configure_live_encoding(
+        self,
+        name: str,
+        output_sub_path: str,
+        stream_key: Optional[str] = None,
+        rtmp_input=None,
+        journal: Optional[JobJournal] = None,
+    ) -> Tuple[Encoding, str, List[Manifest]]:
+        sleep(self.api_latency * CONFIGURATION_ROUND_TRIPS)
+
+        output_path = f"{self.config.S3_OUTPUT_BASE_PATH}{output_sub_path}"
+        manifests = [
+            Manifest(
+                id=str(uuid.uuid4()),
+                outputs=[EncodingOutput(output_path=output_path)],
+                manifest_name="stream.m3u8",
+            )
+        ]
+        encoding = Encoding(id=str(uuid.uuid4()), name=name)
+
+        # The stand-in of the start request is the stream key
+        return (encoding, stream_key or self.config.RTMP_STREAM_KEY, manifests)
+
+    def start_live_encoding(self, encoding: Encoding, request: str) -> LiveEncoding:
+        sleep(self.api_latency + self.startup_duration)
+        with self._lock:
+            self.running_encodings += 1
+
+        return LiveEncoding(encoder_ip="127.0.0.1", stream_key=request)
+
+    def watch_encoding(self, encoding: Encoding) -> Future:
+        # Simulated encodings run until they are stopped
+        return Future()
+
+    def stop_encoding(self, encoding: Encoding) -> None:
+        sleep(self.api_latency)
+        with self._lock:
+            self.running_encodings -= 1
+
+    def determine_origin_urls(self, manifests: List[Manifest]) -> List[str]:
+        baseurl = "https://offline-bucket.s3.amazonaws.com/"
+
+        return [
+            "/".join(
+                p.strip("/")
+                for p in [baseurl, m.outputs[0].output_path, m.manifest_name]
+            )
+            for m in manifests
+        ]
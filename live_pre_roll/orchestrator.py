@@ -0,0 +1,345 @@
+import argparse
+import csv
+import json
+import sys
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from time import perf_counter
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
+
+import config as cfg
+from broadpeak import BroadpeakIOController, PrerollServiceSpec
+from config_check import check_config, describe_problems
+from ffmpeg import generate_dummy_feed
+from journal import JobJournal, job_fingerprint
+from readiness import ManifestReadinessProbe, manifest_format
+from supervisor import LiveSessionSupervisor
+from warm_pool import LiveEncodingPool
+
+if TYPE_CHECKING:
+    from bitmovin import BitmovinController
+
+Channel = namedtuple("Channel", "id stream_key rtmp_input_id")
+
+STAGES = ["encoder", "manifests", "provision"]
+
+max_minutes_to_wait_for_manifest_files = 2
+
+
+def main():
+    args = parse_arguments()
+
+    if args.channels:
+        channels = list(read_channels(args.channels))
+    elif args.count:
+        channels = list(generate_channels(args.count))
+    else:
+        raise Exception("Provide a channel list with --channels, or use --count")
+
+    problems = check_config(cfg)
+    if problems:
+        print(describe_problems(problems))
+        sys.exit(1)
+
+    # The Bitmovin SDK takes a while to import, and is only needed from here on
+    from bitmovin import BitmovinController
+
+    orchestrator = ChannelOrchestrator(
+        bitmovin=BitmovinController(),
+        broadpeakio=BroadpeakIOController(),
+        journal_path=getattr(cfg, "JOURNAL_PATH", None),
+        make_dummy_feeds=cfg.MAKE_DUMMY_FEED_WITH_FFMPEG,
+    )
+
+    print(f"Bringing up {len(channels)} channels")
+    try:
+        results = orchestrator.bring_up(channels)
+    except BaseException:
+        # Including Ctrl+C: the encodings and feeds already started must not
+        # be left running
+        orchestrator.shut_down()
+        raise
+    print(orchestrator.report(results))
+
+    up = [r for r in results if r["status"] == "live"]
+    if args.output:
+        with open(args.output, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+
+    if not up:
+        # Channels can fail after their encoder has started
+        orchestrator.shut_down()
+        return
+
+    supervisor = LiveSessionSupervisor()
+    supervisor.on_shutdown(lambda reason: orchestrator.shut_down())
+    print("Press Ctrl+C to shutdown the live encodings...")
+    supervisor.run()
+    print("All done!")
+
+
+class ChannelOrchestrator:
+    """Brings up many live channels at once.
+
+    Each channel gets its own live encoding (with its own stream key, RTMP
+    input and output prefix), its own dummy feed if enabled, and its own
+    broadpeak.io live sources and pre-roll services. Channels are brought up
+    concurrently, so that the waits for the encoders to start, which take most
+    of the time, overlap: the encoder statuses are all tracked by the single
+    status watcher thread of the Bitmovin controller.
+    The ad server is shared by all channels. With a journal, each channel is a
+    job of its own, named after the channel ID.
+    With a warm pool, channels take an encoding from it instead of starting
+    one, and are ingested with the stream key of that encoding.
+    """
+
+    def __init__(
+        self,
+        bitmovin: "BitmovinController",
+        broadpeakio: BroadpeakIOController,
+        journal_path: Optional[str] = None,
+        make_dummy_feeds: bool = False,
+        max_concurrent_channels: int = 50,
+        pool: Optional[LiveEncodingPool] = None,
+    ) -> None:
+        self.bitmovin = bitmovin
+        self.broadpeakio = broadpeakio
+        self.journal_path = journal_path
+        self.make_dummy_feeds = make_dummy_feeds
+        self.max_concurrent_channels = max_concurrent_channels
+        self.pool = pool
+
+        self._lock = threading.Lock()
+        self._encodings = {}
+        self._ffmpeg_processes = {}
+
+    def bring_up(self, channels: List[Channel]) -> List[Dict]:
+        """Bring up the channels, and return the outcome and timings of each"""
+        ad_server = self.broadpeakio.create_or_retrieve_ad_server()
+
+        # RTMP inputs are allocated explicitly, and each one is only looked up once
+        rtmp_inputs = {
+            input_id: self.bitmovin.get_rtmp_input(input_id=input_id)
+            for input_id in {c.rtmp_input_id for c in channels}
+        }
+
+        start = perf_counter()
+        with ThreadPoolExecutor(
+            max_workers=min(len(channels), self.max_concurrent_channels)
+        ) as executor:
+            return list(
+                executor.map(
+                    lambda c: self._bring_up(
+                        c, rtmp_inputs[c.rtmp_input_id], ad_server, start
+                    ),
+                    channels,
+                )
+            )
+
+    def shut_down(self) -> None:
+        """Stop all the live encodings and dummy feeds, in parallel"""
+        for process in self._ffmpeg_processes.values():
+            process.kill()
+
+        def stop(item):
+            (channel_id, encoding) = item
+            try:
+                self.bitmovin.stop_encoding(encoding)
+                print(f"Channel {channel_id} stopped")
+            except Exception as e:
+                print(f"Channel {channel_id} could not be stopped: {e}")
+
+        if self._encodings:
+            with ThreadPoolExecutor(max_workers=len(self._encodings)) as executor:
+                list(executor.map(stop, self._encodings.items()))
+
+    def report(self, results: List[Dict]) -> str:
+        lines = []
+        for result in results:
+            timings = ", ".join(
+                f"{stage} {result['timings'][stage]:.1f}s"
+                for stage in STAGES
+                if stage in result["timings"]
+            )
+            lines.append(f"- {result['id']}: {result['status']} ({timings})")
+            for url in result.get("streaming_urls", []):
+                lines.append(f"    {url}")
+
+        live = [r["timings"]["provision"] for r in results if r["status"] == "live"]
+        if live:
+            lines.append(
+                "{0}/{1} channels live, time-to-live: min {2:.1f}s, max {3:.1f}s".format(
+                    len(live), len(results), min(live), max(live)
+                )
+            )
+        return "\n".join(lines)
+
+    def _bring_up(
+        self, channel: Channel, rtmp_input, ad_server: Dict, start: float
+    ) -> Dict:
+        result = {"id": channel.id, "stream_key": channel.stream_key, "timings": {}}
+        try:
+            if self.journal_path:
+                journal = JobJournal(
+                    self.journal_path,
+                    job_id=channel.id,
+                    fingerprint=job_fingerprint(
+                        cfg,
+                        stream_key=channel.stream_key,
+                        rtmp_input_id=channel.rtmp_input_id,
+                    ),
+                )
+                with closing(journal) as j:
+                    self._bring_up_channel(
+                        channel, rtmp_input, ad_server, start, result, j
+                    )
+            else:
+                self._bring_up_channel(
+                    channel, rtmp_input, ad_server, start, result, None
+                )
+            result["status"] = "live"
+        except Exception as e:
+            print(f"Channel {channel.id} failed: {e}")
+            result["status"] = "failed"
+            result["error"] = str(e)
+
+        return result
+
+    def _bring_up_channel(
+        self,
+        channel: Channel,
+        rtmp_input,
+        ad_server: Dict,
+        start: float,
+        result: Dict,
+        journal: Optional[JobJournal],
+    ) -> None:
+        resumed = self.bitmovin.resume_encoding(journal) if journal else None
+        if resumed:
+            (encoding, live_encoding, manifest_urls) = resumed
+        elif self.pool:
+            warm = self.pool.acquire(journal=journal)
+            (encoding, live_encoding) = (warm.encoding, warm.live_encoding)
+            manifest_urls = self.bitmovin.determine_origin_urls(warm.manifests)
+            result["stream_key"] = warm.stream_key
+        else:
+            (encoding, live_encoding, manifests) = self.bitmovin.encode_and_package(
+                name=f"Live RTMP - {channel.id}",
+                output_sub_path=channel.id,
+                stream_key=channel.stream_key,
+                rtmp_input=rtmp_input,
+                journal=journal,
+            )
+            manifest_urls = self.bitmovin.determine_origin_urls(manifests)
+        with self._lock:
+            self._encodings[channel.id] = encoding
+        result["timings"]["encoder"] = perf_counter() - start
+        result["encoder_ip"] = live_encoding.encoder_ip
+        result["manifest_urls"] = manifest_urls
+        print(f"Channel {channel.id}: encoder ready for ingest")
+
+        if self.make_dummy_feeds:
+            process = generate_dummy_feed(
+                rtmp_endpoint=live_encoding.encoder_ip,
+                stream_key=live_encoding.stream_key,
+                stream_id=channel.id,
+                rate=cfg.FRAME_RATE,
+                prerendered=getattr(cfg, "DUMMY_FEED_PRERENDERED", True),
+                cache_dir=getattr(cfg, "DUMMY_FEED_CACHE_DIR", "dummy_feed_cache"),
+            )
+            with self._lock:
+                self._ffmpeg_processes[channel.id] = process
+
+        probe = ManifestReadinessProbe(
+            min_segments=getattr(cfg, "MANIFEST_READY_MIN_SEGMENTS", 3)
+        )
+        try:
+            probe.wait_until_ready(
+                manifest_urls, timeout=max_minutes_to_wait_for_manifest_files * 60
+            )
+        finally:
+            probe.close()
+        result["timings"]["manifests"] = perf_counter() - start
+
+        preroll_services = self.broadpeakio.create_preroll_services(
+            specs=[
+                PrerollServiceSpec(
+                    source_name="Bitmovin Live - {0} - {1}".format(
+                        channel.id, manifest_format(url)
+                    ),
+                    service_name="Bitmovin Live w/ PreRoll - {0} - {1}".format(
+                        channel.id, manifest_format(url)
+                    ),
+                    url=url,
+                )
+                for url in manifest_urls
+            ],
+            ad_server_id=ad_server["id"],
+            transcoding_profile_id=cfg.TRANSCODING_PROFILE_ID,
+            journal=journal,
+        )
+        result["streaming_urls"] = [
+            s["url"].replace("stream.broadpeak.io", cfg.CDN_FQDN)
+            if hasattr(cfg, "CDN_FQDN")
+            else s["url"]
+            for s in preroll_services
+        ]
+        result["timings"]["provision"] = perf_counter() - start
+        if journal:
+            journal.complete_phase("provision", streaming_urls=result["streaming_urls"])
+        print(f"Channel {channel.id}: live")
+
+
+def read_channels(channels_path: str) -> Iterator[Channel]:
+    """Read a channel list, in JSONL or CSV format.
+
+    Lines have the fields `id` and `stream_key`, and optionally `rtmp_input_id`
+    (defaults to RTMP_INPUT_ID from the config file, or the only RTMP input of
+    the account).
+    """
+    with open(channels_path, newline="") as f:
+        if channels_path.endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+
+        for row in rows:
+            yield Channel(
+                id=row["id"],
+                stream_key=row["stream_key"],
+                rtmp_input_id=row.get("rtmp_input_id") or None,
+            )
+
+
+def generate_channels(count: int) -> Iterator[Channel]:
+    prefix = getattr(cfg, "JOB_ID", "channel")
+    for i in range(count):
+        yield Channel(
+            id=f"{prefix}-{i:03d}",
+            stream_key=f"{cfg.RTMP_STREAM_KEY}{i:03d}",
+            rtmp_input_id=None,
+        )
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Bring up many live pre-roll channels at once"
+    )
+    parser.add_argument("--channels", help="path to a JSONL or CSV channel list")
+    parser.add_argument(
+        "--count",
+        type=int,
+        help="bring up this number of channels named after the config file",
+    )
+    parser.add_argument(
+        "-o", "--output", help="path to a JSONL file to write the channels' details to"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+from typing import Dict, List, Optional
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from http_session import create_session
+
+# (connect, read) timeouts of the probes, in seconds
+PROBE_TIMEOUT = (2, 5)
+
+
+class _Playlist:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.segments = 0
+        self.ready = False
+
+
+class ManifestReadinessProbe:
+    """Tells when live HLS manifests on the origin are playable.
+
+    An HLS manifest is ready when every variant (and rendition) playlist listed
+    in it has at least `min_segments` segments, and the latest of them can be
+    fetched. A DASH manifest is ready as soon as it is published. Playlists are
+    checked concurrently over a pool of kept-alive connections, with
+    conditional requests so that unchanged playlists aren't downloaded again,
+    and segments are only checked with HEAD requests.
+    Checks are repeated every `min_interval` seconds while playlists change,
+    and back off to `max_interval` while they don't.
+    """
+
+    def __init__(
+        self,
+        min_segments: int = 3,
+        min_interval: float = 0.2,
+        max_interval: float = 1.0,
+        max_connections: int = 10,
+    ) -> None:
+        self.min_segments = min_segments
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_connections = max_connections
+
+        self.session = create_session(
+            pool_size=max_connections, max_retries=0, backoff_factor=0
+        )
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def wait_until_ready(self, manifest_urls: List[str], timeout: float) -> float:
+        """Block until all manifests are ready, returns how long it took.
+
+        Raises a TimeoutError if they aren't after `timeout` seconds.
+        """
+        start = monotonic()
+        # Master playlists are replaced by the playlists they list once fetched
+        pending = [_Playlist(url) for url in manifest_urls]
+        interval = self.min_interval
+
+        with ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            while True:
+                results = list(executor.map(self._check, pending))
+
+                changed = False
+                next_pending = []
+                for playlist, (updated, listed) in zip(pending, results):
+                    changed = changed or updated
+                    if listed is not None:
+                        next_pending.extend(_Playlist(url) for url in listed)
+                    elif not playlist.ready:
+                        next_pending.append(playlist)
+                pending = next_pending
+
+                if not pending:
+                    return monotonic() - start
+
+                if monotonic() - start > timeout:
+                    raise TimeoutError(
+                        "{0} playlists not ready after {1:.0f} seconds: {2}".format(
+                            len(pending),
+                            timeout,
+                            ", ".join(p.url for p in pending),
+                        )
+                    )
+
+                interval = (
+                    self.min_interval
+                    if changed
+                    else min(self.max_interval, interval * 1.5)
+                )
+                sleep(interval)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _check(self, playlist: _Playlist):
+        """Returns whether the playlist changed, and the playlists it lists if any"""
+        headers = {}
+        if playlist.etag:
+            headers["if-none-match"] = playlist.etag
+        if playlist.last_modified:
+            headers["if-modified-since"] = playlist.last_modified
+
+        response = self._request("GET", playlist.url, headers=headers)
+        if response is None or response.status_code != 200:
+            return (False, None)
+
+        playlist.etag = response.headers.get("etag")
+        playlist.last_modified = response.headers.get("last-modified")
+
+        # DASH manifests list segments by template: published is ready
+        if manifest_format(playlist.url) == "DASH":
+            playlist.ready = True
+            return (True, None)
+
+        parsed = parse_playlist(response.text, base_url=playlist.url)
+        if parsed["playlists"]:
+            return (True, parsed["playlists"])
+
+        playlist.segments = len(parsed["segments"])
+        if playlist.segments >= self.min_segments:
+            latest = self._request("HEAD", parsed["segments"][-1])
+            playlist.ready = latest is not None and latest.status_code == 200
+
+        return (True, None)
+
+    def _request(self, method: str, url: str, **kwargs) -> Optional[requests.Response]:
+        with self._lock:
+            self.requests += 1
+        try:
+            return self.session.request(method, url, timeout=PROBE_TIMEOUT, **kwargs)
+        except requests.RequestException:
+            return None
+
+
+def manifest_format(url: str) -> str:
+    return "DASH" if urlsplit(url).path.endswith(".mpd") else "HLS"
+
+
+def parse_playlist(text: str, base_url: str) -> Dict[str, List[str]]:
+    """Absolute URLs of the playlists (for a master) or segments (for a media
+    playlist) listed in an HLS playlist"""
+    playlists = []
+    segments = []
+    next_is_playlist = False
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+
+        if line.startswith("#EXT-X-STREAM-INF"):
+            next_is_playlist = True
+        elif line.startswith("#EXT-X-MEDIA:") and 'URI="' in line:
+            uri = line.split('URI="', 1)[1].split('"', 1)[0]
+            playlists.append(urljoin(base_url, uri))
+        elif not line.startswith("#"):
+            if next_is_playlist:
+                playlists.append(urljoin(base_url, line))
+                next_is_playlist = False
+            else:
+                segments.append(urljoin(base_url, line))
+
+    return {"playlists": playlists, "segments": segments}
@@ -0,0 +1,65 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from time import perf_counter
+from typing import List, Tuple
+
+# Commands that should start in milliseconds, as they don't need the Bitmovin
+# SDK nor any API call. The SDK import is listed for reference
+COMMANDS = [
+    ("python (baseline)", ["-c", "pass"]),
+    ("import main", ["-c", "import main"]),
+    ("import orchestrator", ["-c", "import orchestrator"]),
+    ("main.py --check-config", ["main.py", "--check-config"]),
+    ("main.py --transcoding-profile", ["main.py", "--transcoding-profile"]),
+    ("import bitmovin_api_sdk", ["-c", "import bitmovin_api_sdk"]),
+]
+
+
+def measure(args: List[str], runs: int) -> Tuple[float, bool]:
+    """Median wall time of a Python command, and whether it imports the SDK"""
+    durations = []
+    imports_sdk = False
+    for _ in range(runs):
+        start = perf_counter()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", *args],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        )
+        durations.append(perf_counter() - start)
+        imports_sdk = imports_sdk or "bitmovin_api_sdk" in proc.stderr
+
+    return (statistics.median(durations), imports_sdk)
+
+
+def main():
+    args = parse_arguments()
+
+    width = max(len(name) for (name, _) in COMMANDS)
+    print(f"{'command':<{width}}  median  Bitmovin SDK imported")
+    for name, command in COMMANDS:
+        (duration, imports_sdk) = measure(command, runs=args.runs)
+        print(
+            "{0:<{1}}  {2:4.0f}ms  {3}".format(
+                name, width, duration * 1000, "yes" if imports_sdk else "no"
+            )
+        )
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Measure the start-up time of the commands of the playbook"
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="number of runs of each command"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()
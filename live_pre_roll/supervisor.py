@@ -0,0 +1,85 @@
+import signal
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+
+class LiveSessionSupervisor:
+    """Keeps a live session up until it needs to be shut down.
+
+    The calling thread blocks on an event, without using any CPU, until
+    something ends the session: SIGINT (Ctrl+C) or SIGTERM, the exit of a
+    watched process (eg. the FFmpeg dummy feed), or the completion of a watched
+    future (eg. the live encoding reaching a terminal status). The shutdown
+    callbacks then run once, in the order they were registered, from the
+    calling thread.
+    """
+
+    def __init__(self) -> None:
+        self.reason: Optional[str] = None
+
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._on_shutdown: List[Callable[[str], None]] = []
+
+    def on_shutdown(self, callback: Callable[[str], None]) -> None:
+        """Register a callback, called with the reason of the shutdown"""
+        self._on_shutdown.append(callback)
+
+    def watch_process(self, wait: Callable[[], object], name: str) -> None:
+        """End the session when a process exits, ie. when `wait()` returns"""
+
+        def watch():
+            wait()
+            self.stop(f"{name} exited")
+
+        threading.Thread(target=watch, name=f"watch-{name}", daemon=True).start()
+
+    def watch_future(self, future: Future, describe: Callable[[object], str]) -> None:
+        """End the session when a future resolves, with `describe(result)` as reason.
+
+        A future that fails (eg. the status could no longer be fetched) is
+        reported, but doesn't end the session.
+        """
+
+        def done(f: Future):
+            if f.cancelled():
+                return
+            if f.exception():
+                print(f"Stopped watching the live session: {f.exception()}")
+                return
+            self.stop(describe(f.result()))
+
+        future.add_done_callback(done)
+
+    def stop(self, reason: str) -> None:
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+        self._stopped.set()
+
+    def run(self) -> str:
+        """Block until the session ends, then shut it down. Returns the reason"""
+        handled = [signal.SIGINT, signal.SIGTERM]
+        previous = {s: signal.getsignal(s) for s in handled}
+        for s in handled:
+            signal.signal(s, self._handle_signal)
+
+        try:
+            self._stopped.wait()
+        finally:
+            # A second signal interrupts a shutdown that takes too long
+            for s in handled:
+                signal.signal(s, previous[s])
+
+        print(f"Shutting down the live session: {self.reason}")
+        for callback in self._on_shutdown:
+            try:
+                callback(self.reason)
+            except Exception as e:
+                print(f"Shutdown step failed: {e}")
+
+        return self.reason
+
+    def _handle_signal(self, signum, frame) -> None:
+        self.stop(f"received {signal.Signals(signum).name}")
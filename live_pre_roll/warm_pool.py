@@ -0,0 +1,271 @@
+import argparse
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from time import monotonic, sleep
+from typing import List, Optional
+
+from journal import JobJournal
+
+# A live encoding ready for ingest, with the stream key and output prefix it
+# was started with
+WarmEncoding = namedtuple(
+    "WarmEncoding", "encoding live_encoding manifests stream_key output_sub_path"
+)
+
+
+class _PooledEncoding:
+    def __init__(self, warm: WarmEncoding, ended: Future) -> None:
+        self.warm = warm
+        self.ended = ended
+
+
+class LiveEncodingPool:
+    """Keeps live encodings started and idle, to hand them out immediately.
+
+    Up to `size` live encodings of the ladder of the config file are started
+    ahead of time, each with a stream key and output prefix of its own, as
+    neither can be changed once an encoding is started. `acquire` hands one
+    out along with them, and a replacement is started in the background. When
+    the pool is empty, `acquire` starts an encoding itself, as without a pool.
+    Idle encodings cost as much as busy ones: the pool only stays warm for
+    `idle_ttl` seconds after the last acquisition (or its creation), after
+    which its idle encodings are stopped until the next acquisition.
+    """
+
+    def __init__(
+        self,
+        bitmovin,
+        size: int,
+        idle_ttl: float = 1800,
+        stream_key_prefix: str = "warm",
+        output_prefix: str = "warm",
+        rtmp_input=None,
+    ) -> None:
+        self.bitmovin = bitmovin
+        self.size = size
+        self.idle_ttl = idle_ttl
+        self.stream_key_prefix = stream_key_prefix
+        self.output_prefix = output_prefix
+        self.rtmp_input = rtmp_input
+
+        self.acquisitions: List[float] = []
+        self.cold_starts = 0
+
+        self._ready: List[_PooledEncoding] = []
+        self._starting = 0
+        self._last_demand = monotonic()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, size), thread_name_prefix="warm-pool"
+        )
+        self._thread = threading.Thread(
+            target=self._run, name="warm-pool-manager", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def acquire(self, journal: Optional[JobJournal] = None) -> WarmEncoding:
+        """A live encoding ready for ingest, from the pool if it has one.
+
+        With a journal, the encoding is recorded as the job's, as if it had
+        been started for it.
+        """
+        start = monotonic()
+        with self._condition:
+            self._last_demand = start
+            pooled = None
+            while self._ready:
+                candidate = self._ready.pop(0)
+                # Idle encodings can be shut down, eg. by their auto shutdown
+                if not candidate.ended.done():
+                    pooled = candidate
+                    break
+            self._condition.notify()
+
+        if pooled:
+            warm = pooled.warm
+        else:
+            self.cold_starts += 1
+            warm = self._start_encoding()
+
+        if journal:
+            journal.record_resource("encoding", warm.encoding.id)
+            journal.start_phase(
+                "encode",
+                encoding_id=warm.encoding.id,
+                manifest_urls=self.bitmovin.determine_origin_urls(warm.manifests),
+            )
+            journal.complete_phase("encode")
+
+        self.acquisitions.append(monotonic() - start)
+        return warm
+
+    def close(self) -> None:
+        """Stop the idle encodings of the pool"""
+        with self._condition:
+            self._closed = True
+            idle = self._ready
+            self._ready = []
+            self._condition.notify()
+
+        # The manager submits no more tasks once it has seen the pool closed
+        if self._thread.is_alive():
+            self._thread.join()
+        for pooled in idle:
+            self._executor.submit(self.bitmovin.stop_encoding, pooled.warm.encoding)
+        # Encodings still starting are stopped by their own task
+        self._executor.shutdown(wait=True)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+
+                warm_until = self._last_demand + self.idle_ttl
+                target = self.size if monotonic() < warm_until else 0
+
+                # Encodings that ended on their own are replaced
+                self._ready = [p for p in self._ready if not p.ended.done()]
+
+                surplus = []
+                while len(self._ready) > target:
+                    surplus.append(self._ready.pop(0))
+                missing = target - len(self._ready) - self._starting
+                self._starting += max(0, missing)
+
+                if not surplus and missing <= 0:
+                    self._condition.wait(
+                        timeout=warm_until - monotonic() if target else None
+                    )
+                    continue
+
+            for pooled in surplus:
+                print(f"Stopping idle live encoding {pooled.warm.encoding.id}")
+                self._executor.submit(self.bitmovin.stop_encoding, pooled.warm.encoding)
+            for _ in range(max(0, missing)):
+                self._executor.submit(self._fill)
+
+    def _fill(self) -> None:
+        try:
+            warm = self._start_encoding()
+        except Exception as e:
+            print(f"Starting a live encoding for the pool failed: {e}")
+            with self._condition:
+                self._starting -= 1
+            # Don't retry in a tight loop
+            sleep(10)
+            with self._condition:
+                self._condition.notify()
+            return
+
+        pooled = _PooledEncoding(warm, ended=self.bitmovin.watch_encoding(warm.encoding))
+        with self._condition:
+            self._starting -= 1
+            closed = self._closed
+            if not closed:
+                self._ready.append(pooled)
+            self._condition.notify()
+
+        if closed:
+            self.bitmovin.stop_encoding(warm.encoding)
+
+    def _start_encoding(self) -> WarmEncoding:
+        uid = uuid.uuid4().hex[:12]
+        stream_key = f"{self.stream_key_prefix}{uid}"
+        output_sub_path = f"{self.output_prefix}/{uid}"
+
+        (encoding, live_encoding, manifests) = self.bitmovin.encode_and_package(
+            name=f"Live RTMP - {self.output_prefix} {uid}",
+            output_sub_path=output_sub_path,
+            stream_key=stream_key,
+            rtmp_input=self.rtmp_input,
+        )
+        return WarmEncoding(
+            encoding=encoding,
+            live_encoding=live_encoding,
+            manifests=manifests,
+            stream_key=stream_key,
+            output_sub_path=output_sub_path,
+        )
+
+
+def main():
+    args = parse_arguments()
+
+    import config as cfg
+    from offline import CONFIGURATION_ROUND_TRIPS, OfflineBitmovinController
+
+    bitmovin = OfflineBitmovinController(
+        config=cfg,
+        api_latency=args.offline_api_latency,
+        startup_duration=args.offline_startup_duration,
+    )
+    pool = LiveEncodingPool(bitmovin=bitmovin, size=args.size, idle_ttl=args.idle_ttl)
+    pool.start()
+
+    print(f"Warming up {args.size} live encodings")
+    sleep(args.warm_up)
+
+    for i in range(args.acquisitions):
+        pool.acquire()
+        print(f"Acquisition {i}: {pool.acquisitions[-1]:.2f}s")
+        sleep(args.interval)
+
+    latencies = sorted(pool.acquisitions)
+    print(
+        "{0} acquisitions, {1} cold starts: p50 {2:.2f}s, max {3:.2f}s "
+        "(a cold start takes {4:.2f}s)".format(
+            len(latencies),
+            pool.cold_starts,
+            latencies[len(latencies) // 2],
+            latencies[-1],
+            args.offline_api_latency * (CONFIGURATION_ROUND_TRIPS + 1)
+            + args.offline_startup_duration,
+        )
+    )
+    pool.close()
+
+
+# parse arguments with argparse
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description="Measure the acquisition latency of a warm pool of live "
+        "encodings, against a local stand-in of the Bitmovin API"
+    )
+    parser.add_argument("--size", type=int, default=3, help="number of warm encodings")
+    parser.add_argument("--idle-ttl", type=float, default=1800)
+    parser.add_argument("--acquisitions", type=int, default=10)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="interval in seconds between acquisitions",
+    )
+    parser.add_argument(
+        "--warm-up",
+        type=float,
+        default=5.0,
+        help="time left to the pool to fill up before the first acquisition",
+    )
+    parser.add_argument(
+        "--offline-api-latency",
+        type=float,
+        default=0.1,
+        help="simulated latency of an API call, in seconds",
+    )
+    parser.add_argument(
+        "--offline-startup-duration",
+        type=float,
+        default=3.0,
+        help="simulated time for a live encoding to be ready for ingest",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main()